@@ -13,65 +13,67 @@ start = time.process_time()
 
 
 
-from skimage import io, data, segmentation, filters, color
-from skimage.future import graph
-import scipy.io
-import matplotlib.pyplot as plt
-import tifffile as tiff
-import matplotlib
-from sklearn.metrics import confusion_matrix, cohen_kappa_score, accuracy_score
-import statistics
-from scipy import stats as st
-from tkinter.filedialog import askdirectory
-
-
-
-def euclidean_norm_distance_metric(m_sp_i, m_sp_j):
-  dis = np.sum(np.power(m_sp_i - m_sp_j, 2))
-  return dis
-
-# Calculates the maximum value of A\B and B\A where A and B are hermitian positive semidefinite QP covariance matrices,
-# m_sp_i and m_sp_j are the elments of the covariance matrices with the following order:
-# 0:C11, 1:C12_real, 2:C22, 3:C13_real, 4:C23_real, 5:C33, 6:C12_imag, 7:C13_imag, 8:C23_imag
-
-def max_HLT_distance_metric(m_sp_i, m_sp_j):
-  coh1 = np.zeros((3, 3), dtype=complex)
-  coh2 = np.zeros((3, 3), dtype=complex)
-
-  coh1_r = np.array([[m_sp_i[0], m_sp_i[1], m_sp_i[3]], [m_sp_i[1], m_sp_i[2], m_sp_i[4]], [m_sp_i[3], m_sp_i[4], m_sp_i[5]]])
-  coh1_im =  np.array([[0, m_sp_i[6], m_sp_i[7]], [-m_sp_i[6], 0, m_sp_i[8]], [-m_sp_i[7], -m_sp_i[8], 0]])
-  coh1 = coh1_r + (coh1_im * 1j)
-
-  coh2_r = np.array([[m_sp_j[0], m_sp_j[1], m_sp_j[3]], [m_sp_j[1], m_sp_j[2], m_sp_j[4]], [m_sp_j[3], m_sp_j[4], m_sp_j[5]]])
-  coh2_im =  np.array([[0, m_sp_j[6], m_sp_j[7]], [-m_sp_j[6], 0, m_sp_j[8]], [-m_sp_j[7], -m_sp_j[8], 0]])
-  coh2 = coh2_r + (coh2_im * 1j)
-
-  hlt1 = np.real(np.trace(np.matmul(np.linalg.inv(coh1), coh2)))
-  hlt2 = np.real(np.trace(np.matmul(np.linalg.inv(coh2), coh1)))
-
-  return max(hlt1, hlt2)
+from lgc_classifier.affinity import full_affinity, weighted_neighbour_means
+from lgc_classifier.hlt import inverse_store
+from lgc_classifier.solver import degree_vector, lgc_solve, lgc_miu_sweep
+from lgc_classifier.evaluation import test_sample_labels, cohen_kappa, accuracy
+from lgc_classifier.painting import paint_superpixels
+from lgc_classifier.config import scene_config, override_parameters
+from lgc_classifier.cache import cache_key, load_statistics, save_statistics
+from lgc_classifier.sweep import SuperpixelDistances, parameter_grid, lgc_parameter_sweep
+from lgc_classifier.lowrank import NystromAffinity, compare_to_exact
+from lgc_classifier.pipeline import load_segmentation, load_features, load_samples, build_graph, compute_statistics, \
+  build_affinity, initial_labels, train_label_image, solve_lgc, predict_labels, evaluate, \
+  write_accuracy, land_as, show_images, save_images, show_rag
+from lgc_classifier.instrumentation import StageTimer, Progress
+from lgc_classifier.kernels import set_backend
+# matplotlib, skimage and tifffile are only imported by the stages that use them (see lgc_classifier/pipeline.py), and
+# scikit-learn not at all, so a headless run (e.g., by the batch runner) does not pay for their import.
+
+
+
+# The maximum value of A\B and B\A where A and B are hermitian positive semidefinite QP covariance matrices (the
+# maximum HLT distance) is calculated by lgc_classifier/hlt.py from the elments of the covariance matrices with the
+# following order: 0:C11, 1:C12_real, 2:C22, 3:C13_real, 4:C23_real, 5:C33, 6:C12_imag, 7:C13_imag, 8:C23_imag
+# Each covariance matrix is inverted only once, in the inverse stores store_m and store_w of S_i_m and S_i_w.
 
 
 # The folder that contains the train data: lables.csv. The program assumes the other files are in the current directory,
 # meaning the directory of the current python file LGC_Classifier_V2_fullQP.py
-labels_directory = askdirectory(title='Select Folder That Contains the label file, labels.csv') # shows dialog box and return the path
-labels_directory = labels_directory + "/"
+batch_scene = scene_config() # The scene configuration when the script is run by the batch runner
+# (lgc_classifier/batch.py), with which no dialog box is shown and the results go to its output folder; None otherwise.
+if batch_scene is None:
+  from tkinter.filedialog import askdirectory
+  labels_directory = askdirectory(title='Select Folder That Contains the label file, labels.csv') # shows dialog box and return the path
+  labels_directory = labels_directory + "/"
+  input_directory = '' # the other input files are in the current directory
+  output_directory = labels_directory
+else:
+  labels_directory = batch_scene['labels_dir']
+  input_directory = batch_scene['input_dir']
+  output_directory = batch_scene['output_dir']
+
+timer = StageTimer() # Records the wall time, the CPU time and the peak memory of every stage (see performance.json),
+# from here, so that the time spent in the dialog box is not counted
+timer.stage('load')
 
 
 #OVERSEGMENTATION FILE
-matfile = scipy.io.loadmat('irgs_to_slic.mat')# This mat file contains the oversegemntation image that is obtained through
+myImage = load_segmentation(input_directory)# The mat file irgs_to_slic.mat contains the oversegemntation image that is obtained through
 # CP-IRGS. After segmenting the image with a certain number of classes (e.g., 50 classes), we need to label each region
 # with an exclusive label. This is done by the Matlab script that I wrote named Labeling_each_segments_in_segmentation_differently.m
 # One important thing is that you need to mask the land areas. Land areas are labeled to a really big number (10^7)
 # in the segmentation image.
-myImage = matfile['irgs_to_slic']
-del matfile
 
 
 
 #PARAMETER SETTING
 complex_qp_only = True  #Whether the used features are only the coherence matrix elements or all the cp derived ones
 is_there_normalization = False  #Whether the features should be normalized
+STREAM_FEATURES = False # Whether the feature file is only read block by block (memory-mapped, or strip by strip or
+# tile by tile) while the superpixel means are calculated, so that the whole feature cube is never in memory (large scenes)
+FEATURE_DTYPE = None # The data type of the features in memory: None keeps that of the feature file (float64 for the CP
+# coherence matrix elements); np.float32 halves the memory of float64 features
 #Parameters: SIGMA_S, SIGMA_L, BETA, K_NN (Please refer to the paper: Sellars et.al., 2019, "Super-pixel
 # Contrcted Graph-based Learning For Hyperspectral Image Classification)
 WEIGHT_SCALAR = 10  # The scalar in the wetghts in the calculation of S_i_w. The greater, the bigger the weights.
@@ -80,6 +82,22 @@ SIGMA_L = 1000 # This should be a fairly large number since the Euclidean distan
 BETA = .9  # the greater the more effect from S_i_m rather than S_i_w
 K_NN = 1500  # the number of nearest neighbor, in case only_k_nearest is True.
 only_k_nearest = False  # The boolean that specifies if we are only considering the k-NN. When False, we will have a full spatial correlation effect.
+W_MEMMAP_FILE = None # With a full spatial correlation effect, the file (e.g., labels_directory + 'W.dat') in which W is
+# kept out of core (memory-mapped) instead of in memory. None keeps W in memory. Use SOLVER 'cg' or 'propagation' with it.
+MEMORY_BUDGET_MB = 2048 # The memory (in MB) that building and streaming an out-of-core W may use (per worker)
+NUM_WORKERS = 1 # The number of processes that build W with a full spatial correlation effect (1: no extra processes)
+KERNEL_BACKEND = 'numpy' # The kernels of S_i_w and W: 'numpy', 'numba' (JIT-compiled fused loops on all the cores;
+# needs numba) or 'auto' (numba if it is installed)
+LOW_RANK_ANCHORS = None # With a full spatial correlation effect, the number of anchor superpixels of a low-rank
+# (Nystrom) approximation of W: only the affinities to the anchors are calculated (O(N * LOW_RANK_ANCHORS) instead of
+# O(N^2)) and F is obtained from them in O(N * LOW_RANK_ANCHORS^2), e.g., 1000 for 50k+ superpixels. None: the exact W
+LOW_RANK_SAMPLING = 'kmeans' # How the anchors are chosen: 'kmeans' (the superpixels closest to the k-means centres of
+# S_i_m and S_i_p) or 'random'. See lgc_classifier/lowrank.py.
+LOW_RANK_CHECK_SIZE = 5000 # With LOW_RANK_ANCHORS, the exact F is also calculated for scenes of at most this many
+# superpixels and compared with the approximate one (0: never)
+CACHE_DIRECTORY = None # The folder of a cache of the superpixel statistics (S_i_m, S_i_p, S_i_w and the adjacency), with
+# which a rerun of a scene with other BETA, SIGMA_S, SIGMA_L, MIU, ... skips the pass over the images (None: no cache)
+CACHE_SIZE_MB = 4096 # The size (in MB) above which the least recently used entries of the cache are removed
 NUM_CLASSES = 4 # 1: OW/NI, 2: YI, 3: FYI, and 4: MYI (The user should put the number of classes.)
 sea_ice_classification = False # This indicates the task is whether sea-ice classification (for which labels are
 # collected by MAGIC) or a general classification for which the labels are collected by my code:
@@ -90,335 +108,260 @@ sea_ice_classification = False # This indicates the task is whether sea-ice clas
 # However, the labels are from 1 to num_classes in the csv file generated by the upper-mentioned python script, with
 # num_classes being the number of classes
 MIU = .1 # weighting in the LGC classifier
+PROFILE = False # Whether the run is profiled with cProfile (written to performance.prof, next to performance.json)
+TRACE_MEMORY = False # Whether the memory allocations are traced with tracemalloc, for the peak of every stage (slower)
+SHOW_RAG = False # Whether skimage's region adjacency graph of the segmentation is built and shown (only for display)
+SHOW_PLOTS = True # Whether the segmentation, train and predicted images are shown in a window
+SAVE_PLOTS = True # Whether the images of the results are saved as PNG files
+SOLVER = 'cg' # How F is calculated: 'cg' (conjugate gradient), 'propagation' (iterative label propagation) or 'direct'
+# (LU factorization). See lgc_classifier/solver.py.
+SOLVER_TOL = 1e-10 # The relative residual (cg) or change of F (propagation) at which the iterations stop
+SOLVER_MAX_ITER = 1000 # The maximum number of iterations of the cg and propagation solvers
+MIU_SWEEP = [] # Other MIU values (e.g., [.01, .1, 1, 10]) for which kappa and accuracy are also reported. They all reuse
+# one eigendecomposition of S instead of solving for F again.
+SWEEP_NUM_EIGS = None # The number of largest eigenvalues of S used in the MIU sweep (None: all, which is exact)
+PARAMETER_SWEEP = None # A grid of parameter values (e.g., {'BETA': [.5, .9], 'SIGMA_S': [.1, 1], 'MIU': [.1, 1]}) for
+# every combination of which kappa and accuracy are reported and written to parameter_sweep.csv; the parameters that
+# are not in it keep the values above. The distances between the superpixels are calculated once and W is rebuilt from
+# them for every combination (see lgc_classifier/sweep.py). With a full spatial correlation effect they take three
+# times the memory of W.
 Cluste_based_testing = True # In case, the user wants their sample units to be squares around test pixels. Each test
 # sample unit will be a square of "3 by 3" sqauare where the center pixel is each of the collected test pixels in the csv
 # file. Therefore, choose True if you are sure all the pixels around each of the collected test pixels have the same
 # labels as that of the collected test pixel.
+if batch_scene is not None: # the parameters of the configuration file replace those above
+  override_parameters(globals(), batch_scene['parameters'])
+timer.enable_profiling(PROFILE, TRACE_MEMORY)
+set_backend(KERNEL_BACKEND)
+
 
 
 #CONSTRUCTING A RAG
-img = myImage
+timer.stage('RAG')
 labels = myImage# An alternative way of obtaining the file labels: labels = segmentation.slic(img)
-edge_map = filters.sobel(color.rgb2gray(img))# check
-rag = graph.rag_boundary(labels, edge_map)
+# The region adjacency of the superpixels is obtained below (after the masking) directly from the segmentation, as a
+# sparse adjacency matrix (see lgc_classifier/adjacency.py). skimage's RAG is only built when it is to be shown.
+if SHOW_RAG:
+  show_rag(labels)
+
+
+
+#CACHE OF THE SUPERPIXEL STATISTICS
+# The statistics calculated below only depend on the segmentation, the feature file and the parameters in the key, so
+# with CACHE_DIRECTORY they are loaded when the scene was already processed (see lgc_classifier/cache.py). The key has
+# every parameter that changes them: STREAM_FEATURES too, since the streamed features keep the data type of the file
+# (FEATURE_DTYPE is not applied) and may be summed in other row blocks.
+timer.stage('cache')
+cached = None
+if CACHE_DIRECTORY is not None:
+  feature_file = input_directory + ('C.tif' if complex_qp_only else 'feats.tif')
+  statistics_key = cache_key([input_directory + 'irgs_to_slic.mat', feature_file],
+                             {'complex_qp_only': complex_qp_only, 'is_there_normalization': is_there_normalization,
+                              'WEIGHT_SCALAR': WEIGHT_SCALAR, 'FEATURE_DTYPE': FEATURE_DTYPE,
+                              'STREAM_FEATURES': STREAM_FEATURES})
+  cached = load_statistics(CACHE_DIRECTORY, statistics_key)
+
+if cached is not None:
+  del myImage
+  num_sup_pixels, there_is_land = cached['num_sup_pixels'], cached['there_is_land']
+  adjacency, S_i_m, S_i_p, S_i_w = cached['adjacency'], cached['S_i_m'], cached['S_i_p'], cached['S_i_w']
+  del cached
+
+  store_m = store_w = None  # inverse stores of S_i_m and S_i_w, only used with the HLT distance
+  if complex_qp_only:
+    store_m = inverse_store(S_i_m)
 
-del edge_map
-
-lc = graph.show_rag(labels, rag, img)
-cbar = plt.colorbar(lc)
-io.show()
-
-del img
-
-
-
-#MASKING OUT AREAS NOT TO BE PROCESSED
-# Assuming the feature set has a size equal to img.shape[0] * img.shape[1] * n_feats where n_feats is the number of features
-# that we are using in the classification. So as input, along with the oversegmentation (that contains land areas with label of 10^7),
-# we need to ingest the file that contains the features. Here, this file is called "feats". Btw, do not forget to ingest
-# the labeled data as well.
-
-there_is_land = np.any(myImage == 10000000)
-
-del myImage
-
-if there_is_land:
-  num_sup_pixels = len(rag) - 1 # number of superpixels is len(rag) - 1 (excluding land areas)
 else:
-  num_sup_pixels = len(rag) # number of superpixels
-
-
-
-#FEATURE SETUP
-if complex_qp_only:
-  # mat_feat_file = scipy.io.loadmat('feats.mat')
-  # feats = mat_feat_file['imag']
-  #num_feats = feats.shape[2]
+  #MASKING OUT AREAS NOT TO BE PROCESSED
+  timer.stage('superpixel statistics')
+  # Assuming the feature set has a size equal to img.shape[0] * img.shape[1] * n_feats where n_feats is the number of features
+  # that we are using in the classification. So as input, along with the oversegmentation (that contains land areas with label of 10^7),
+  # we need to ingest the file that contains the features. Here, this file is called "feats". Btw, do not forget to ingest
+  # the labeled data as well.
 
-  cov_elements = tiff.imread('C.tif')
-  feats = cov_elements
-  del cov_elements
-  num_feats = feats.shape[2]
+  # The number of superpixels excludes the land areas (label 10^7). The neighbours of each superpixel (8-connectivity,
+  # as in the RAG) are kept as a sparse adjacency matrix; land areas are not neighbours.
+  num_sup_pixels, there_is_land, adjacency = build_graph(labels)
 
-else: # can be a bunch of QP-derived features named feats.mat
+  del myImage
 
-  # mat_feat_file = scipy.io.loadmat('feats.mat')
-  # feats = mat_feat_file['imag']
-  feats = tiff.imread('feats.tif')
-  num_feats = feats.shape[2]
 
 
+  #FEATURE SETUP AND PREPROCESSING (AND NORMALIZATION)
+  # The coherence matrix elements of C.tif (see above) or the
+  # features of feats.tif. They are preprocessed block by block and in place (unless FEATURE_DTYPE differs from the data
+  # type of the file) or, with STREAM_FEATURES, the file is only opened here and read block by block below.
+  feats = load_features(input_directory + ('C.tif' if complex_qp_only else 'feats.tif'), stokes=False,
+                        normalize=is_there_normalization, dtype=FEATURE_DTYPE, stream=STREAM_FEATURES)
 
-#NORMALIZATION
-if is_there_normalization:
-  for feat in range(0, num_feats):
-    min_f = np.min(feats[:, :, feat])
-    max_f = np.max(feats[:, :, feat])
-    feats[:, :, feat] = (feats[:, :, feat] - min_f) / (max_f - min_f)
 
 
+  #CALCULATE OTHER FEATURES TO SET UP AFFINITY MATRIX, W. THESE FEATURES INCLUDE S_i_p, S_i_m, S_i_w.
+  # Calculate S_i_m and S_i_p each with the size of num_sup_pixels*n_feats. This matrix consists of the mean feature values
+  # and the mean x and y coordinates of all the superpixels.
+  # The labels of superpixels are in range [0, num_sup_pixels); both are obtained in one pass over the segmentation.
+  # store_m is the inverse store of S_i_m, only used with the HLT distance; singular coherence matrices are reported here
+  # rather than in the middle of the W loops.
+  S_i_m, S_i_p, store_m = compute_statistics(labels, num_sup_pixels, feats, complex_qp_only)
+  del feats
 
-#CALCULATE OTHER FEATURES TO SET UP AFFINITY MATRIX, W. THESE FEATURES INCLUDE S_i_p, S_i_m, S_i_w.
-# Calculate S_i_m and S_i_p each with the size of num_sup_pixels*n_feats. This matrix consists of the mean feature values
-# and the mean x and y coordinates of all the superpixels.
-S_i_p = np.zeros((num_sup_pixels, 2), dtype=int)
-S_i_m = np.zeros((num_sup_pixels, num_feats))
-for num_sp in range(0, num_sup_pixels):  # the labels of superpixels are in range [0, num_sup_pixels)
-  idxs = np.where(labels == num_sp)  # gives us a tuple-typed output of rows and columns idxs[0]-->rows
-  S_i_p[num_sp, 0] = np.mean(idxs[0])  # mean of rows
-  S_i_p[num_sp, 1] = np.mean(idxs[1])  # mean of cols
+  timer.stage('S_i_w')
+  # S_i_w is the mean of the S_i_m of the neighbours of each superpixel, weighted by exp(-distance / WEIGHT_SCALAR)
+  S_i_w = weighted_neighbour_means(S_i_m, adjacency, WEIGHT_SCALAR, complex_qp_only, store_m=store_m)
 
-  S_i_m[num_sp, :] = np.mean(feats[idxs], axis=0)  # mean of feats
+  if CACHE_DIRECTORY is not None:
+    save_statistics(CACHE_DIRECTORY, statistics_key, {'num_sup_pixels': num_sup_pixels, 'there_is_land': there_is_land,
+                                                      'adjacency': adjacency, 'S_i_m': S_i_m, 'S_i_p': S_i_p,
+                                                      'S_i_w': S_i_w}, max_bytes=CACHE_SIZE_MB * 2 ** 20)
 
-S_i_w = np.zeros((num_sup_pixels, num_feats))
-for num_sp in rag:
-  num_of_neighbors = len(rag[num_sp])
-  # l_num_sp = list(rag.adj.keys())[num_sp] # the label of current sp
-  if num_sp >= num_sup_pixels: # current sp is representing land areas
-    continue
-  ls_neighbours_idxs = sorted(rag.adj[num_sp].keys()) # the label of neighbours of the current sp
-  if any(neighbor_labels >= num_sup_pixels for neighbor_labels in ls_neighbours_idxs): #one of the neighbors (the last one) is land
-    num_of_neighbors -= 1
 
-  w_i_zj = np.zeros((num_of_neighbors, 1))
-  sum_w = 0
 
-  for num_neighbors in range (0, num_of_neighbors):
-    if complex_qp_only:
-      w_i_zj[num_neighbors, 0] = np.exp(- max_HLT_distance_metric(S_i_m[num_sp, :],
-                                            S_i_m[ls_neighbours_idxs[num_neighbors], :]) / WEIGHT_SCALAR)
-      sum_w += np.exp(- max_HLT_distance_metric(S_i_m[num_sp, :],
-                                                       S_i_m[ls_neighbours_idxs[num_neighbors], :]) / WEIGHT_SCALAR)
-    else:
-      w_i_zj[num_neighbors, 0] = np.exp(- euclidean_norm_distance_metric(S_i_m[num_sp, :],
-                                            S_i_m[ls_neighbours_idxs[num_neighbors], :]) / WEIGHT_SCALAR)
-      sum_w += np.exp(- euclidean_norm_distance_metric(S_i_m[num_sp, :],
-                                                       S_i_m[ls_neighbours_idxs[num_neighbors], :]) / WEIGHT_SCALAR)
-  w_i_zj = w_i_zj / sum_w
-
-  for num_neighbors in range(0, num_of_neighbors):
-    S_i_w[num_sp, :] += w_i_zj[num_neighbors, 0] * S_i_m[ls_neighbours_idxs[num_neighbors], :]
+if complex_qp_only:
+  store_w = inverse_store(S_i_w)
 
 
 
 #CALCULATING W
+timer.stage('W')
+w_progress = Progress('W') # the progress of the W loops (in memory, out of core or in tiles), every 10 s. The k-NN W,
+# like S_i_w, is one vectorized pass over the pairs of neighbours, in time linear in num_sup_pixels, so it has none.
 # W has a size of num_sup_pixels*num_sup_pixels and the element ij, for example, in the matrix represents the weight between the
 # regions (superpixels) that have labels i and j.
-W = np.zeros((num_sup_pixels, num_sup_pixels))
-
-if only_k_nearest:
-  dist = np.zeros((num_sup_pixels, num_sup_pixels))  # This matrix is the eudlidean distance values between superpixels
-  for num_sp_r in range(0, num_sup_pixels):
-    for num_sp_c in range(num_sp_r + 1, num_sup_pixels):
-      dist[num_sp_r, num_sp_c] = euclidean_norm_distance_metric(S_i_p[num_sp_r, :], S_i_p[num_sp_c, :])
-  dist += np.transpose(dist)  # The matrix dist is symmetric. This line is to make the lower triangle the same as the upper one.
-
-  arg_sort_dist = np.argsort(dist, axis=1)
-
-  for num_sp_r in range(0, num_sup_pixels):
-    for sort_num_sp_c in range(1, K_NN + 1):  # the k nearest neighbour. First one is the superpixel itself.
-      num_sp_c = arg_sort_dist[num_sp_r, sort_num_sp_c]
-      if complex_qp_only:
-        s = np.exp(((BETA - 1) * max_HLT_distance_metric(S_i_w[num_sp_r, :], S_i_w[num_sp_c, :]))
-                   - (BETA * max_HLT_distance_metric(S_i_m[num_sp_r, :], S_i_m[num_sp_c, :])) /
-                                                                                             (2 * np.power(SIGMA_S, 2)))
-        l = np.exp(-euclidean_norm_distance_metric(S_i_p[num_sp_r, :], S_i_p[num_sp_c, :]) / (2 * np.power(SIGMA_L, 2)))
-      else:
-        s = np.exp(((BETA - 1) * euclidean_norm_distance_metric(S_i_w[num_sp_r, :], S_i_w[num_sp_c, :]))
-                   - (BETA * euclidean_norm_distance_metric(S_i_m[num_sp_r, :], S_i_m[num_sp_c, :])) /
-                                                                                             (2 * np.power(SIGMA_S, 2)))
-        l = np.exp(-euclidean_norm_distance_metric(S_i_p[num_sp_r, :], S_i_p[num_sp_c, :]) / (2 * np.power(SIGMA_L, 2)))
-      W[num_sp_r, num_sp_c] = s * l
-  del arg_sort_dist
-
-else:  # full spatial correlation effect
-  for num_sp_r in range(0, num_sup_pixels):
-    for num_sp_c in range(num_sp_r + 1, num_sup_pixels):
-      if complex_qp_only:
-        s = np.exp(((BETA - 1) * max_HLT_distance_metric(S_i_w[num_sp_r, :], S_i_w[num_sp_c, :]))
-                   - (BETA * max_HLT_distance_metric(S_i_m[num_sp_r, :], S_i_m[num_sp_c, :])) /
-                                                                                             (2 * np.power(SIGMA_S, 2)))
-        l = np.exp(-euclidean_norm_distance_metric(S_i_p[num_sp_r, :], S_i_p[num_sp_c, :]) / (2 * np.power(SIGMA_L, 2)))
-      else:
-        s = np.exp(((BETA - 1) * euclidean_norm_distance_metric(S_i_w[num_sp_r, :], S_i_w[num_sp_c, :]))
-                   - (BETA * euclidean_norm_distance_metric(S_i_m[num_sp_r, :], S_i_m[num_sp_c, :])) /
-                                                                                             (2 * np.power(SIGMA_S, 2)))
-        l = np.exp(-euclidean_norm_distance_metric(S_i_p[num_sp_r, :], S_i_p[num_sp_c, :]) / (2 * np.power(SIGMA_L, 2)))
-      W[num_sp_r, num_sp_c] = s * l
-  W += np.transpose(W)  # The matrix W is symmetric; this line is to make the lower triangle the same as the upper one.
-
-del S_i_m, S_i_p, S_i_w, rag, w_i_zj
+distances = None
+if PARAMETER_SWEEP is not None:  # the distances of the sweep give the W of these parameters as well
+  distances = SuperpixelDistances(S_i_m, S_i_w, S_i_p, complex_qp_only, K_NN if only_k_nearest else None,
+                                  store_m=store_m, store_w=store_w)
+
+# With LOW_RANK_ANCHORS, W is only kept as its low-rank (Nystrom) factorization; with the distances of the parameter
+# sweep, it is obtained from them; with only_k_nearest, the K_NN nearest superpixels are found with a KD-tree on the
+# centroids S_i_p and W is kept as a sparse (CSR) symmetric matrix (D, S and the solve below stay sparse as well).
+# Otherwise (full spatial correlation effect), all the pairs are evaluated block by block with the closed-form HLT
+# distances (see lgc_classifier/hlt.py), by NUM_WORKERS processes, and with W_MEMMAP_FILE W is built tile by tile in
+# that file and only MEMORY_BUDGET_MB of it is in memory at a time.
+W = build_affinity(S_i_m, S_i_w, S_i_p, BETA, SIGMA_S, SIGMA_L, complex_qp_only, K_NN if only_k_nearest else None,
+                   LOW_RANK_ANCHORS, LOW_RANK_SAMPLING, distances, W_MEMMAP_FILE, MEMORY_BUDGET_MB * 2 ** 20,
+                   NUM_WORKERS, store_m=store_m, store_w=store_w, progress=w_progress)
+
 
 
 
 #CONSTRUCTING THE MATRIX D
+timer.stage('D')
 # Matrix D is the same size as W. The matrix D is a diagonal matrix with the i,i element equal to the sum of i-th row of W
-D = np.zeros((num_sup_pixels, num_sup_pixels))
-w_sum = np.sum(W, axis = 1)
-for num_sp in range (0, num_sup_pixels):
-  D[num_sp, num_sp] = w_sum[num_sp]
+# Only its diagonal is kept, as a vector.
+D = degree_vector(W)
 
 
 
 # INITIAL LABEL MATRIX Y
-# Matrix Y which is the label file: Y has a size of num_sup_pixels*NUM_CLASSES.
-csv_file = np.genfromtxt(labels_directory + 'labels.csv', dtype = 'int', delimiter=',')
-if sea_ice_classification is False:
-  NUM_CLASSES = np.max(csv_file[:, 0])
-
-Y = np.zeros((num_sup_pixels , NUM_CLASSES))
-
-# Here, we assign the same label to the containing superpixel as that of each of the labeled pixels
-y_for_plot = np.zeros(labels.shape) #(NUM_CLASSES + 1) * np.ones(labels.shape)
-
-
-
-if sea_ice_classification:
-  for num_labelled in range (0, csv_file.shape[0]): # It just assigns the label of last pixel to the superpixel.
-    if csv_file[num_labelled, 0] == -1: # The pixel is unlabeled. MAGIC gives -1 when you skip the pixel.
-      continue
-
-    # (6724 / 3008) *  (2985/1875)*
-    sp = labels[int((csv_file[num_labelled, 2] - 1)), int((csv_file[num_labelled, 1] - 1))] # to get the superpixel number that contains the current labeled pixel
-
-    if sp > num_sup_pixels: # land areas
-      continue
-    if csv_file[num_labelled, 0] == 15: #OW
-      Y[sp, 0] = 1
-    elif csv_file[num_labelled, 0] == 1: #NI
-      Y[sp, 0] = 1
-    elif csv_file[num_labelled, 0] == 3: #YI
-      Y[sp, 1] = 1
-    elif csv_file[num_labelled, 0] == 6: #FYI
-      Y[sp, 2] = 1
-    elif csv_file[num_labelled, 0] == 12: #MYI
-      Y[sp, 3] = 1
+timer.stage('Y')
 
-else: # general classification where labels in the csv file starts from 1 to NUM_CLASSES.
-  for num_labelled in range(0, csv_file.shape[0]):
-    #row = int((csv_file[num_labelled, 2] - 1) * labels.shape[0] / 19227)
-    #col = int((csv_file[num_labelled, 1] - 1) * labels.shape[1] / 2710)
-    row = csv_file[num_labelled, 2] - 1
-    col = csv_file[num_labelled, 1] - 1
-    sp = labels[row, col]  # to get the superpixel number that contains the current labeled pixel
+csv_file = load_samples(labels_directory + 'labels.csv')
 
-    if sp > num_sup_pixels:  # mask areas
-      continue
-
-    Y[sp, csv_file[num_labelled, 0] - 1] = 1
-
-for num_sp in range(0, num_sup_pixels):
-  if any(i == 1 for i in Y[num_sp, :]):
-    for cl in range (1, NUM_CLASSES + 1):
-      if (Y[num_sp, cl-1] == 1):
-        y_for_plot[np.where(labels == num_sp)] = cl
+# Matrix Y which is the label file: Y has a size of num_sup_pixels*NUM_CLASSES.
+# Here, we assign the same label to the containing superpixel as that of each of the labeled pixels (land areas are
+# skipped). With sea_ice_classification, the MAGIC labels are mapped to the NUM_CLASSES classes and a superpixel
+# keeps all the classes of its pixels; otherwise NUM_CLASSES is the largest label in the csv file.
+Y = initial_labels(labels, csv_file, num_sup_pixels, NUM_CLASSES if sea_ice_classification else None,
+                   sea_ice_classification, exclusive=False)
+NUM_CLASSES = Y.shape[1]
 
+# The train image: the pixels of each labelled superpixel get its class in Y (the last one if there are several)
+y_for_plot = train_label_image(labels, Y, num_sup_pixels)
 
 
 # CALCULATING F
+timer.stage('solve')
 # The matrix F (soft labels) is sized num_sup_pixels*num_labels.
 
-beta_f = MIU / (MIU + 1)
-alfa_f = 1 - beta_f
+# F = beta_f * (I - alfa_f * S)^-1 * Y with S = D^-1/2 * W * D^-1/2 is obtained without inverting any matrix.
+# For a low-rank W, it is solved through the factorization of W (Woodbury identity).
+F, solver_info = solve_lgc(W, Y, MIU, d=D, method=SOLVER, tol=SOLVER_TOL, max_iter=SOLVER_MAX_ITER)
+if isinstance(W, NystromAffinity) and num_sup_pixels <= LOW_RANK_CHECK_SIZE:  # small enough to compare with the exact W
+  W_exact = full_affinity(S_i_m, S_i_w, S_i_p, BETA, SIGMA_S, SIGMA_L, complex_qp_only, store_m=store_m,
+                          store_w=store_w)
+  F_exact = lgc_solve(W_exact, Y, MIU, method=SOLVER, tol=SOLVER_TOL, max_iter=SOLVER_MAX_ITER)[0]
+  print('Low-rank W ({} anchors): relative difference of F {:.2e}, same class for {:.2%} of the superpixels'.format(
+    W.anchors.size, *compare_to_exact(F, F_exact)))
+  del W_exact, F_exact
+print('LGC solver: {}, {} iterations, relative residual {:.2e}'.format(solver_info['method'],
+                                                                     solver_info['iterations'], solver_info['residual']))
 
-s_f = np.matmul( np.matmul( np.linalg.inv(np.sqrt(D)) , W) , np.linalg.inv(np.sqrt(D)))# matrix S in LGC
-F = beta_f * np.matmul( np.linalg.inv(np.identity(num_sup_pixels) - alfa_f * s_f) , Y )
+del S_i_m, S_i_p, S_i_w, adjacency
 
 
 
 # LABEL PREDICTION
-predicted_labels = np.empty_like(labels)
-predicted_labels[:] =  labels
-F_sorted = np.argsort(F, axis = 1)
-for num_sp in range (0, num_sup_pixels):
-  predicted_labels[np.where(labels == num_sp)] = F_sorted[num_sp, NUM_CLASSES - 1] + 1
+timer.stage('paint')
+predicted_labels = predict_labels(labels, F, num_sup_pixels) # the class of the largest soft label; land keeps its label
 
 
 
 # ACCURACY ASSESSMENT: predicted_labels versus the labels labels_test.csv file
-csv_file_test = np.genfromtxt('labels_test.csv', dtype = 'int', delimiter=',')
-
-true_labels_test = np.zeros(csv_file_test.shape[0])
-pred_labels_test = np.zeros_like(true_labels_test)
-true_label_test_image = np.zeros_like(predicted_labels) #For plotting the test samples
-
-for num_labled_test in range (0, csv_file_test.shape[0]):
-  row_test = csv_file_test[num_labled_test, 2] - 1
-  col_test = csv_file_test[num_labled_test, 1] - 1
-
-  if Cluste_based_testing and row_test > 0 and row_test < predicted_labels.shape[0] - 1  and col_test > 0 and col_test < predicted_labels.shape[1] - 1:
-    labels_in_square = [predicted_labels[row_test - 1, col_test - 1], predicted_labels[row_test - 1, col_test],
-                        predicted_labels[row_test - 1, col_test + 1], predicted_labels[row_test, col_test - 1],
-                        predicted_labels[row_test, col_test], predicted_labels[row_test, col_test + 1],
-                        predicted_labels[row_test + 1, col_test - 1], predicted_labels[row_test + 1, col_test],
-                        predicted_labels[row_test + 1, col_test + 1]]
-    pred_labels_test[num_labled_test] = st.mode(labels_in_square).mode[0] #the mode of the labels in the square
-    true_labels_test[num_labled_test] = csv_file_test[num_labled_test, 0]
-
-    true_label_test_image[row_test - 1, col_test - 1] = csv_file_test[num_labled_test, 0]
-    true_label_test_image[row_test - 1, col_test] = csv_file_test[num_labled_test, 0]
-    true_label_test_image[row_test - 1, col_test + 1] = csv_file_test[num_labled_test, 0]
-    true_label_test_image[row_test, col_test - 1] = csv_file_test[num_labled_test, 0]
-    true_label_test_image[row_test, col_test] = csv_file_test[num_labled_test, 0]
-    true_label_test_image[row_test, col_test + 1] = csv_file_test[num_labled_test, 0]
-    true_label_test_image[row_test + 1, col_test - 1] = csv_file_test[num_labled_test, 0]
-    true_label_test_image[row_test + 1, col_test] = csv_file_test[num_labled_test, 0]
-    true_label_test_image[row_test + 1, col_test + 1] = csv_file_test[num_labled_test, 0]
-
-  else:
-    pred_labels_test[num_labled_test] = predicted_labels[row_test, col_test]
-    true_labels_test[num_labled_test] = csv_file_test[num_labled_test, 0]
-    true_label_test_image[row_test, col_test] = csv_file_test[num_labled_test, 0]
-
-confusion = confusion_matrix(true_labels_test, pred_labels_test)
+timer.stage('evaluate')
+csv_file_test = load_samples(input_directory + 'labels_test.csv')
+
+evaluation = evaluate(predicted_labels, csv_file_test, Cluste_based_testing)
+true_label_test_image = evaluation['test_image']
+
+confusion = evaluation['confusion']
 print('Confusion Matrix\n')
 print(confusion)
-print('\nKappa: {:.2f}\n'.format(cohen_kappa_score(true_labels_test, pred_labels_test)))
-print('\nAccuracy: {:.2f}\n'.format(accuracy_score(true_labels_test, pred_labels_test)))
+print('\nKappa: {:.2f}\n'.format(evaluation['kappa']))
+print('\nAccuracy: {:.2f}\n'.format(evaluation['accuracy']))
+
+# The same assessment for every MIU in MIU_SWEEP, from a single eigendecomposition of S
+sweep_results = []
+if len(MIU_SWEEP) > 0:
+  sweep_sp_labels = lgc_miu_sweep(W, Y, MIU_SWEEP, d=D, num_eigs=SWEEP_NUM_EIGS, return_labels=True)
+  for MIU_s, sp_labels_s in zip(MIU_SWEEP, sweep_sp_labels):
+    predicted_labels_s = paint_superpixels(labels, sp_labels_s, num_sup_pixels)
+    true_labels_s, pred_labels_s, _ = test_sample_labels(predicted_labels_s, csv_file_test, Cluste_based_testing)
+    sweep_results.append((MIU_s, cohen_kappa(true_labels_s, pred_labels_s),
+                          accuracy(true_labels_s, pred_labels_s)))
+    print('MIU {:g}: Kappa {:.2f}, Accuracy {:.2f}'.format(*sweep_results[-1]))
+  del sweep_sp_labels, predicted_labels_s
+
+# The same assessment for every combination of the PARAMETER_SWEEP values, with W rebuilt from the distances
+parameter_sweep_results = []
+if distances is not None:
+  for BETA_s, SIGMA_S_s, SIGMA_L_s, MIU_s, sp_labels_s in lgc_parameter_sweep(
+      distances, Y, *parameter_grid(PARAMETER_SWEEP, BETA, SIGMA_S, SIGMA_L, MIU), method=SOLVER, tol=SOLVER_TOL,
+      max_iter=SOLVER_MAX_ITER, num_eigs=SWEEP_NUM_EIGS):
+    predicted_labels_s = paint_superpixels(labels, sp_labels_s, num_sup_pixels)
+    true_labels_s, pred_labels_s, _ = test_sample_labels(predicted_labels_s, csv_file_test, Cluste_based_testing)
+    parameter_sweep_results.append((BETA_s, SIGMA_S_s, SIGMA_L_s, MIU_s,
+                                    cohen_kappa(true_labels_s, pred_labels_s),
+                                    accuracy(true_labels_s, pred_labels_s)))
+    print('BETA {:g}, SIGMA_S {:g}, SIGMA_L {:g}, MIU {:g}: Kappa {:.2f}, Accuracy {:.2f}'.format(
+      *parameter_sweep_results[-1]))
+  del distances, predicted_labels_s
+
+  np.savetxt(output_directory + 'parameter_sweep.csv', np.array(parameter_sweep_results), fmt='%g', delimiter=',',
+             header='BETA,SIGMA_S,SIGMA_L,MIU,kappa,accuracy', comments='')
+  best = max(parameter_sweep_results, key=lambda result: result[4])
+  print('Best kappa {:.2f} (accuracy {:.2f}) with BETA {:g}, SIGMA_S {:g}, SIGMA_L {:g}, MIU {:g}'.format(
+    best[4], best[5], *best[:4]))
 
 
 
 
 # PLOT RESULTS
-p_l = np.empty_like(predicted_labels)
-p_l[:] =  predicted_labels
-p_l[np.where(predicted_labels==10000000)] = NUM_CLASSES + 1 # forcing the land areas to have label 5.
-
-s_l = np.empty_like(labels)
-s_l[:] =  labels
-s_l[np.where(labels==10000000)] = num_sup_pixels + 1 # forcing the land areas to have a label not too far from other labels.
+timer.stage('plot')
+p_l = land_as(predicted_labels, labels, NUM_CLASSES + 1) # forcing the land areas to have label 5.
+s_l = land_as(labels, labels, num_sup_pixels + 1) # forcing the land areas to have a label not too far from other labels.
 
-
-# from matplotlib.colors import ListedColormap
-# C = [[77/255,191/255,237/255], [0, 0, 1], [0, 1, 0], [1, 0, 0], [250/255, 250/255, 13/255]]
-# cm = ListedColormap(C)
-
-#custom colormap used for train image
-cmap = matplotlib.colors.ListedColormap([(1, 1,1), (12 / 255, 7 / 255, 134 / 255), (155 / 255, 23 / 255, 158 / 255),
-                           (236 / 255, 120 / 255, 83 / 255), (239 / 255, 248 / 255, 33 / 255)], name='colors', N=None)
-
-fig = plt.figure()
-ax1 = fig.add_subplot(131)
-ax2 = fig.add_subplot(132)
-ax3 = fig.add_subplot(133)
-ax1.set_title('Segmentation')
-ax1.imshow(s_l)
-ax2.set_title('Train')
-ax2.imshow(y_for_plot,  cmap=cmap)
-# leg2 = ax2.legend()
-ax3.set_title('Predicted')
-ax3.imshow(p_l, cmap='plasma')
-# leg3 = ax3.legend()
-plt.show()
+# The train and test images use the colormap of the classes ('classes', see lgc_classifier/pipeline.py)
+if SHOW_PLOTS:
+  show_images([('Segmentation', s_l, None), ('Train', y_for_plot, 'classes'), ('Predicted', p_l, 'plasma')])
 
 
 
 #SAVE RESULTS
-matplotlib.image.imsave(labels_directory + 'Segmentation.png', s_l)
-matplotlib.image.imsave(labels_directory + 'Train.png', y_for_plot,  cmap = 'plasma')
-matplotlib.image.imsave(labels_directory + 'Test.png', true_label_test_image,  cmap = cmap)
-matplotlib.image.imsave(labels_directory + 'Predicted.png', p_l, cmap = cmap)
-
+timer.stage('save')
+if SAVE_PLOTS:
+  save_images([('Segmentation', s_l, None), ('Train', y_for_plot, 'plasma'),
+               ('Test', true_label_test_image, 'classes'), ('Predicted', p_l, 'classes')], output_directory)
 
 
 time_elapsed = (time.process_time() - start)
@@ -427,12 +370,9 @@ print("Time elapsed is ", minutes, " minutes and ", seconds, " seconds." )
 
 
 
-f = open(labels_directory + "accuracy.txt", "w")
-f.write("Confusion Matrix\n")
-f.write(np.array2string(confusion, separator=', '))
-f.write("\nKappa: %.2f\n" % (cohen_kappa_score(true_labels_test, pred_labels_test)))
-f.write("\nAccuracy: %.4f\n" % (accuracy_score(true_labels_test, pred_labels_test)))
-f.write("Time elapsed is %.2f  minutes and %.2f seconds." % (minutes, seconds))
-f.close()
+write_accuracy(output_directory + 'accuracy.txt', evaluation, time_elapsed, user_accuracy=False,
+               sweep_results=sweep_results)
+
+# globals().clear()
 
-# globals().clear()
\ No newline at end of file
+timer.report(output_directory + 'performance.json') # the stages, also printed
@@ -13,30 +13,47 @@ import time
 import numpy as np
 start = time.process_time()
 
-from sklearn.svm import SVC
-from sklearn.ensemble import RandomForestClassifier
-from skimage import io, data, segmentation, filters, color
-from skimage.future import graph
+import csv
 import scipy.io
-import matplotlib.pyplot as plt
-import tifffile as tiff
-import matplotlib
-from sklearn.metrics import confusion_matrix, cohen_kappa_score, accuracy_score
-import pandas as pd
-import statistics
-from scipy import stats as st
-from sklearn.model_selection import GridSearchCV
-from tkinter.filedialog import askdirectory
-
-
-labels_directory = askdirectory(title='Select Folder That Contains the label file, labels.csv') # shows dialog box and return the path
-labels_directory = labels_directory + "/"
+from lgc_classifier.superpixels import superpixel_statistics, count_superpixels
+from lgc_classifier.painting import paint_superpixels
+from lgc_classifier.config import scene_config, override_parameters
+from lgc_classifier.pipeline import load_segmentation, load_features, load_samples, superpixel_labels, pixel_labels, \
+  evaluate, write_accuracy, land_as, show_images, save_images, show_rag
+from lgc_classifier.inference import predict_in_chunks
+from lgc_classifier.instrumentation import StageTimer
+# matplotlib, skimage and tifffile are only imported by the stages that use them (see lgc_classifier/pipeline.py), so a
+# headless run (e.g., by the batch runner) does not pay for their import. Only the scikit-learn classifier of the run
+# (RF or SVM) is imported, where it is trained (see TRAIN THE CLASSIFIER).
+
+
+batch_scene = scene_config() # The scene configuration when the script is run by the batch runner
+# (lgc_classifier/batch.py), with which no dialog box is shown and the results go to its output folder; None otherwise.
+if batch_scene is None:
+  from tkinter.filedialog import askdirectory
+  labels_directory = askdirectory(title='Select Folder That Contains the label file, labels.csv') # shows dialog box and return the path
+  labels_directory = labels_directory + "/"
+  input_directory = '' # the other input files are in the current directory
+  output_directory = labels_directory
+else:
+  labels_directory = batch_scene['labels_dir']
+  input_directory = batch_scene['input_dir']
+  output_directory = batch_scene['output_dir']
+
+timer = StageTimer() # Records the wall time, the CPU time and the peak memory of every stage (see performance.json),
+# from here, so that the time spent in the dialog box is not counted
+timer.stage('load')
 
 
 #PARAMETER SETTING
 RF = True# Whether the classifier is RF or, alternatively, SVM (False)
 super_pix_based = True  #Whether the classification is superpixel-based or pixel based
 is_there_normalization = True  #Whether the features should be normalized
+STREAM_FEATURES = False # Whether the feature file is only read block by block (memory-mapped, or strip by strip or
+# tile by tile) while the superpixel means are calculated, so that the whole feature cube is never in memory (large scenes).
+# The pixel-based classification still reads all the (used) channels in memory.
+FEATURE_DTYPE = None # The data type of the features in memory: None keeps that of the feature file (float64 for the CP
+# coherence matrix elements); np.float32 halves the memory of float64 features
 # NUM_CLASSES = 6 # 1: OW/NI, 2: YI, 3: FYI, and 4: MYI (The user should put the number of classes.)
 sea_ice_classification = False # This indicates the task is whether sea-ice classification (for which labels are
 # collected by MAGIC) or a general classification for which the labels are collected by my code:
@@ -52,207 +69,102 @@ complex_only = False # Whether the ingested features are only covariance matrix
 Cluste_based_testing = True # In case, the user wants their sample units to be squares around test pixels. Each test
 # sample unit will be a square of "3 by 3" sqauare where the center pixel is each of the collected test pixels in the csv
 # file.
-
-
-#FEATURE SETUP
-if complex_only:
-  # mat_feat_file = scipy.io.loadmat('feats.mat')
-  # feats = mat_feat_file['imag']
-  #num_feats = feats.shape[2]
-
-  cov_elements = tiff.imread('C.tif')
-  num_elems = cov_elements.shape[2]
-  if num_elems == 9: # QP case
-    NUM_INTESITIES = 3
-  elif  num_elems == 4: # CP case
-    NUM_INTESITIES = 2
-  feats = np.zeros((cov_elements.shape[0], cov_elements.shape[1], NUM_INTESITIES))
-  if num_elems == 9: # QP case
-    feats[:, :, 0] = cov_elements[:, :, 0]
-    feats[:, :, 1] = cov_elements[:, :, 2]
-    feats[:, :, 2] = cov_elements[:, :, 5]
-  elif num_elems == 4: # CP case
-    feats[:, :, 0] = cov_elements[:, :, 0]
-    feats[:, :, 1] = cov_elements[:, :, 2]
-
-  del cov_elements
-  num_feats = feats.shape[2]
-
-else: # can be a bunch of QP- or CP-derived features named feats.mat
-
-  # mat_feat_file = scipy.io.loadmat('feats.mat')
-  # feats = mat_feat_file['imag']
-  feats = tiff.imread('feats.tif')
-  # feats = feats[:,:,[9, 10]]
-  nan_idxs = np.where(np.isnan(feats) == True)
-  feats[nan_idxs] = 0
-  num_feats = feats.shape[2]
-
-
-
-#NORMALIZATION
-if is_there_normalization:
-  for feat in range(0, num_feats):
-    min_f = np.min(feats[:, :, feat])
-    max_f = np.max(feats[:, :, feat])
-    feats[:, :, feat] = (feats[:, :, feat] - min_f) / (max_f - min_f)
-  nan_idxs = np.where(np.isnan(feats) == True)
-  feats[nan_idxs] = 0
+PROFILE = False # Whether the run is profiled with cProfile (written to performance.prof, next to performance.json)
+TRACE_MEMORY = False # Whether the memory allocations are traced with tracemalloc, for the peak of every stage (slower)
+SHOW_RAG = False # Whether skimage's region adjacency graph of the segmentation is built and shown (only for display)
+SHOW_PLOTS = True # Whether the segmentation, train and predicted images are shown in a window
+SAVE_PLOTS = True # Whether the images of the results are saved as PNG files
+NUM_WORKERS = 1 # The number of processes that evaluate the candidates of the hyperparameter search (1: no extra processes)
+PREDICTION_CHUNK_ROWS = 2 ** 18 # With the pixel-based classification, the number of pixels predicted at a time (by
+# one of the NUM_WORKERS processes); it bounds the memory of the prediction, e.g., of the kernel rows of the SVM
+MEMORY_BUDGET_MB = 256 # The memory (in MB) of the kernel rows of the SVM for a block of the predicted samples (per
+# worker); the blocks are at most PREDICTION_CHUNK_ROWS samples
+PREDICTION_MEMMAP_FILE = None # With the pixel-based classification, the file (e.g., output_directory + 'predicted.dat')
+# in which the predicted image is kept (memory-mapped, float64) instead of in memory. None keeps it in memory.
+RF_TUNING = 'grid' # How n_estimators and max_depth of the RF are searched: 'grid' fits a forest for every pair, 'growth'
+# grows one forest per max_depth and scores it at every n_estimators, and 'halving' does so while only the better half
+# of the max_depth candidates keeps growing at 50, 100, 200, ... trees (see lgc_classifier/tuning.py)
+RF_OOB_SCORING = False # With 'growth' and 'halving', whether the forests are grown on all the train data and scored by
+# their out-of-bag predictions instead of on the half of the train data not used to grow them
+if batch_scene is not None: # the parameters of the configuration file replace those above
+  override_parameters(globals(), batch_scene['parameters'])
+timer.enable_profiling(PROFILE, TRACE_MEMORY)
+
+
+#FEATURE SETUP AND PREPROCESSING (AND NORMALIZATION)
+# With complex_only, only the channel intensities (diagonal elements) of C.tif (CP or QP) are used; otherwise the
+# features of feats.tif (can be a bunch of QP- or CP-derived features). They are preprocessed block by block and in
+# place (unless FEATURE_DTYPE differs from the data type of the features) and the NaN values (also those of constant
+# channels after the normalization) are replaced by zero. With STREAM_FEATURES, the file is only opened here and read
+# block by block in superpixel_statistics.
+feats = load_features(input_directory + ('C.tif' if complex_only else 'feats.tif'), intensities=complex_only,
+                      replace_nans=True, normalize=is_there_normalization, dtype=FEATURE_DTYPE, stream=STREAM_FEATURES)
+num_feats = feats.shape[2]
+
+if STREAM_FEATURES and not super_pix_based: # the pixel-based classification needs all the pixels in memory
+  feats = feats.toarray()
 
 
 
 if super_pix_based: #If the classification is to predict labels for the superpixels delineated by the segmentation image
   # OVERSEGMENTATION FILE
-  matfile = scipy.io.loadmat(
-    'irgs_to_slic.mat')  # This mat file contains the oversegemntation image that is obtained through
+  # The mat file irgs_to_slic.mat contains the oversegemntation image that is obtained through
   # CP-IRGS. After segmenting the image with a certain number of classes (e.g., 50 classes), we need to label each region
   # with an exclusive label. This is done by the Matlab script that I wrote named Labeling_each_segments_in_segmentation_differently.m
   # One important thing is that you need to mask the land areas. Land areas are labeled to a really big number (10^7)
   # in the segmentation image.
-  myImage = matfile['irgs_to_slic']
-  del matfile
+  myImage = load_segmentation(input_directory)
 
-  # CONSTRUCTING A RAG
-  img = myImage
   labels = myImage  # An alternative way of obtaining the file labels: labels = segmentation.slic(img)
-  edge_map = filters.sobel(color.rgb2gray(img))  # check
-  rag = graph.rag_boundary(labels, edge_map)
 
-  del edge_map
-
-  lc = graph.show_rag(labels, rag, img)
-  cbar = plt.colorbar(lc)
-  io.show()
-
-  del img
+  # CONSTRUCTING A RAG (only for display; the classification only needs the number of superpixels)
+  timer.stage('RAG')
+  if SHOW_RAG:
+    show_rag(labels)
 
   # MASKING OUT AREAS NOT TO BE PROCESSED
-  there_is_land = np.any(myImage == 10000000)
+  timer.stage('superpixel statistics')
+  # The number of superpixels excludes the land areas (label 10^7)
+  num_sup_pixels, there_is_land = count_superpixels(myImage)
 
   del myImage
 
-  if there_is_land:
-    num_sup_pixels = len(rag) - 1  # number of superpixels is len(rag) - 1 (excluding land areas)
-  else:
-    num_sup_pixels = len(rag)  # number of superpixels
-
   # Calculate sp_feats with the size of num_sup_pixels*n_feats. This matrix consists of the mean feature values
-  sp_feats = np.zeros((num_sup_pixels, num_feats))
-  for num_sp in range(0, num_sup_pixels):  # the labels of superpixels are in range [0, num_sup_pixels)
-    idxs = np.where(labels == num_sp)  # gives us a tuple-typed output of rows and columns idxs[0]-->rows
-    sp_feats[num_sp, :] = np.mean(feats[idxs], axis=0)  # mean of feats
+  # The labels of superpixels are in range [0, num_sup_pixels); the means are obtained in one pass over the segmentation.
+  sp_counts, sp_centroids, sp_feats = superpixel_statistics(labels, num_sup_pixels, feats)
+  del sp_counts, sp_centroids
 
 
 
 #CONSTRUCTING TRAIN AND LABEL DATA
+timer.stage('train data')
+csv_file = load_samples(labels_directory + 'labels.csv')
+# With sea_ice_classification, the MAGIC labels are mapped to 1: OW/NI, 2: YI, 3: FYI and 4: MYI and the unlabeled
+# pixels (-1: MAGIC gives -1 when you skip the pixel) are skipped; otherwise the labels in the csv file are from 1 to
+# NUM_CLASSES.
 if super_pix_based:
+  # Each superpixel gets the label of the last labeled pixel in it (land areas are skipped)
+  sp_labels = superpixel_labels(labels, csv_file, num_sup_pixels, sea_ice_classification)
 
-  sp_labels = np.zeros(num_sup_pixels)
-
-  csv_file = np.genfromtxt(labels_directory + 'labels.csv', dtype='int', delimiter=',')
-
-  if sea_ice_classification:
-    for num_labelled in range(0, csv_file.shape[0]):  # It just assigns the label of last pixel to the superpixel.
-      if csv_file[num_labelled, 0] == -1:  # The pixel is unlabeled. MAGIC gives -1 when you skip the pixel.
-        continue
-
-      # (6724 / 3008) *  (2985/1875)*
-      sp = labels[int((csv_file[num_labelled, 2] - 1)), int(
-        (csv_file[num_labelled, 1] - 1))]  # to get the superpixel number that contains the current labeled pixel
-
-      if sp > num_sup_pixels:  # land areas
-        continue
-      if csv_file[num_labelled, 0] == 15:  # OW
-        sp_labels[sp] = 1
-      elif csv_file[num_labelled, 0] == 1:  # NI
-        sp_labels[sp] = 1
-      elif csv_file[num_labelled, 0] == 3:  # YI
-        sp_labels[sp] = 2
-      elif csv_file[num_labelled, 0] == 6:  # FYI
-        sp_labels[sp] = 3
-      elif csv_file[num_labelled, 0] == 12:  # MYI
-        sp_labels[sp] = 4
-
-  else:  # general classification where labels in the csv file starts from 1 to NUM_CLASSES.
-    for num_labelled in range(0, csv_file.shape[0]):
-      # row = int((csv_file[num_labelled, 2] - 1) * labels.shape[0] / 19227)
-      # col = int((csv_file[num_labelled, 1] - 1) * labels.shape[1] / 2710)
-      row = csv_file[num_labelled, 2] - 1
-      col = csv_file[num_labelled, 1] - 1
-      sp = labels[row, col]  # to get the superpixel number that contains the current labeled pixel
-
-      if sp > num_sup_pixels:  # mask areas
-        continue
-
-      sp_labels[sp] = csv_file[num_labelled, 0]
-
-  train_sp_samples = np.where(sp_labels != 0)
-  num_tr_samples = train_sp_samples[0].shape[0]
-
-  tr_data = np.zeros((num_tr_samples, num_feats))
-  tr_labels = np.zeros(num_tr_samples)
-
-  for labeled_sp in range (0, train_sp_samples[0].shape[0]):
-    tr_data[labeled_sp, :] = sp_feats[train_sp_samples[0][labeled_sp],:]
-    tr_labels[labeled_sp] = sp_labels[train_sp_samples[0][labeled_sp]]
+  tr_data = sp_feats[sp_labels != 0].astype(float)
+  tr_labels = sp_labels[sp_labels != 0]
 
 
 else: # pixel-based. Just reshape the feats and construct the train samples and their labels
 
-  feat_labels = np.zeros((feats.shape[0], feats.shape[1])) # the labels that will be assigned in the following loop
-
-  csv_file = np.genfromtxt(labels_directory + 'labels.csv', dtype='int', delimiter=',')
-  num_tr_samples = csv_file.shape[0]
-
-  if sea_ice_classification:
-    for num_labelled in range(0, csv_file.shape[0]):  # It just assigns the label of last pixel to the superpixel.
-      if csv_file[num_labelled, 0] == -1:  # The pixel is unlabeled. MAGIC gives -1 when you skip the pixel.
-        num_tr_samples = num_tr_samples - 1
-        continue
-
-      # (6724 / 3008) *  (2985/1875)*
-      row = int((csv_file[num_labelled, 2] - 1))
-      col = int((csv_file[num_labelled, 1] - 1))
-
-
-      if csv_file[num_labelled, 0] == 15:  # OW
-        feat_labels[row, col] = 1
-      elif csv_file[num_labelled, 0] == 1:  # NI
-        feat_labels[row, col] = 1
-      elif csv_file[num_labelled, 0] == 3:  # YI
-        feat_labels[row, col] = 2
-      elif csv_file[num_labelled, 0] == 6:  # FYI
-        feat_labels[row, col] = 3
-      elif csv_file[num_labelled, 0] == 12:  # MYI
-        feat_labels[row, col] = 4
-
-  else:  # general classification where labels in the csv file starts from 1 to NUM_CLASSES.
-    for num_labelled in range(0, csv_file.shape[0]):
-      # row = int((csv_file[num_labelled, 2] - 1) * labels.shape[0] / 19227)
-      # col = int((csv_file[num_labelled, 1] - 1) * labels.shape[1] / 2710)
-      row = csv_file[num_labelled, 2] - 1
-      col = csv_file[num_labelled, 1] - 1
-
-      feat_labels[row, col] = csv_file[num_labelled, 0]
-
+  feat_labels = pixel_labels((feats.shape[0], feats.shape[1]), csv_file, sea_ice_classification)
 
   re_feat = np.reshape(feats, (feats.shape[0]*feats.shape[1], num_feats)) # reshaped features
   re_feat_labels = np.reshape(feat_labels, (feats.shape[0]*feats.shape[1])) # the labels reshaped
 
-  train_data_samples = np.where(re_feat_labels != 0)
-  num_tr_samples = train_data_samples[0].shape[0]
-
-  tr_data = np.zeros((num_tr_samples, num_feats))
-  tr_labels = np.zeros(num_tr_samples)
-
-  for labeled_sp in range (0, train_data_samples[0].shape[0]):
-    tr_data[labeled_sp, :] = re_feat[train_data_samples[0][labeled_sp],:]
-    tr_labels[labeled_sp] = re_feat_labels[train_data_samples[0][labeled_sp]]
+  tr_data = re_feat[re_feat_labels != 0].astype(float)
+  tr_labels = re_feat_labels[re_feat_labels != 0]
 
 
 
 
 #TRAIN THE CLASSIFIER
+timer.stage('tuning')
 
 
 
@@ -308,8 +220,13 @@ else: # pixel-based. Just reshape the feats and construct the train samples and
 # Hyperparameter tuning method 2:
 # using a grid a parameters based on half of training data as train and the rest for
 # testing. The metric is the kappa coefficient
+# The candidates are evaluated by NUM_WORKERS processes (see lgc_classifier/tuning.py); of equally good candidates the
+# later one in the order of the loops below is selected, as before.
 
 if RF:
+  from sklearn.ensemble import RandomForestClassifier
+  from lgc_classifier.tuning import holdout_search, forest_growth_search
+
   # Number of trees in random forest
   n_estimators = [int(x) for x in np.linspace(start=50, stop=2000, num=39)]
 
@@ -318,40 +235,43 @@ if RF:
   max_depth.append(None)
 
   # Create the random grid
-  highest_kappa = -1
   param_grid = {'n_estimators': n_estimators, 'max_depth': max_depth}
-  for num_est in param_grid['n_estimators']:
-    for max_d in param_grid['max_depth']:
-      cur_model = RandomForestClassifier(n_estimators = num_est, max_depth = max_d)
-      cur_model.fit(tr_data[::2,:], tr_labels[::2]) # training with half of train data
-      pred_labels_rest = cur_model.predict(tr_data[1::2,:]) # predicting the labels of the rest of train data
-      cur_kappa = cohen_kappa_score(tr_labels[1::2], pred_labels_rest)
-      if cur_kappa >= highest_kappa:
-        highest_kappa = cur_kappa
-        best_num_est = num_est
-        best_max_d = max_d
-
-  grid= RandomForestClassifier(n_estimators = best_num_est, max_depth = best_max_d)
+  if RF_TUNING == 'grid':
+    candidates = [{'n_estimators': num_est, 'max_depth': max_d}
+                  for num_est in param_grid['n_estimators'] for max_d in param_grid['max_depth']]
+    best_params, search_results = holdout_search(RandomForestClassifier, candidates, tr_data, tr_labels, NUM_WORKERS)
+  elif RF_TUNING in ('growth', 'halving'): # the forests contain those with fewer trees, so they are grown, not refitted
+    best_params, search_results = forest_growth_search(tr_data, tr_labels, n_estimators, max_depth,
+                                                       halving=RF_TUNING == 'halving', oob=RF_OOB_SCORING,
+                                                       num_workers=NUM_WORKERS)
+  else:
+    raise ValueError("Unknown RF_TUNING '%s' (use 'grid', 'growth' or 'halving')" % RF_TUNING)
+
+  grid= RandomForestClassifier(**best_params)
 
 else: # SVM
+  from lgc_classifier.tuning import kernel_svm_search, PrecomputedRBFSVC # SVC is only imported by these
+
   param_grid = {'C': [np.power(2,x) for x in np.linspace(start=-6, stop=14, num=21)],
                 'gamma': [np.power(2,x) for x in np.linspace(start=-9, stop=11, num=21)]}
 
   # Create the random grid
-  highest_kappa = -1
-  for para_c in param_grid['C']:
-    for para_gamma in param_grid['gamma']:
-      cur_model = SVC(gamma = para_gamma, C = para_c)
-      cur_model.fit(tr_data[::2, :], tr_labels[::2])  # training with half of train data
-      pred_labels_rest = cur_model.predict(tr_data[1::2, :])  # predicting the labels of the rest of train data
-      cur_kappa = cohen_kappa_score(tr_labels[1::2], pred_labels_rest)
-      if cur_kappa >= highest_kappa:
-        highest_kappa = cur_kappa
-        best_para_c = para_c
-        best_para_gamma = para_gamma
-
-  grid = SVC(gamma=best_para_gamma, C=best_para_c)
-
+  # The RBF kernel matrices are calculated once per gamma (from distances calculated once) and shared by all C values
+  best_params, search_results = kernel_svm_search(tr_data, tr_labels, param_grid['C'], param_grid['gamma'], NUM_WORKERS)
+
+  # as SVC(C=C, gamma=gamma), with the same precomputed kernels
+  grid = PrecomputedRBFSVC(**best_params, memory_budget=MEMORY_BUDGET_MB * 2 ** 20, max_block_rows=PREDICTION_CHUNK_ROWS)
+
+# The kappa coefficient and the fit and predict times (s) of every candidate
+with open(output_directory + 'hyperparameter_search.csv', 'w', newline='') as f:
+  search_writer = csv.DictWriter(f, fieldnames=list(search_results[0]), lineterminator='\n')
+  search_writer.writeheader()
+  search_writer.writerows(search_results)
+print('Selected parameters: {} (kappa {:.2f} on the half of the train data)'.format( # C and gamma as plain floats
+  {name: float(value) if isinstance(value, np.floating) else value for name, value in best_params.items()},
+  max(result['kappa'] for result in search_results)))
+
+timer.stage('fit')
 grid.fit(tr_data, tr_labels)
 
 
@@ -372,132 +292,77 @@ grid.fit(tr_data, tr_labels)
 
 
 #LABEL PREDICTION
+timer.stage('predict')
 predicted_labels = np.zeros((feats.shape[0], feats.shape[1]))
 if super_pix_based:
   sp_pred = grid.predict(sp_feats) # Predicted labels for the superpixels
-  for num_sp in range(0, num_sup_pixels):
-    predicted_labels[np.where(labels == num_sp)] = sp_pred[num_sp]
+  predicted_labels = paint_superpixels(labels, sp_pred, num_sup_pixels, fill=0, dtype=float)
 
 
   # PLOT RESULTS
-  tr_for_plot = np.zeros((feats.shape[0], feats.shape[1]))
-  for num_sp in range(0, num_sup_pixels):
-    tr_for_plot[np.where(labels == num_sp)] = sp_labels[num_sp]
-
-  p_l = np.empty_like(predicted_labels)
-  p_l[:] = predicted_labels
-  p_l[np.where(labels == 10000000)] = np.amax(predicted_labels) + 1  # forcing the land areas to have label=num_class+1.
-
-  s_l = np.empty_like(labels)
-  s_l[:] = labels
-  s_l[np.where(labels == 10000000)] = num_sup_pixels + 1  # forcing the land areas to have a label num_sup_pixels+1.
-
-  # custom colormap used for train image
-  cmap = matplotlib.colors.ListedColormap([(1, 1, 1), (12 / 255, 7 / 255, 134 / 255), (155 / 255, 23 / 255, 158 / 255),
-                                           (236 / 255, 120 / 255, 83 / 255), (239 / 255, 248 / 255, 33 / 255)],
-                                          name='colors', N=None)
-  fig = plt.figure()
-  ax1 = fig.add_subplot(131)
-  ax2 = fig.add_subplot(132)
-  ax3 = fig.add_subplot(133)
-  ax1.set_title('Segmentation')
-  ax1.imshow(s_l)
-  ax2.set_title('Train')
-  ax2.imshow(tr_for_plot, cmap=cmap)
-  # leg2 = ax2.legend()
-  ax3.set_title('Predicted')
-  ax3.imshow(p_l, cmap='plasma')
-  # leg3 = ax3.legend()
-  plt.show()
+  timer.stage('plot')
+  tr_for_plot = paint_superpixels(labels, sp_labels, num_sup_pixels, fill=0, dtype=float)
+
+  p_l = land_as(predicted_labels, labels, np.amax(predicted_labels) + 1)  # forcing the land areas to have num_class+1.
+  s_l = land_as(labels, labels, num_sup_pixels + 1)  # forcing the land areas to have a label num_sup_pixels+1.
+
+  # The train image uses the colormap of the classes ('classes', see lgc_classifier/pipeline.py)
+  if SHOW_PLOTS:
+    show_images([('Segmentation', s_l, None), ('Train', tr_for_plot, 'classes'), ('Predicted', p_l, 'plasma')])
 
 
 else: # pixel-based
-  predicted_labels =  np.reshape(grid.predict(re_feat), (feats.shape[0], feats.shape[1])) # Predicted labels for the pxls
+  # Predicted labels for the pxls, PREDICTION_CHUNK_ROWS pixels at a time, written directly into the predicted image
+  if PREDICTION_MEMMAP_FILE is not None:
+    del predicted_labels
+    predicted_labels = np.memmap(PREDICTION_MEMMAP_FILE, dtype=np.float64, mode='w+',
+                                 shape=(feats.shape[0], feats.shape[1]))
+  predicted_labels, pixels_per_second = predict_in_chunks(grid, re_feat, PREDICTION_CHUNK_ROWS, NUM_WORKERS,
+                                                          out=predicted_labels)
+  print('Prediction: {:.0f} pixels per second'.format(pixels_per_second))
 
   # PLOT RESULTS
-  tr_for_plot = np.zeros((feats.shape[0], feats.shape[1]))
+  timer.stage('plot')
   tr_for_plot = feat_labels
 
-  p_l = np.empty_like(predicted_labels)
-  p_l[:] = predicted_labels
+  p_l = predicted_labels # not copied: a memory-mapped prediction is only read by the plots that are made
 
-  # custom colormap used for train image
-  cmap = matplotlib.colors.ListedColormap([(1, 1, 1), (12 / 255, 7 / 255, 134 / 255), (155 / 255, 23 / 255, 158 / 255),
-                                           (236 / 255, 120 / 255, 83 / 255), (239 / 255, 248 / 255, 33 / 255)],
-                                          name='colors', N=None)
-  fig = plt.figure()
-  ax1 = fig.add_subplot(121)
-  ax2 = fig.add_subplot(122)
-
-  ax1.set_title('Train')
-  ax1.imshow(tr_for_plot, cmap=cmap)
-  # leg2 = ax2.legend()
-  ax2.set_title('Predicted')
-  ax2.imshow(p_l, cmap='plasma')
-  # leg3 = ax3.legend()
-  plt.show()
+  # The train image uses the colormap of the classes ('classes', see lgc_classifier/pipeline.py)
+  if SHOW_PLOTS:
+    show_images([('Train', tr_for_plot, 'classes'), ('Predicted', p_l, 'plasma')])
 
 
 # ACCURACY ASSESSMENT: predicted_labels versus the labels labels_test.csv file
-csv_file_test = np.genfromtxt('labels_test.csv', dtype = 'int', delimiter=',')
-
-true_labels_test = np.zeros(csv_file_test.shape[0])
-pred_labels_test = np.zeros_like(true_labels_test)
-true_label_test_image = np.zeros_like(predicted_labels) #For plotting the test samples
-
-for num_labled_test in range (0, csv_file_test.shape[0]):
-  row_test = csv_file_test[num_labled_test, 2] - 1
-  col_test = csv_file_test[num_labled_test, 1] - 1
-  if Cluste_based_testing and row_test > 0 and row_test < predicted_labels.shape[0] - 1  and col_test > 0 and col_test < predicted_labels.shape[1] - 1:
-    labels_in_square = [predicted_labels[row_test - 1, col_test - 1], predicted_labels[row_test - 1, col_test],
-                        predicted_labels[row_test - 1, col_test + 1], predicted_labels[row_test, col_test - 1],
-                        predicted_labels[row_test, col_test], predicted_labels[row_test, col_test + 1],
-                        predicted_labels[row_test + 1, col_test - 1], predicted_labels[row_test + 1, col_test],
-                        predicted_labels[row_test + 1, col_test + 1]]
-
-    pred_labels_test[num_labled_test] = st.mode(labels_in_square).mode[0] #the mode of the labels in the square
-    true_labels_test[num_labled_test] = csv_file_test[num_labled_test, 0]
-
-    true_label_test_image[row_test - 1, col_test - 1] = csv_file_test[num_labled_test, 0]
-    true_label_test_image[row_test - 1, col_test] = csv_file_test[num_labled_test, 0]
-    true_label_test_image[row_test - 1, col_test + 1] = csv_file_test[num_labled_test, 0]
-    true_label_test_image[row_test, col_test - 1] = csv_file_test[num_labled_test, 0]
-    true_label_test_image[row_test, col_test] = csv_file_test[num_labled_test, 0]
-    true_label_test_image[row_test, col_test + 1] = csv_file_test[num_labled_test, 0]
-    true_label_test_image[row_test + 1, col_test - 1] = csv_file_test[num_labled_test, 0]
-    true_label_test_image[row_test + 1, col_test] = csv_file_test[num_labled_test, 0]
-    true_label_test_image[row_test + 1, col_test + 1] = csv_file_test[num_labled_test, 0]
+timer.stage('evaluate')
+csv_file_test = load_samples(input_directory + 'labels_test.csv')
 
+# The predicted labels are only read at the test samples; the image of the test samples is only made to be saved
+evaluation = evaluate(predicted_labels, csv_file_test, Cluste_based_testing, test_image=SAVE_PLOTS)
+true_label_test_image = evaluation['test_image']
 
-
-
-  else:
-    pred_labels_test[num_labled_test] = predicted_labels[row_test, col_test]
-    true_labels_test[num_labled_test] = csv_file_test[num_labled_test, 0]
-    true_label_test_image[row_test, col_test] = csv_file_test[num_labled_test, 0]
-
-confusion = confusion_matrix(true_labels_test, pred_labels_test)
+confusion = evaluation['confusion']
 print('Confusion Matrix\n')
 print(confusion)
-print('\nKappa: {:.2f}\n'.format(cohen_kappa_score(true_labels_test, pred_labels_test)))
-print('\nAccuracy: {:.2f}\n'.format(accuracy_score(true_labels_test, pred_labels_test)))
+print('\nKappa: {:.2f}\n'.format(evaluation['kappa']))
+print('\nAccuracy: {:.2f}\n'.format(evaluation['accuracy']))
 
 
 
 #SAVE RESULTS
+timer.stage('save')
 
-if super_pix_based:
-  matplotlib.image.imsave(labels_directory + 'Segmentation.png', s_l)
-matplotlib.image.imsave(labels_directory + 'Train.png', tr_for_plot,  cmap = 'plasma')
-matplotlib.image.imsave(labels_directory + 'Test.png', true_label_test_image,  cmap = 'plasma')
-matplotlib.image.imsave(labels_directory + 'Predicted.png', p_l, cmap = 'plasma')
+if SAVE_PLOTS:
+  images = [('Train', tr_for_plot, 'plasma'), ('Test', true_label_test_image, 'plasma'), ('Predicted', p_l, 'plasma')]
+  if super_pix_based:
+    images.insert(0, ('Segmentation', s_l, None))
+  save_images(images, output_directory)
 
 train_matfile = {'train_image':tr_for_plot}
-scipy.io.savemat(labels_directory + 'train_matfile.mat', train_matfile)
+scipy.io.savemat(output_directory + 'train_matfile.mat', train_matfile)
 
 if super_pix_based:
   sgn_matfile = {'sgn':s_l}
-  scipy.io.savemat(labels_directory + 'sgn_matfile.mat', sgn_matfile)
+  scipy.io.savemat(output_directory + 'sgn_matfile.mat', sgn_matfile)
 
 
 time_elapsed = (time.process_time() - start)
@@ -506,10 +371,6 @@ print("Time elapsed is ", minutes, " minutes and ", seconds, " seconds." )
 
 
 
-f = open(labels_directory + "accuracy.txt", "w")
-f.write("Confusion Matrix\n")
-f.write(np.array2string(confusion, separator=', '))
-f.write("\nKappa: %.2f\n" % (cohen_kappa_score(true_labels_test, pred_labels_test)))
-f.write("\nAccuracy: %.4f\n" % (accuracy_score(true_labels_test, pred_labels_test)))
-f.write("Time elapsed is %.2f  minutes and %.2f seconds." % (minutes, seconds))
-f.close()
\ No newline at end of file
+write_accuracy(output_directory + 'accuracy.txt', evaluation, time_elapsed)
+
+timer.report(output_directory + 'performance.json') # the stages, also printed
@@ -0,0 +1,23 @@
+# Shared building blocks of the LGC, RF and SVM classification scripts   --  see README.md
+#
+# The stages of the scripts (lgc_classifier/pipeline.py) can be imported from the package directly, e.g.,
+# from lgc_classifier import load_segmentation, build_graph. They are only imported when first used, so that importing
+# a single module of the package (e.g., by the worker processes) stays cheap.
+
+import importlib
+
+_PIPELINE_STAGES = ('load_segmentation', 'load_features', 'load_samples', 'build_graph', 'compute_statistics',
+                    'build_affinity', 'initial_labels', 'train_label_image', 'superpixel_labels', 'pixel_labels',
+                    'solve_lgc', 'predict_labels', 'evaluate', 'write_accuracy', 'show_images', 'save_images')
+
+__all__ = list(_PIPELINE_STAGES)
+
+
+def __getattr__(name):
+  if name in _PIPELINE_STAGES:
+    return getattr(importlib.import_module('lgc_classifier.pipeline'), name)
+  raise AttributeError("module 'lgc_classifier' has no attribute '%s'" % name)
+
+
+def __dir__():
+  return sorted(list(globals()) + list(_PIPELINE_STAGES))
@@ -0,0 +1,152 @@
+# Construction of the LGC affinity matrix W from the superpixel features S_i_m, S_i_w and S_i_p (please refer to
+# Sellars et.al., 2019, "Super-pixel Contracted Graph-based Learning For Hyperspectral Image Classification").
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.spatial import cKDTree
+
+from lgc_classifier import kernels
+from lgc_classifier.hlt import inverse_store, max_hlt_distance_block, euclidean_distance_block, max_hlt_pairs, \
+  euclidean_distance_pairs
+
+
+# Calculates the weights W[r, c] = s * l between the superpixels rows and cols (slices or index arrays), where
+# s = exp((BETA - 1) * d(S_i_w) - BETA * d(S_i_m) / (2 * SIGMA_S^2)) and l = exp(-d(S_i_p) / (2 * SIGMA_L^2)), exactly as
+# in the W loops of the classifier scripts. d is the maximum HLT distance when complex_only is True (S_i_m and S_i_w
+# are coherence matrix elements) and the squared Euclidean distance otherwise. store_m and store_w are the optional
+# inverse stores (see lgc_classifier/hlt.py) of all the S_i_m and S_i_w coherence matrices. With the numba backend
+# (lgc_classifier/kernels.py), the weights are calculated by a fused kernel instead.
+def affinity_block(S_i_m, S_i_w, S_i_p, rows, cols, BETA, SIGMA_S, SIGMA_L, complex_only, store_m=None, store_w=None):
+  if complex_only:
+    if store_m is None:
+      store_m = inverse_store(S_i_m)
+    if store_w is None:
+      store_w = inverse_store(S_i_w)
+  if kernels.use_jit():
+    return kernels.affinity_block(S_i_m, S_i_w, S_i_p, rows, cols, BETA, SIGMA_S, SIGMA_L, complex_only, store_m, store_w)
+
+  if complex_only:
+    dis_w = max_hlt_distance_block(S_i_w[rows], S_i_w[cols], store_w[rows], store_w[cols])
+    dis_m = max_hlt_distance_block(S_i_m[rows], S_i_m[cols], store_m[rows], store_m[cols])
+  else:
+    dis_w = euclidean_distance_block(S_i_w[rows], S_i_w[cols])
+    dis_m = euclidean_distance_block(S_i_m[rows], S_i_m[cols])
+
+  s = np.exp(((BETA - 1) * dis_w) - (BETA * dis_m) / (2 * np.power(SIGMA_S, 2)))
+  del dis_w, dis_m
+  l = np.exp(-euclidean_distance_block(S_i_p[rows], S_i_p[cols]) / (2 * np.power(SIGMA_L, 2)))
+  s *= l
+  return s
+
+
+# Builds the dense num_sup_pixels*num_sup_pixels matrix W with a full spatial correlation effect (every pair of
+# superpixels is connected, the diagonal is zero). The upper triangle is computed block_rows rows at a time and then
+# mirrored to the lower one. store_m and store_w are built here if they are not given. progress is an optional
+# callback progress(done, total) with the number of pairs calculated (e.g., lgc_classifier/instrumentation.Progress).
+def full_affinity(S_i_m, S_i_w, S_i_p, BETA, SIGMA_S, SIGMA_L, complex_only, block_rows=256, store_m=None,
+                  store_w=None, progress=None):
+  num_sup_pixels = S_i_m.shape[0]
+  if complex_only:  # every coherence matrix is inverted once
+    if store_m is None:
+      store_m = inverse_store(S_i_m)
+    if store_w is None:
+      store_w = inverse_store(S_i_w)
+
+  W = np.zeros((num_sup_pixels, num_sup_pixels))
+  total_pairs, done_pairs = num_sup_pixels * (num_sup_pixels - 1) // 2, 0
+  if progress is not None:
+    progress(0, total_pairs)
+  for first_row in range(0, num_sup_pixels, block_rows):
+    rows = slice(first_row, min(first_row + block_rows, num_sup_pixels))
+    cols = slice(first_row, num_sup_pixels)
+    if kernels.use_jit():  # the upper triangle is written to W directly
+      kernels.affinity_block(S_i_m, S_i_w, S_i_p, rows, cols, BETA, SIGMA_S, SIGMA_L, complex_only, store_m, store_w,
+                             upper=True, out=W[rows, cols])
+    else:
+      block = affinity_block(S_i_m, S_i_w, S_i_p, rows, cols, BETA, SIGMA_S, SIGMA_L, complex_only, store_m, store_w)
+      W[rows, cols] = np.triu(block, k=1)  # only the pairs num_sp_c > num_sp_r
+    if progress is not None:
+      last_row = rows.stop
+      done_pairs += (last_row - first_row) * (2 * num_sup_pixels - first_row - last_row - 1) // 2
+      progress(done_pairs, total_pairs)
+  W += np.transpose(W)  # The matrix W is symmetric; this line is to make the lower triangle the same as the upper one.
+  return W
+
+
+# Calculates the same weights as affinity_block, but only for the pairs of superpixels (idx_i[k], idx_j[k]).
+def affinity_pairs(S_i_m, S_i_w, S_i_p, idx_i, idx_j, BETA, SIGMA_S, SIGMA_L, complex_only, store_m=None,
+                   store_w=None):
+  if complex_only:
+    if store_m is None:
+      store_m = inverse_store(S_i_m)
+    if store_w is None:
+      store_w = inverse_store(S_i_w)
+  if kernels.use_jit():
+    return kernels.affinity_pairs(S_i_m, S_i_w, S_i_p, idx_i, idx_j, BETA, SIGMA_S, SIGMA_L, complex_only, store_m,
+                                  store_w)
+
+  if complex_only:
+    dis_w = max_hlt_pairs(S_i_w, store_w, idx_i, idx_j)
+    dis_m = max_hlt_pairs(S_i_m, store_m, idx_i, idx_j)
+  else:
+    dis_w = euclidean_distance_pairs(S_i_w, idx_i, idx_j)
+    dis_m = euclidean_distance_pairs(S_i_m, idx_i, idx_j)
+
+  s = np.exp(((BETA - 1) * dis_w) - (BETA * dis_m) / (2 * np.power(SIGMA_S, 2)))
+  l = np.exp(-euclidean_distance_pairs(S_i_p, idx_i, idx_j) / (2 * np.power(SIGMA_L, 2)))
+  return s * l
+
+
+# Finds the K_NN spatially nearest superpixels of every superpixel (excluding itself) with a KD-tree built on the
+# centroids S_i_p. Returns a num_sup_pixels*K_NN array of superpixel labels, nearest first.
+def spatial_nearest_neighbours(S_i_p, K_NN):
+  num_sup_pixels = S_i_p.shape[0]
+  tree = cKDTree(np.asarray(S_i_p, dtype=float))
+  nn_idxs = tree.query(np.asarray(S_i_p, dtype=float), k=K_NN + 1)[1].reshape(num_sup_pixels, K_NN + 1)
+
+  not_self = nn_idxs != np.arange(num_sup_pixels)[:, None]
+  # When other superpixels share the centroid of the current one, the superpixel itself may not be returned; the
+  # farthest candidate is dropped instead.
+  no_self_found = np.all(not_self, axis=1)
+  not_self[no_self_found, K_NN] = False
+  return nn_idxs[not_self].reshape(num_sup_pixels, K_NN)
+
+
+# Builds the sparse (CSR) matrix W in which every superpixel is connected to its K_NN spatially nearest superpixels.
+# The weights are those of affinity_block; W is made symmetric by also keeping the pair (c, r) of every pair (r, c),
+# so a superpixel may end up with more than K_NN neighbours.
+def knn_affinity(S_i_m, S_i_w, S_i_p, K_NN, BETA, SIGMA_S, SIGMA_L, complex_only, store_m=None, store_w=None):
+  num_sup_pixels = S_i_m.shape[0]
+  nn_idxs = spatial_nearest_neighbours(S_i_p, K_NN)
+
+  idx_r = np.repeat(np.arange(num_sup_pixels), K_NN)
+  idx_c = nn_idxs.ravel()
+  weights = affinity_pairs(S_i_m, S_i_w, S_i_p, idx_r, idx_c, BETA, SIGMA_S, SIGMA_L, complex_only, store_m, store_w)
+
+  W = sp.csr_matrix((weights, (idx_r, idx_c)), shape=(num_sup_pixels, num_sup_pixels))
+  return W.maximum(W.transpose()).tocsr()  # the weights are symmetric, so this is the union of both neighbourhoods
+
+
+# Calculates S_i_w, the weighted mean of the S_i_m of the neighbours of every superpixel, from the adjacency of
+# lgc_classifier/adjacency.py: S_i_w[i] = sum_j w_ij * S_i_m[j] over the neighbours j of i, with
+# w_ij = exp(-d(S_i_m[i], S_i_m[j]) / WEIGHT_SCALAR) normalized to sum to one. d is the maximum HLT distance when
+# complex_only is True and the squared Euclidean distance otherwise. Superpixels without neighbours get zeros.
+def weighted_neighbour_means(S_i_m, adjacency, WEIGHT_SCALAR, complex_only, store_m=None):
+  adjacency = sp.csr_matrix(adjacency)
+  num_sup_pixels = adjacency.shape[0]
+  if complex_only and store_m is None:
+    store_m = inverse_store(S_i_m)
+  if kernels.use_jit():
+    return kernels.weighted_neighbour_means(S_i_m, adjacency, WEIGHT_SCALAR, complex_only, store_m)
+
+  idx_i = np.repeat(np.arange(num_sup_pixels), np.diff(adjacency.indptr))
+  idx_j = adjacency.indices
+  if complex_only:
+    w_i_zj = np.exp(- max_hlt_pairs(S_i_m, store_m, idx_i, idx_j) / WEIGHT_SCALAR)
+  else:
+    w_i_zj = np.exp(- euclidean_distance_pairs(S_i_m, idx_i, idx_j) / WEIGHT_SCALAR)
+  sum_w = np.bincount(idx_i, weights=w_i_zj, minlength=num_sup_pixels)
+  w_i_zj /= sum_w[idx_i]
+
+  weights = sp.csr_matrix((w_i_zj, adjacency.indices, adjacency.indptr), shape=adjacency.shape)
+  return weights @ np.asarray(S_i_m, dtype=float)
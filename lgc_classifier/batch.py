@@ -0,0 +1,135 @@
+# Headless batch runner: classifies many scenes with one of the classification scripts, without dialog boxes or plot
+# windows, a bounded number of scenes at a time.
+#
+#   python -m lgc_classifier.batch config.json [scene_dir ...]
+#
+# config.json (relative paths are relative to the folder of config.json; the scene folders given on the command line
+# are added to the scenes of the file and are relative to the current directory):
+#   {
+#     "classifier": "lgc_cp",          # lgc_cp, lgc_qp or rf_svm (see CLASSIFIER_SCRIPTS)
+#     "parameters": {"MIU": 0.1},      # values that replace those in the PARAMETER SETTING of the script
+#     "output_dir": "results",         # the results of a scene go to output_dir/<scene name>/
+#     "max_workers": 2,                # the number of scenes classified at the same time
+#     "plot": false,                   # whether the PNG images of the results are saved as well
+#     "scenes": ["scene_1", {"name": "scene_2", "input_dir": "data/s2", "labels_dir": "data/s2/train",
+#                            "parameters": {"MIU": 1}}]
+#   }
+# A scene given as a folder holds all its input files (irgs_to_slic.mat, the feature file, labels.csv and
+# labels_test.csv). Every scene runs in its own process, with its output and errors written to
+# output_dir/<scene name>/<scene name>.log. Note that every scene can start NUM_WORKERS processes of its own.
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from lgc_classifier.config import SCENE_CONFIG_VARIABLE
+
+
+CLASSIFIER_SCRIPTS = {'lgc_cp': 'LGC_classifier_CP.py',
+                      'lgc_qp': 'LGC_Classifier_fullQP.py',
+                      'rf_svm': 'RandomForrest_SupportVectorMachine.py'}
+
+_REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# Returns path as an absolute folder path ending with a separator, relative paths being relative to base.
+def _folder(path, base):
+  return os.path.join(os.path.abspath(os.path.join(base, path)), '')
+
+
+# Returns the list of scene configurations (see lgc_classifier/config.py) for the scenes of config and scene_dirs.
+def _scene_configs(config, base, scene_dirs=()):
+  scenes = [scene if isinstance(scene, dict) else {'input_dir': scene} for scene in config.get('scenes', [])]
+  scenes = [dict(scene, input_dir=_folder(scene['input_dir'], base)) for scene in scenes]
+  scenes += [{'input_dir': _folder(scene_dir, os.getcwd())} for scene_dir in scene_dirs]
+  output_dir = _folder(config.get('output_dir', 'results'), base)
+
+  scene_configs = []
+  for scene in scenes:
+    name = scene.get('name', os.path.basename(os.path.normpath(scene['input_dir'])))
+    parameters = dict(config.get('parameters', {}), **scene.get('parameters', {}))
+    # nothing is shown; the images are only saved with plot
+    parameters.update(SHOW_RAG=False, SHOW_PLOTS=False, SAVE_PLOTS=bool(config.get('plot', False)))
+    scene_configs.append({'name': name,
+                          'input_dir': scene['input_dir'],
+                          'labels_dir': _folder(scene.get('labels_dir', scene['input_dir']), base),
+                          'output_dir': os.path.join(output_dir, name, ''),
+                          'parameters': parameters})
+
+  names = [scene['name'] for scene in scene_configs]
+  duplicates = sorted(set(name for name in names if names.count(name) > 1))
+  if duplicates:
+    raise ValueError('Scene names must be unique (set "name" for the scenes): %s' % ', '.join(duplicates))
+  return scene_configs
+
+
+# Classifies one scene with script in a new process. Returns the scene name, the exit code of the process, the elapsed
+# time (s) and the path of the log.
+def run_scene(script, scene):
+  os.makedirs(scene['output_dir'], exist_ok=True)
+  config_path = os.path.join(scene['output_dir'], 'scene_config.json')
+  with open(config_path, 'w') as f:
+    json.dump(scene, f, indent=2)
+
+  env = dict(os.environ)
+  env[SCENE_CONFIG_VARIABLE] = config_path
+  env['MPLBACKEND'] = 'Agg'  # no display is needed (or available)
+  log_path = os.path.join(scene['output_dir'], scene['name'] + '.log')
+  start = time.time()
+  with open(log_path, 'w') as log:
+    returncode = subprocess.call([sys.executable, os.path.join(_REPOSITORY, script)], cwd=scene['input_dir'],
+                                 env=env, stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT)
+  return scene['name'], returncode, time.time() - start, log_path
+
+
+# Classifies all the scenes of config (a dict as in config.json; base is the folder relative paths are relative to)
+# and scene_dirs, max_workers scenes at a time. Returns the list of results of run_scene in the order they finished.
+def run_batch(config, base='.', scene_dirs=(), max_workers=None):
+  if config.get('classifier') not in CLASSIFIER_SCRIPTS:
+    raise ValueError('Unknown classifier %r (use one of %s)' % (config.get('classifier'),
+                                                               ', '.join(sorted(CLASSIFIER_SCRIPTS))))
+  script = CLASSIFIER_SCRIPTS[config['classifier']]
+  scenes = _scene_configs(config, base, scene_dirs)
+  if max_workers is None:
+    max_workers = config.get('max_workers', 1)
+
+  results = []
+  with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:  # each thread waits for one scene process
+    futures = [pool.submit(run_scene, script, scene) for scene in scenes]
+    for future in as_completed(futures):
+      results.append(future.result())
+      name, returncode, elapsed, log_path = results[-1]
+      print('{}: {} in {:.1f} s (log: {})'.format(name, 'done' if returncode == 0 else 'FAILED (%d)' % returncode,
+                                                   elapsed, log_path), flush=True)
+  return results
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Classify many scenes without dialog boxes or plot windows.')
+  parser.add_argument('config', help='the JSON configuration file')
+  parser.add_argument('scenes', nargs='*', help='folders of more scenes (with all their input files)')
+  parser.add_argument('--max-workers', type=int, default=None, help='the number of scenes classified at a time')
+  parser.add_argument('--output-dir', default=None, help='replaces the output_dir of the configuration file')
+  parser.add_argument('--plot', action='store_true', help='save the PNG images of the results as well')
+  args = parser.parse_args(argv)
+
+  with open(args.config) as f:
+    config = json.load(f)
+  if args.output_dir is not None:
+    config['output_dir'] = os.path.abspath(args.output_dir)
+  if args.plot:
+    config['plot'] = True
+
+  results = run_batch(config, os.path.dirname(os.path.abspath(args.config)), args.scenes, args.max_workers)
+  failed = [name for name, returncode, _, _ in results if returncode != 0]
+  print('{} of {} scenes classified{}'.format(len(results) - len(failed), len(results),
+                                              '; failed: ' + ', '.join(failed) if failed else ''))
+  return 1 if failed else 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,336 @@
+# Benchmark of the classification pipelines on synthetic scenes, for measuring the effect of changes without the SAR
+# scenes (which cannot be shared):
+#
+#   python -m lgc_classifier.benchmark [--sizes 1000 5000 20000 100000] [--pipelines lgc_cp lgc_qp rf_svm]
+#                                      [--output-dir benchmarks] [--compare benchmarks/benchmark_<time>.json]
+#   python -m lgc_classifier.benchmark --write-scene scene_dir --sizes 5000 [--polarization qp]
+#
+# A synthetic scene is a Voronoi oversegmentation with about the given number of superpixels (seeds on a jittered
+# grid, so the superpixels are about as regular as SLIC ones), optionally with a land region labelled LAND_LABEL, a
+# spatially coherent class map of the superpixels, a field of Hermitian positive definite coherence matrices (the
+# multilook average of complex Gaussian scattering vectors with a covariance per class) in the CP (4 elements) or QP
+# (9 elements) layout of lgc_classifier/hlt.py, and train and test samples. Every stage of the LGC (CP and QP) and
+# RF/SVM pipelines is timed with lgc_classifier/instrumentation.StageTimer, for every number of superpixels and W mode
+# ('full' only up to --full-limit superpixels, 'knn' and 'nystrom'), and the results are saved as a JSON file;
+# --compare prints the wall time ratios of every stage against an earlier results file. With --write-scene, the scene
+# is written as the input files of the scripts instead (irgs_to_slic.mat, SV.tif or C.tif, labels.csv and
+# labels_test.csv), e.g., for lgc_classifier/batch.py.
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+import scipy.io
+from scipy.spatial import cKDTree
+
+from lgc_classifier.superpixels import LAND_LABEL, count_superpixels, superpixel_statistics
+from lgc_classifier.adjacency import region_adjacency
+from lgc_classifier.affinity import full_affinity, knn_affinity, weighted_neighbour_means
+from lgc_classifier.lowrank import NystromAffinity, nystrom_lgc_solve
+from lgc_classifier.hlt import inverse_store
+from lgc_classifier.solver import degree_vector, lgc_solve
+from lgc_classifier.painting import paint_superpixels
+from lgc_classifier.evaluation import test_sample_labels, cohen_kappa, accuracy
+from lgc_classifier.preprocessing import preprocess_features
+from lgc_classifier.pipeline import initial_labels, superpixel_labels, predict_labels
+from lgc_classifier.instrumentation import StageTimer
+from lgc_classifier.kernels import set_backend, get_backend
+
+
+PIPELINES = ('lgc_cp', 'lgc_qp', 'rf_svm')
+W_MODES = ('full', 'knn', 'nystrom')
+
+
+# Returns the HxW oversegmentation with labels 0 to num_sup_pixels - 1 (and LAND_LABEL): every pixel belongs to its
+# nearest seed, the seeds being one per cell of a grid of about num_superpixels cells, at a random place in the cell.
+# With land, the pixels beyond a wavy "coastline" at about 85% of the width are land. The labels are renumbered so that
+# they are consecutive (a superpixel can be entirely on land).
+def voronoi_segmentation(num_superpixels, height, width, land=True, rng=None, block_rows=256):
+  rng = np.random.default_rng(rng)
+  cell = np.sqrt(height * width / num_superpixels)
+  grid_rows, grid_cols = np.meshgrid(np.arange(0, height, cell), np.arange(0, width, cell), indexing='ij')
+  seeds = np.column_stack([grid_rows.ravel(), grid_cols.ravel()]) + rng.random((grid_rows.size, 2)) * cell
+  tree = cKDTree(seeds)
+
+  labels = np.empty((height, width), dtype=np.int64)
+  cols = np.arange(width)
+  for first_row in range(0, height, block_rows):
+    rows = np.arange(first_row, min(first_row + block_rows, height))
+    pixels = np.column_stack([np.repeat(rows, width), np.tile(cols, rows.size)])
+    labels[rows[0]:rows[-1] + 1] = tree.query(pixels)[1].reshape(rows.size, width)
+  if land:
+    coast = 0.85 * width + 0.03 * width * np.sin(np.arange(height) * 6 * np.pi / height)
+    labels[cols[None, :] > coast[:, None]] = LAND_LABEL
+
+  sea = labels != LAND_LABEL
+  labels[sea] = np.unique(labels[sea], return_inverse=True)[1]
+  return labels
+
+
+# Returns the class (0 to num_classes - 1) of every superpixel: that of the nearest of a few random class centres (four
+# per class), so that the classes form large regions as sea ice types do.
+def class_map(centroids, num_classes, height, width, rng=None):
+  rng = np.random.default_rng(rng)
+  centres = rng.random((4 * num_classes, 2)) * [height, width]
+  return cKDTree(centres).query(centroids)[1] % num_classes
+
+
+# Returns one covariance (dim x dim, Hermitian positive definite) per class: a random one plus a class-dependent
+# multiple of the identity, so that the classes differ both in intensity and in correlation.
+def class_covariances(num_classes, dim, rng=None):
+  rng = np.random.default_rng(rng)
+  covariances = []
+  for num_class in range(0, num_classes):
+    G = rng.normal(size=(dim, dim)) + 1j * rng.normal(size=(dim, dim))
+    covariances.append((G @ G.conj().T) / dim + (1 + num_class) * np.identity(dim))
+  return np.array(covariances)
+
+
+# Returns the HxWx4 (CP: c11, c12_real, c22, c12_imag) or HxWx9 (QP) coherence matrix elements of the pixels: the
+# average of looks outer products k * k^H of complex Gaussian scattering vectors k with the covariance of the class of
+# the pixel (pixel_classes, HxW). The matrices are Hermitian positive definite for looks >= dim.
+def coherence_field(pixel_classes, covariances, looks=4, rng=None, block_rows=128):
+  rng = np.random.default_rng(rng)
+  dim = covariances.shape[1]
+  chol = np.linalg.cholesky(covariances)
+  height, width = pixel_classes.shape
+  field = np.empty((height, width, 4 if dim == 2 else 9))
+  for first_row in range(0, height, block_rows):
+    classes = pixel_classes[first_row:first_row + block_rows].ravel()
+    z = (rng.normal(size=(classes.size, looks, dim)) + 1j * rng.normal(size=(classes.size, looks, dim))) / np.sqrt(2)
+    k = np.einsum('pij,plj->pli', chol[classes], z)
+    C = np.einsum('pli,plj->pij', k, k.conj()) / looks
+    if dim == 2:
+      elems = [C[:, 0, 0].real, C[:, 0, 1].real, C[:, 1, 1].real, C[:, 0, 1].imag]
+    else:
+      elems = [C[:, 0, 0].real, C[:, 0, 1].real, C[:, 1, 1].real, C[:, 0, 2].real, C[:, 1, 2].real, C[:, 2, 2].real,
+               C[:, 0, 1].imag, C[:, 0, 2].imag, C[:, 1, 2].imag]
+    field[first_row:first_row + block_rows] = np.stack(elems, axis=1).reshape(-1, width, len(elems))
+  return field
+
+
+# Returns the CP Stokes vector (SV.tif: g0, g1, g2, g3) of the CP coherence matrix elements, the inverse of
+# stokes_to_coherence.
+def coherence_to_stokes(coh_elements):
+  return np.stack([coh_elements[:, :, 0] + coh_elements[:, :, 2], coh_elements[:, :, 0] - coh_elements[:, :, 2],
+                   2 * coh_elements[:, :, 1], -2 * coh_elements[:, :, 3]], axis=2)
+
+
+# Returns num_samples rows of (label, column number, row number), the last two starting from 1, of random sea pixels
+# that are not on the image border, labelled with the class (from 1) of their superpixel.
+def sample_rows(labels, sp_classes, num_samples, rng=None):
+  rng = np.random.default_rng(rng)
+  rows, cols = np.nonzero(labels[1:-1, 1:-1] != LAND_LABEL)
+  picked = rng.choice(rows.size, min(num_samples, rows.size), replace=False)
+  rows, cols = rows[picked] + 1, cols[picked] + 1
+  return np.column_stack([sp_classes[labels[rows, cols]] + 1, cols + 1, rows + 1])
+
+
+# Generates a synthetic scene with about num_superpixels superpixels of pixels_per_superpixel pixels. polarization is
+# 'cp' or 'qp'. Returns a dict with the oversegmentation 'labels', 'num_sup_pixels', the coherence elements 'coh' (and
+# for CP the Stokes vector 'stokes'), the classes of the superpixels 'sp_classes', and the 'train' and 'test' samples
+# (rows of labels.csv and labels_test.csv).
+def synthetic_scene(num_superpixels, polarization='cp', num_classes=4, pixels_per_superpixel=64, land=True, seed=0):
+  rng = np.random.default_rng(seed)
+  side = int(np.ceil(np.sqrt(num_superpixels * pixels_per_superpixel / (0.85 if land else 1))))
+  labels = voronoi_segmentation(num_superpixels / (0.85 if land else 1), side, side, land, rng)
+  num_sup_pixels = count_superpixels(labels)[0]
+  sp_counts, sp_centroids, _ = superpixel_statistics(labels, num_sup_pixels)
+  sp_classes = class_map(sp_centroids, num_classes, side, side, rng)
+
+  pixel_classes = paint_superpixels(labels, sp_classes, num_sup_pixels, fill=0, dtype=np.intp)
+  covariances = class_covariances(num_classes, 2 if polarization == 'cp' else 3, rng)
+  scene = {'labels': labels, 'num_sup_pixels': num_sup_pixels, 'sp_classes': sp_classes,
+           'coh': coherence_field(pixel_classes, covariances, rng=rng),
+           'train': sample_rows(labels, sp_classes, max(10 * num_classes, num_sup_pixels // 20), rng),
+           'test': sample_rows(labels, sp_classes, max(20 * num_classes, num_sup_pixels // 10), rng)}
+  if polarization == 'cp':
+    scene['stokes'] = coherence_to_stokes(scene['coh'])
+  return scene
+
+
+# Writes the scene as the input files of the scripts in directory: irgs_to_slic.mat, SV.tif (CP) and C.tif, labels.csv
+# and labels_test.csv.
+def write_scene(scene, directory):
+  import tifffile as tiff
+  os.makedirs(directory, exist_ok=True)
+  scipy.io.savemat(os.path.join(directory, 'irgs_to_slic.mat'), {'irgs_to_slic': scene['labels']})
+  tiff.imwrite(os.path.join(directory, 'C.tif'), scene['coh'])
+  if 'stokes' in scene:
+    tiff.imwrite(os.path.join(directory, 'SV.tif'), scene['stokes'])
+  np.savetxt(os.path.join(directory, 'labels.csv'), scene['train'], fmt='%d', delimiter=',')
+  np.savetxt(os.path.join(directory, 'labels_test.csv'), scene['test'], fmt='%d', delimiter=',')
+
+
+# Runs the LGC pipeline (CP: from the Stokes vector, QP: from the coherence elements) on scene with the W mode 'full',
+# 'knn' (K_NN nearest superpixels) or 'nystrom' (num_anchors anchors), timing every stage with timer. Returns the
+# kappa and the accuracy on the test samples.
+def run_lgc(scene, timer, w_mode, K_NN=8, num_anchors=500, BETA=.9, SIGMA_S=1, SIGMA_L=1000, MIU=.1,
+            WEIGHT_SCALAR=10):
+  labels = scene['labels']
+  num_classes = int(np.max(scene['train'][:, 0]))
+
+  timer.stage('superpixel statistics')
+  num_sup_pixels = count_superpixels(labels)[0]
+  adjacency = region_adjacency(labels, num_sup_pixels)
+  if 'stokes' in scene:
+    feats = preprocess_features(scene['stokes'].copy(), stokes=True)
+  else:
+    feats = scene['coh']
+  S_i_p, S_i_m = superpixel_statistics(labels, num_sup_pixels, feats)[1:]
+  S_i_p = S_i_p.astype(int)
+  store_m = inverse_store(S_i_m)
+
+  timer.stage('S_i_w')
+  S_i_w = weighted_neighbour_means(S_i_m, adjacency, WEIGHT_SCALAR, True, store_m=store_m)
+  store_w = inverse_store(S_i_w)
+
+  timer.stage('W')
+  if w_mode == 'full':
+    W = full_affinity(S_i_m, S_i_w, S_i_p, BETA, SIGMA_S, SIGMA_L, True, store_m=store_m, store_w=store_w)
+  elif w_mode == 'knn':
+    W = knn_affinity(S_i_m, S_i_w, S_i_p, K_NN, BETA, SIGMA_S, SIGMA_L, True, store_m=store_m, store_w=store_w)
+  else:
+    W = NystromAffinity(S_i_m, S_i_w, S_i_p, BETA, SIGMA_S, SIGMA_L, True, num_anchors, store_m=store_m,
+                        store_w=store_w)
+
+  timer.stage('D')
+  d = degree_vector(W)
+
+  timer.stage('solve')
+  Y = initial_labels(labels, scene['train'], num_sup_pixels, num_classes)
+  if w_mode == 'nystrom':
+    F = nystrom_lgc_solve(W, Y, MIU, d=d)[0]
+  else:
+    F = lgc_solve(W, Y, MIU, d=d)[0]
+
+  timer.stage('paint')
+  predicted_labels = predict_labels(labels, F, num_sup_pixels)  # as the scripts
+
+  timer.stage('evaluate')
+  true_labels_test, pred_labels_test, _ = test_sample_labels(predicted_labels, scene['test'], True)
+  return cohen_kappa(true_labels_test, pred_labels_test), accuracy(true_labels_test, pred_labels_test)
+
+
+# Runs the superpixel-based RF and SVM pipelines on the intensities (diagonal coherence elements) of scene, timing
+# every stage with timer. Returns the kappa and the accuracy of the RF and of the SVM on the test samples.
+def run_rf_svm(scene, timer, n_estimators=100, C=8, gamma=1):
+  from sklearn.ensemble import RandomForestClassifier  # only this pipeline needs scikit-learn
+  from lgc_classifier.tuning import PrecomputedRBFSVC
+  labels = scene['labels']
+
+  timer.stage('superpixel statistics')
+  num_sup_pixels = count_superpixels(labels)[0]
+  intensities = [0, 2] if scene['coh'].shape[2] == 4 else [0, 2, 5]
+  feats = preprocess_features(scene['coh'][:, :, intensities], normalize=True)
+  sp_feats = superpixel_statistics(labels, num_sup_pixels, feats)[2]
+
+  timer.stage('train data')
+  sp_labels = superpixel_labels(labels, scene['train'], num_sup_pixels)
+  tr_data, tr_labels = sp_feats[sp_labels != 0], sp_labels[sp_labels != 0]
+
+  scores = []
+  for name, model in (('RF', RandomForestClassifier(n_estimators=n_estimators, random_state=0)),
+                      ('SVM', PrecomputedRBFSVC(C=C, gamma=gamma))):
+    timer.stage(name + ' fit')
+    model.fit(tr_data, tr_labels)
+    timer.stage(name + ' predict')
+    predicted_labels = paint_superpixels(labels, model.predict(sp_feats), num_sup_pixels, fill=0, dtype=float)
+    timer.stage(name + ' evaluate')
+    true_labels_test, pred_labels_test, _ = test_sample_labels(predicted_labels, scene['test'], True)
+    scores += [cohen_kappa(true_labels_test, pred_labels_test), accuracy(true_labels_test, pred_labels_test)]
+  return scores
+
+
+# Runs the pipelines for every number of superpixels in sizes and returns the results: a dict with the environment
+# and one entry per (pipeline, size, W mode) with its stages (see StageTimer.report) and scores.
+def run_benchmark(sizes, pipelines=PIPELINES, w_modes=W_MODES, full_limit=5000, num_anchors=500, seed=0):
+  results = {'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+             'environment': {'python': sys.version.split()[0], 'numpy': np.__version__,
+                             'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+                             'kernel_backend': get_backend()},
+             'runs': []}
+  for size in sizes:
+    for pipeline in pipelines:
+      timer = StageTimer()
+      timer.stage('scene')
+      scene = synthetic_scene(size, 'qp' if pipeline == 'lgc_qp' else 'cp', seed=seed)
+      scene_stage = timer.report()['stages']
+      runs = [w_mode for w_mode in w_modes if w_mode != 'full' or size <= full_limit]
+      for w_mode in runs if pipeline != 'rf_svm' else [None]:
+        timer = StageTimer()
+        if pipeline == 'rf_svm':
+          scores = dict(zip(['rf_kappa', 'rf_accuracy', 'svm_kappa', 'svm_accuracy'], run_rf_svm(scene, timer)))
+        else:
+          scores = dict(zip(['kappa', 'accuracy'], run_lgc(scene, timer, w_mode, num_anchors=num_anchors)))
+        report = timer.report()
+        results['runs'].append(dict({'pipeline': pipeline, 'size': size, 'num_sup_pixels': scene['num_sup_pixels'],
+                                     'pixels': int(scene['labels'].size), 'w_mode': w_mode,
+                                     'stages': scene_stage + report['stages'], 'total': report['total']}, **scores))
+        print('{} {} superpixels{}: {:.2f} s'.format(pipeline, scene['num_sup_pixels'],
+                                                      '' if w_mode is None else ', W ' + w_mode,
+                                                      report['total']['wall_time_s']), flush=True)
+      del scene
+  return results
+
+
+# Prints the wall times of the stages of the runs in results against those of the same runs (pipeline, size and W
+# mode) in previous, with their ratio (previous / results, i.e., the speed-up).
+def compare_results(previous, results):
+  def run_key(run):
+    return run['pipeline'], run['size'], run['w_mode']
+  previous_runs = {run_key(run): run for run in previous['runs']}
+  for run in results['runs']:
+    if run_key(run) not in previous_runs:
+      continue
+    previous_stages = {stage['stage']: stage for stage in previous_runs[run_key(run)]['stages']}
+    print('{} {}{}:'.format(run['pipeline'], run['size'], '' if run['w_mode'] is None else ' ' + run['w_mode']))
+    for stage in run['stages']:
+      if stage['stage'] in previous_stages:
+        before, after = previous_stages[stage['stage']]['wall_time_s'], stage['wall_time_s']
+        print('  {:<24} {:9.3f} s -> {:9.3f} s  x{:.2f}'.format(stage['stage'], before, after,
+                                                              before / max(after, 1e-9)))
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Time the classification pipelines on synthetic scenes.')
+  parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000, 20000, 100000],
+                      help='the numbers of superpixels of the scenes')
+  parser.add_argument('--pipelines', nargs='+', default=list(PIPELINES), choices=PIPELINES)
+  parser.add_argument('--w-modes', nargs='+', default=list(W_MODES), choices=W_MODES)
+  parser.add_argument('--full-limit', type=int, default=5000,
+                      help='the largest number of superpixels for which the full W is built')
+  parser.add_argument('--anchors', type=int, default=500, help='the number of anchors of the nystrom W')
+  parser.add_argument('--backend', default='numpy', choices=['numpy', 'numba', 'auto'],
+                      help='the kernels of S_i_w and W (see lgc_classifier/kernels.py)')
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--output-dir', default='benchmarks', help='the folder of the results files')
+  parser.add_argument('--compare', default=None, help='an earlier results file to compare the results with')
+  parser.add_argument('--write-scene', default=None,
+                      help='writes the scene of the first size as the input files of the scripts in this folder')
+  parser.add_argument('--polarization', default='cp', choices=['cp', 'qp'], help='the layout of the written scene')
+  args = parser.parse_args(argv)
+
+  if args.write_scene is not None:
+    write_scene(synthetic_scene(args.sizes[0], args.polarization, seed=args.seed), args.write_scene)
+    return 0
+
+  set_backend(args.backend)
+  results = run_benchmark(args.sizes, args.pipelines, args.w_modes, args.full_limit, args.anchors, args.seed)
+  os.makedirs(args.output_dir, exist_ok=True)
+  path = os.path.join(args.output_dir, 'benchmark_{}.json'.format(time.strftime('%Y%m%d_%H%M%S')))
+  with open(path, 'w') as f:
+    json.dump(results, f, indent=2)
+  print('Results written to ' + path)
+  if args.compare is not None:
+    with open(args.compare) as f:
+      compare_results(json.load(f), results)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,107 @@
+# On-disk cache of the superpixel statistics (S_i_m, S_i_p, S_i_w, the adjacency, ...) of a scene. They depend only on
+# the segmentation, the feature file and a few parameters, so a rerun with other graph or LGC parameters (BETA,
+# SIGMA_S, SIGMA_L, MIU, ...) can load them instead of making a pass over the images. An entry is a compressed .npz
+# file named after the key, a hash of the contents of the input files and of the parameters. The cache is kept under a
+# size limit by removing the least recently used entries.
+
+import hashlib
+import json
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+import scipy.sparse as sp
+
+
+# Returns the SHA-256 hex digest of the contents of the file path, read chunk_size bytes at a time.
+def file_digest(path, chunk_size=2 ** 24):
+  digest = hashlib.sha256()
+  with open(path, 'rb') as f:
+    for chunk in iter(lambda: f.read(chunk_size), b''):
+      digest.update(chunk)
+  return digest.hexdigest()
+
+
+# Returns the cache key of the input files paths and of the dict parameters (JSON-serializable values).
+def cache_key(paths, parameters):
+  digest = hashlib.sha256()
+  for path in paths:
+    digest.update(file_digest(path).encode())
+  digest.update(json.dumps(parameters, sort_keys=True, default=str).encode())
+  return digest.hexdigest()
+
+
+def _entry_path(cache_dir, key):
+  return os.path.join(cache_dir, key + '.npz')
+
+
+# Returns the dict of statistics stored under key, or None when there is no (readable) entry. Scalars are returned as
+# Python numbers and sparse matrices as CSR matrices. A hit marks the entry as recently used.
+def load_statistics(cache_dir, key):
+  path = _entry_path(cache_dir, key)
+  if not os.path.exists(path):
+    return None
+  try:
+    with np.load(path, allow_pickle=False) as entry:
+      sparse_names = [str(name) for name in entry['__sparse__']]
+      statistics = {}
+      for name in entry.files:
+        if name == '__sparse__' or '.' in name:
+          continue
+        statistics[name] = entry[name].item() if entry[name].ndim == 0 else entry[name]
+      for name in sparse_names:
+        statistics[name] = sp.csr_matrix((entry[name + '.data'], entry[name + '.indices'], entry[name + '.indptr']),
+                                         shape=tuple(entry[name + '.shape']))
+  except (OSError, ValueError, KeyError, zipfile.BadZipFile):  # a damaged (or meanwhile removed) entry is a miss
+    if os.path.exists(path):
+      os.remove(path)
+    return None
+  try:
+    os.utime(path)
+  except FileNotFoundError:
+    pass
+  return statistics
+
+
+# Stores the dict statistics (arrays, scalars and scipy sparse matrices) under key and then removes the least recently
+# used entries until the cache takes at most max_bytes (the new entry too, if it alone is larger).
+def save_statistics(cache_dir, key, statistics, max_bytes=2 ** 32):
+  os.makedirs(cache_dir, exist_ok=True)
+  arrays = {'__sparse__': np.array([name for name, value in statistics.items() if sp.issparse(value)], dtype=str)}
+  for name, value in statistics.items():
+    if sp.issparse(value):
+      value = sp.csr_matrix(value)
+      arrays.update({name + '.data': value.data, name + '.indices': value.indices, name + '.indptr': value.indptr,
+                     name + '.shape': np.array(value.shape)})
+    else:
+      arrays[name] = np.asarray(value)
+
+  # written under a temporary name first, so that a concurrent reader never sees a partial entry
+  fd, temp_path = tempfile.mkstemp(suffix='.npz.tmp', dir=cache_dir)
+  with os.fdopen(fd, 'wb') as f:
+    np.savez_compressed(f, **arrays)
+  os.replace(temp_path, _entry_path(cache_dir, key))
+  evict(cache_dir, max_bytes)
+
+
+# Removes the least recently used entries of the cache until it takes at most max_bytes. Entries removed meanwhile by
+# another process (e.g., another scene of the batch runner) are skipped.
+def evict(cache_dir, max_bytes):
+  entries = []
+  for name in os.listdir(cache_dir):
+    if name.endswith('.npz'):
+      try:
+        stat = os.stat(os.path.join(cache_dir, name))
+      except FileNotFoundError:
+        continue
+      entries.append((stat.st_mtime, stat.st_size, name))
+  total = sum(size for _, size, _ in entries)
+  for _, size, name in sorted(entries):
+    if total <= max_bytes:
+      break
+    try:
+      os.remove(os.path.join(cache_dir, name))
+    except FileNotFoundError:
+      pass
+    total -= size
@@ -0,0 +1,30 @@
+# The scene configuration with which the batch runner (lgc_classifier/batch.py) starts a classification script. The
+# runner writes it as a JSON file and passes its path in the environment variable SCENE_CONFIG_VARIABLE; a script that
+# is started by hand finds no such variable and asks for its folders with dialog boxes as before.
+
+import json
+import os
+
+
+SCENE_CONFIG_VARIABLE = 'LGC_SCENE_CONFIG'
+
+
+# Returns the configuration of the scene the script is run for: a dict with 'name', 'input_dir' (the folder of
+# irgs_to_slic.mat, the feature file and labels_test.csv), 'labels_dir' (the folder of labels.csv), 'output_dir' and
+# 'parameters' (values that replace those in the PARAMETER SETTING of the script). The folders end with a separator.
+# Returns None when the script is not run by the batch runner.
+def scene_config():
+  path = os.environ.get(SCENE_CONFIG_VARIABLE)
+  if not path:
+    return None
+  with open(path) as f:
+    return json.load(f)
+
+
+# Replaces the parameters of a script (its globals(), namespace) by those in parameters. Only names that the script
+# already defines can be set, so that a misspelt parameter in a configuration file is an error and not a silent no-op.
+def override_parameters(namespace, parameters):
+  unknown = sorted(name for name in parameters if name not in namespace)
+  if unknown:
+    raise ValueError('Unknown parameters: %s' % ', '.join(unknown))
+  namespace.update(parameters)
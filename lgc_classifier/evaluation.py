@@ -0,0 +1,74 @@
+# Accuracy assessment of a predicted label image against the test samples in labels_test.csv. All the test samples are
+# assessed at once with array indexing.
+
+import numpy as np
+
+
+# The (row, col) offsets of the pixels of the "3 by 3" square around a test pixel, in the order of the original loop.
+_SQUARE_OFFSETS = np.array([(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 0), (0, 1), (1, -1), (1, 0), (1, 1)])
+
+
+# Returns the mode of every row of windows (num_windows*9); of equally frequent values the smallest one is taken, as by
+# scipy.stats.mode.
+def _window_modes(windows):
+  windows = np.sort(windows, axis=1)
+  counts = np.sum(windows[:, :, None] == windows[:, None, :], axis=2)  # how often each value occurs in its window
+  return windows[np.arange(windows.shape[0]), np.argmax(counts, axis=1)]
+
+
+# Reads the predicted labels of the test samples in csv_file_test (rows of label, column number, row number, the last two
+# starting from 1) from predicted_labels (HxW). With Cluste_based_testing, each test sample that is not on the image
+# border is the "3 by 3" square around the test pixel and its predicted label is the mode of the nine predicted labels.
+# Returns the true labels, the predicted labels and the image of the test samples (for plotting); where test samples
+# overlap in the image, the later one in csv_file_test is shown. Without test_image, that image is not made (None is
+# returned), so a memory-mapped predicted_labels is only read at the test samples.
+def test_sample_labels(predicted_labels, csv_file_test, Cluste_based_testing, test_image=True):
+  true_labels_test = csv_file_test[:, 0].astype(float)
+  row_test = csv_file_test[:, 2] - 1
+  col_test = csv_file_test[:, 1] - 1
+  pred_labels_test = predicted_labels[row_test, col_test].astype(float)
+
+  in_square = np.zeros(csv_file_test.shape[0], dtype=bool)
+  if Cluste_based_testing:
+    in_square = ((row_test > 0) & (row_test < predicted_labels.shape[0] - 1) &
+                 (col_test > 0) & (col_test < predicted_labels.shape[1] - 1))
+  square_rows = row_test[in_square, None] + _SQUARE_OFFSETS[:, 0]
+  square_cols = col_test[in_square, None] + _SQUARE_OFFSETS[:, 1]
+  pred_labels_test[in_square] = _window_modes(predicted_labels[square_rows, square_cols]) #the mode of the labels in the square
+  if not test_image:
+    return true_labels_test, pred_labels_test, None
+
+  # The pixels of every test sample (nine for a square, one otherwise), in the order of the samples
+  pixel_rows = np.where(in_square[:, None], row_test[:, None] + _SQUARE_OFFSETS[:, 0], row_test[:, None])
+  pixel_cols = np.where(in_square[:, None], col_test[:, None] + _SQUARE_OFFSETS[:, 1], col_test[:, None])
+  pixels = np.ravel_multi_index((pixel_rows.ravel(), pixel_cols.ravel()), predicted_labels.shape, mode='wrap')
+  # a pixel shared by several samples gets the label of the last one
+  pixels, last = np.unique(pixels[::-1], return_index=True)
+  true_label_test_image = np.zeros_like(predicted_labels) #For plotting the test samples
+  true_label_test_image.flat[pixels] = np.repeat(csv_file_test[:, 0], 9)[::-1][last]
+
+  return true_labels_test, pred_labels_test, true_label_test_image
+
+
+# Returns the confusion matrix of the true and predicted labels of the test samples: element (i, j) is the number of
+# samples of the i-th class predicted as the j-th one, the classes being all the labels of both, sorted (as
+# sklearn.metrics.confusion_matrix, without importing scikit-learn for it).
+def confusion_matrix(true_labels_test, pred_labels_test):
+  true_labels_test, pred_labels_test = np.ravel(true_labels_test), np.ravel(pred_labels_test)
+  classes, class_idxs = np.unique(np.concatenate((true_labels_test, pred_labels_test)), return_inverse=True)
+  confusion = np.zeros((classes.size, classes.size), dtype=np.int64)
+  np.add.at(confusion, (class_idxs[:true_labels_test.size], class_idxs[true_labels_test.size:]), 1)
+  return confusion
+
+
+# Returns Cohen's kappa of the test samples, calculated as by sklearn.metrics.cohen_kappa_score.
+def cohen_kappa(true_labels_test, pred_labels_test):
+  confusion = confusion_matrix(true_labels_test, pred_labels_test)
+  expected = np.outer(np.sum(confusion, axis=0), np.sum(confusion, axis=1)) / np.sum(confusion)
+  off_diagonal = 1 - np.identity(confusion.shape[0], dtype=int)
+  return 1 - np.sum(off_diagonal * confusion) / np.sum(off_diagonal * expected)
+
+
+# Returns the fraction of the test samples whose predicted label is the true one.
+def accuracy(true_labels_test, pred_labels_test):
+  return np.mean(np.ravel(true_labels_test) == np.ravel(pred_labels_test))
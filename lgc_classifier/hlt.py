@@ -0,0 +1,135 @@
+# Batched distance kernels between superpixel features: the maximum HLT distance between CP (2x2) or QP (3x3) coherence
+# matrices and the squared Euclidean distance, evaluated for whole blocks of superpixel pairs at once.
+#
+# The coherence matrices are stored as rows of real elements with the following order:
+# CP: 0:C11, 1:C12_real, 2:C22, 3:C12_imag
+# QP: 0:C11, 1:C12_real, 2:C22, 3:C13_real, 4:C23_real, 5:C33, 6:C12_imag, 7:C13_imag, 8:C23_imag
+# The inverse of a coherence matrix is Hermitian as well and is stored in the same layout. For two Hermitian matrices
+# X and B, trace(X B) is real and equals the sum of w_k * X_k * B_k over the layout elements, where w_k is 1 for the
+# diagonal elements and 2 for the off-diagonal ones (each appears twice in the matrix). The inverse store of a feature
+# set keeps w_k * X_k for every superpixel, so an HLT term is only a dot product between a store row and a feature row.
+
+import numpy as np
+
+
+TRACE_WEIGHTS = {4: np.array([1., 2., 1., 2.]),
+                 9: np.array([1., 2., 1., 2., 2., 1., 2., 2., 2.])}
+
+
+# Calculates the inverses of the coherence matrices given as rows of elems (num*4 for CP or num*9 for QP) with the
+# closed-form (adjugate over determinant) expressions. Returns the inverses in the same layout and the determinants.
+def coherence_inverses(elems):
+  elems = np.asarray(elems, dtype=float)
+  inv = np.empty_like(elems)
+
+  if elems.shape[1] == 4:  # CP: [[a, z], [conj(z), b]]
+    a, b = elems[:, 0], elems[:, 2]
+    det = a * b - elems[:, 1] ** 2 - elems[:, 3] ** 2
+    inv[:, 0] = b / det
+    inv[:, 1] = -elems[:, 1] / det
+    inv[:, 2] = a / det
+    inv[:, 3] = -elems[:, 3] / det
+
+  elif elems.shape[1] == 9:  # QP: [[a, p, q], [conj(p), b, r], [conj(q), conj(r), c]]
+    a, b, c = elems[:, 0], elems[:, 2], elems[:, 5]
+    p = elems[:, 1] + 1j * elems[:, 6]
+    q = elems[:, 3] + 1j * elems[:, 7]
+    r = elems[:, 4] + 1j * elems[:, 8]
+    abs_p, abs_q, abs_r = np.abs(p) ** 2, np.abs(q) ** 2, np.abs(r) ** 2
+
+    det = a * b * c + 2 * np.real(p * r * np.conj(q)) - a * abs_r - b * abs_q - c * abs_p
+    inv_p = (q * np.conj(r) - c * p) / det
+    inv_q = (p * r - b * q) / det
+    inv_r = (q * np.conj(p) - a * r) / det
+
+    inv[:, 0] = (b * c - abs_r) / det
+    inv[:, 2] = (a * c - abs_q) / det
+    inv[:, 5] = (a * b - abs_p) / det
+    inv[:, 1], inv[:, 6] = np.real(inv_p), np.imag(inv_p)
+    inv[:, 3], inv[:, 7] = np.real(inv_q), np.imag(inv_q)
+    inv[:, 4], inv[:, 8] = np.real(inv_r), np.imag(inv_r)
+
+  else:
+    raise ValueError('Coherence matrices must have 4 (CP) or 9 (QP) elements, not %d' % elems.shape[1])
+
+  return inv, det
+
+
+# Builds the inverse store of the coherence matrices in elems (one row per superpixel): the weighted inverses
+# w_k * X_k described above, as a real array of the same size as elems. Singular or near-singular matrices, i.e. those
+# whose determinant is below tol times the product of their diagonal elements (at most 1 for a positive definite
+# matrix), and NaN features (e.g., empty superpixels) raise a ValueError that names the offending superpixels.
+def inverse_store(elems, tol=1e-10):
+  elems = np.asarray(elems, dtype=float)
+  diag = elems[:, [0, 2]] if elems.shape[1] == 4 else elems[:, [0, 2, 5]]
+  with np.errstate(invalid='ignore', divide='ignore'):
+    inv, det = coherence_inverses(elems)
+    ratio = det / np.prod(diag, axis=1)
+  bad = np.where(~(np.all(diag > 0, axis=1) & (ratio > tol)))[0]
+  if bad.size > 0:
+    raise ValueError('The coherence matrices of %d superpixel(s) are singular or near-singular (superpixels %s)'
+                     % (bad.size, np.array2string(bad[:20], separator=', ')))
+
+  return inv * TRACE_WEIGHTS[elems.shape[1]]
+
+
+# Calculates the matrix T with T[a, b] = trace(X_a B_b), where X_a are the rows of store_i (an inverse store) and B_b the
+# rows of elems_j. The sum runs over the layout elements in a fixed order, so an element of T does not depend on the
+# block it is computed in.
+def hlt_traces(store_i, elems_j):
+  traces = np.zeros((store_i.shape[0], elems_j.shape[0]))
+  for elem in range(0, store_i.shape[1]):
+    traces += np.outer(store_i[:, elem], elems_j[:, elem])
+  return traces
+
+
+# Calculates the maximum HLT distance (max of trace(A^-1 B) and trace(B^-1 A)) between every superpixel in elems_i and
+# every superpixel in elems_j. Their inverse stores can be passed in if they are already known.
+def max_hlt_distance_block(elems_i, elems_j, store_i=None, store_j=None):
+  if store_i is None:
+    store_i = inverse_store(elems_i)
+  if store_j is None:
+    store_j = inverse_store(elems_j)
+  return np.maximum(hlt_traces(store_i, elems_j), hlt_traces(store_j, elems_i).T)
+
+
+# Calculates the maximum HLT distance between the superpixels idx_i[k] and idx_j[k] (integers or index arrays of the same
+# length) of elems, whose inverse store is store. The result equals the corresponding elements of
+# max_hlt_distance_block bit for bit.
+def max_hlt_pairs(elems, store, idx_i, idx_j):
+  hlt1 = np.zeros(np.shape(idx_i))
+  hlt2 = np.zeros(np.shape(idx_i))
+  for elem in range(0, elems.shape[1]):
+    hlt1 += store[idx_i, elem] * elems[idx_j, elem]
+    hlt2 += store[idx_j, elem] * elems[idx_i, elem]
+  return np.maximum(hlt1, hlt2)
+
+
+# Calculates the squared Euclidean distance between every row of feats_i and every row of feats_j. The sum runs over the
+# features in a fixed order, so an element does not depend on the block it is computed in.
+def euclidean_distance_block(feats_i, feats_j):
+  feats_i = np.asarray(feats_i, dtype=float)
+  feats_j = np.asarray(feats_j, dtype=float)
+  dis = np.zeros((feats_i.shape[0], feats_j.shape[0]))
+  for feat in range(0, feats_i.shape[1]):
+    dis += np.power(np.subtract.outer(feats_i[:, feat], feats_j[:, feat]), 2)
+  return dis
+
+
+# Calculates the squared Euclidean distance between the rows idx_i[k] and idx_j[k] of feats, summing the features in the
+# same order as euclidean_distance_block.
+def euclidean_distance_pairs(feats, idx_i, idx_j):
+  feats = np.asarray(feats, dtype=float)
+  dis = np.zeros(np.shape(idx_i))
+  for feat in range(0, feats.shape[1]):
+    dis += np.power(feats[idx_i, feat] - feats[idx_j, feat], 2)
+  return dis
+
+
+# Calculates the symmetric num*num matrix of maximum HLT distances between the coherence matrices in elems, or only the
+# block given by rows and cols (slices or index arrays of superpixels).
+def max_hlt_distances(elems, rows=slice(None), cols=slice(None), store=None):
+  elems = np.asarray(elems, dtype=float)
+  if store is None:
+    return max_hlt_distance_block(elems[rows], elems[cols])
+  return max_hlt_distance_block(elems[rows], elems[cols], store[rows], store[cols])
@@ -0,0 +1,60 @@
+# Pixel-level prediction of a trained RF or SVM model over a whole scene: the H*W x num_feats features are predicted
+# chunk_rows pixels at a time, so the temporaries of the model (e.g., the kernel rows of an SVM) only exist for one
+# chunk, and the chunks are shared among a pool of worker processes. The predictions are written into the output
+# raster as the chunks come back; it can be an np.memmap, so the predicted image does not have to fit in memory either.
+#
+# As in lgc_classifier/parallel.py, the 'fork' start method is used where it exists, so the workers inherit the model
+# and the features instead of receiving a copy; elsewhere they are sent once to every worker.
+
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+
+_shared = {}  # The model and the features of a worker process (set by _init_worker)
+
+
+def _init_worker(model, feats):
+  _shared['model'] = model
+  _shared['feats'] = feats
+
+
+def _predict_chunk(first_row, last_row):
+  return _shared['model'].predict(_shared['feats'][first_row:last_row])
+
+
+# Predicts model on the rows of feats (num_pixels*num_feats, e.g., re_feat) chunk_rows rows at a time, with
+# num_workers processes (1: in this process), into out: an array (e.g., a np.memmap) of num_pixels elements or of the
+# shape of the image (H x W, filled row-major), created with dtype if None. Returns out and the throughput in pixels
+# per second.
+def predict_in_chunks(model, feats, chunk_rows=2 ** 18, num_workers=1, out=None, dtype=float):
+  num_pixels = feats.shape[0]
+  if out is None:
+    out = np.empty(num_pixels, dtype=dtype)
+  if out.size != num_pixels:
+    raise ValueError('The output has %d elements for %d pixels' % (out.size, num_pixels))
+  flat_out = out.reshape(-1)  # a view, since out is contiguous
+  chunks = [(first_row, min(first_row + chunk_rows, num_pixels)) for first_row in range(0, num_pixels, chunk_rows)]
+
+  start = time.perf_counter()
+  if num_workers <= 1:
+    for first_row, last_row in chunks:
+      flat_out[first_row:last_row] = model.predict(feats[first_row:last_row])
+  else:
+    if 'fork' in multiprocessing.get_all_start_methods():
+      context = multiprocessing.get_context('fork')
+    else:
+      context = multiprocessing.get_context()
+    with ProcessPoolExecutor(max_workers=num_workers, mp_context=context, initializer=_init_worker,
+                             initargs=(model, feats)) as pool:
+      futures = {pool.submit(_predict_chunk, first_row, last_row): (first_row, last_row)
+                 for first_row, last_row in chunks}
+      for future in as_completed(futures):  # re-raises the exceptions of the workers
+        first_row, last_row = futures.pop(future)  # nothing keeps the predictions of a written chunk
+        flat_out[first_row:last_row] = future.result()
+  if isinstance(out, np.memmap):
+    out.flush()
+  elapsed = time.perf_counter() - start
+  return out, num_pixels / max(elapsed, np.finfo(float).tiny)
@@ -0,0 +1,112 @@
+# Per-stage instrumentation of the classification scripts: the wall time, the CPU time (of all the threads of the
+# process, so BLAS threads count) and the peak memory of every stage (load, RAG, superpixel statistics, S_i_w, W, ...),
+# a JSON report of them, progress lines with the rate and the remaining time of the long W loops, and optional
+# cProfile and tracemalloc hooks.
+
+import cProfile
+import json
+import sys
+import time
+import tracemalloc
+
+try:
+  import resource
+except ImportError:  # Windows
+  resource = None
+
+
+# Returns the peak resident memory of the process so far in MB, or None where it is not available.
+def peak_rss_mb():
+  if resource is None:
+    return None
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10  # bytes on macOS, KB elsewhere
+
+
+# Records the stages of a script, which follow one another: stage(name) ends the current stage (if any) and starts the
+# next one, so the sections of a script are instrumented without indenting them. For every stage, the wall time, the
+# CPU time, the peak resident memory of the process at its end and how much the stage raised it are kept, and with
+# trace_memory the peak of the memory traced by tracemalloc (Python and NumPy allocations) during the stage.
+# With profile, the whole run is profiled with cProfile.
+class StageTimer:
+  def __init__(self):
+    self.stages = []
+    self._current = None
+    self._start = (time.perf_counter(), time.process_time())
+    self._profiler = None
+
+  # Starts the cProfile profiler (profile) and the tracing of the memory allocations (trace_memory).
+  def enable_profiling(self, profile=False, trace_memory=False):
+    if profile and self._profiler is None:
+      self._profiler = cProfile.Profile()
+      self._profiler.enable()
+    if trace_memory and not tracemalloc.is_tracing():
+      tracemalloc.start()
+
+  def stage(self, name):
+    self.stop()
+    if tracemalloc.is_tracing():
+      tracemalloc.reset_peak()
+    self._current = {'name': name, 'wall': time.perf_counter(), 'cpu': time.process_time(), 'rss': peak_rss_mb()}
+
+  # Ends the current stage.
+  def stop(self):
+    if self._current is None:
+      return
+    start = self._current
+    self._current = None
+    record = {'stage': start['name'],
+              'wall_time_s': time.perf_counter() - start['wall'],
+              'cpu_time_s': time.process_time() - start['cpu'],
+              'peak_rss_mb': peak_rss_mb()}
+    if record['peak_rss_mb'] is not None:
+      record['peak_rss_increase_mb'] = record['peak_rss_mb'] - start['rss']
+    if tracemalloc.is_tracing():
+      record['traced_peak_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    self.stages.append(record)
+
+  # Ends the current stage, prints a summary of the stages and writes the report (the stages and the totals) to the JSON
+  # file path, and the cProfile statistics next to it (path with .prof, e.g., for snakeviz or pstats). Returns the
+  # report as a dict.
+  def report(self, path=None):
+    self.stop()
+    report = {'stages': self.stages,
+              'total': {'wall_time_s': time.perf_counter() - self._start[0],
+                        'cpu_time_s': time.process_time() - self._start[1],
+                        'peak_rss_mb': peak_rss_mb()}}
+    for record in self.stages:
+      print('{:<24} wall {:9.2f} s  cpu {:9.2f} s  peak memory {}'.format(
+        record['stage'], record['wall_time_s'], record['cpu_time_s'],
+        'n/a' if record['peak_rss_mb'] is None else '{:.0f} MB'.format(record['peak_rss_mb'])))
+
+    if path is not None:
+      with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+      if self._profiler is not None:
+        self._profiler.disable()
+        self._profiler.dump_stats(path.rsplit('.', 1)[0] + '.prof')
+        self._profiler.enable()
+    return report
+
+
+# A progress callback for the W loops: progress(done, total) is called with the number of pairs of superpixels done so
+# far (0 when the loop starts) and in total; a line with the fraction done, the rate and the estimated remaining time
+# is printed at most every interval seconds (and at the end).
+class Progress:
+  def __init__(self, label, interval=10):
+    self.label = label
+    self.interval = interval
+    self._start = None
+    self._last = None
+
+  def __call__(self, done, total):
+    now = time.perf_counter()
+    if done == 0 or self._start is None:
+      self._start = self._last = now
+      return
+    if done < total and now - self._last < self.interval:
+      return
+    self._last = now
+    rate = done / max(now - self._start, 1e-9)
+    print('{}: {:.1%} of {} pairs, {:.3g} pairs/s, ETA {:.0f} s'.format(self.label, done / total, total, rate,
+                                                                       (total - done) / rate), flush=True)
@@ -0,0 +1,184 @@
+# Optional JIT-compiled (numba) kernels of the W and S_i_w loops, selected at runtime with set_backend; the NumPy
+# kernels of lgc_classifier/affinity.py and lgc_classifier/hlt.py stay the default and the fallback. Every kernel is a
+# fused loop over the pairs of superpixels, parallelised over rows: the maximum HLT (or squared Euclidean) distances,
+# the exp weighting and the accumulation are done per pair, without the block-sized temporaries of the NumPy kernels
+# (about ten per block of W). The distances are summed in the same order as in lgc_classifier/hlt.py, so the results
+# equal those of the NumPy backend up to the rounding of exp.
+#
+# numba is only imported when the numba backend is selected, so the runs with the NumPy backend do not pay for it. The
+# kernels below are plain Python functions until then; set_backend compiles them, on their first call, and the machine
+# code is cached on disk (next to this file, or in NUMBA_CACHE_DIR if it is set), so later runs do not pay for the
+# compilation either.
+#
+# The worker processes of lgc_classifier/parallel.py and lgc_classifier/tuning.py are forked, and a process forked
+# after the TBB threads of numba have started can hang when it exits, so the kernels run on the fork-safe 'workqueue'
+# threading layer unless another one is set (NUMBA_THREADING_LAYER).
+
+import importlib.util
+import os
+
+import numpy as np
+
+
+BACKENDS = ('numpy', 'numba')
+_state = {'backend': 'numpy', 'compiled': False}
+
+_JIT_HELPERS = ('_max_hlt', '_squared_distance', '_pair_weight')
+_JIT_KERNELS = ('_affinity_block_kernel', '_affinity_pairs_kernel', '_neighbour_means_kernel')
+_prange = range  # numba.prange in the compiled kernels
+
+
+# Replaces the kernels of this module by their numba versions (the helpers first, since the kernels call them).
+def _compile():
+  import numba
+  if 'NUMBA_THREADING_LAYER' not in os.environ:
+    numba.config.THREADING_LAYER = 'workqueue'
+  module = globals()
+  module['_prange'] = numba.prange
+  for name in _JIT_HELPERS:
+    module[name] = numba.njit(cache=True)(module[name])
+  for name in _JIT_KERNELS:
+    module[name] = numba.njit(parallel=True, cache=True)(module[name])
+  _state['compiled'] = True
+
+
+# Selects the kernel backend: 'numpy', 'numba' or 'auto' (numba if it is installed). num_threads is the number of
+# threads of the numba kernels (by default all the cores). Raises an ImportError for 'numba' without numba.
+def set_backend(backend, num_threads=None):
+  if backend == 'auto':
+    backend = 'numba' if importlib.util.find_spec('numba') is not None else 'numpy'
+  if backend not in BACKENDS:
+    raise ValueError("Unknown kernel backend '%s' (use 'numpy', 'numba' or 'auto')" % backend)
+  if backend == 'numba':
+    if importlib.util.find_spec('numba') is None:
+      raise ImportError("The 'numba' kernel backend needs the numba package, which is not installed; install it "
+                        "(pip install numba) or select the 'numpy' or 'auto' backend")
+    if not _state['compiled']:
+      _compile()
+    if num_threads is not None:
+      import numba
+      numba.set_num_threads(num_threads)
+  _state['backend'] = backend
+
+
+def get_backend():
+  return _state['backend']
+
+
+# Whether the numba kernels are to be used.
+def use_jit():
+  return _state['backend'] == 'numba'
+
+
+# The maximum HLT distance between two coherence matrices (rows of elements and of the inverse store).
+def _max_hlt(elems_i, store_i, elems_j, store_j):
+  hlt1 = 0.0
+  hlt2 = 0.0
+  for elem in range(elems_i.shape[0]):
+    hlt1 += store_i[elem] * elems_j[elem]
+    hlt2 += store_j[elem] * elems_i[elem]
+  return max(hlt1, hlt2)
+
+
+def _squared_distance(feats_i, feats_j):
+  dis = 0.0
+  for feat in range(feats_i.shape[0]):
+    dis += (feats_i[feat] - feats_j[feat]) ** 2
+  return dis
+
+
+# The weight s * l of affinity_block between the superpixels i and j; s_scale is 2 * SIGMA_S^2 and l_scale 2 * SIGMA_L^2.
+def _pair_weight(S_i_m, S_i_w, S_i_p, store_m, store_w, i, j, BETA, s_scale, l_scale, complex_only):
+  if complex_only:
+    dis_w = _max_hlt(S_i_w[i], store_w[i], S_i_w[j], store_w[j])
+    dis_m = _max_hlt(S_i_m[i], store_m[i], S_i_m[j], store_m[j])
+  else:
+    dis_w = _squared_distance(S_i_w[i], S_i_w[j])
+    dis_m = _squared_distance(S_i_m[i], S_i_m[j])
+  s = np.exp(((BETA - 1) * dis_w) - (BETA * dis_m) / s_scale)
+  return s * np.exp(-_squared_distance(S_i_p[i], S_i_p[j]) / l_scale)
+
+
+# Writes the weights between the superpixels rows[r] and cols[c] to out[r, c]; with upper, only those with
+# cols[c] > rows[r] are calculated and the others are set to zero (the upper triangle of full_affinity).
+def _affinity_block_kernel(S_i_m, S_i_w, S_i_p, store_m, store_w, rows, cols, BETA, s_scale, l_scale, complex_only,
+                           upper, out):
+  for r in _prange(rows.shape[0]):
+    for c in range(cols.shape[0]):
+      if upper and cols[c] <= rows[r]:
+        out[r, c] = 0.0
+      else:
+        out[r, c] = _pair_weight(S_i_m, S_i_w, S_i_p, store_m, store_w, rows[r], cols[c], BETA, s_scale, l_scale,
+                                 complex_only)
+
+
+def _affinity_pairs_kernel(S_i_m, S_i_w, S_i_p, store_m, store_w, idx_i, idx_j, BETA, s_scale, l_scale, complex_only,
+                           out):
+  for k in _prange(idx_i.shape[0]):
+    out[k] = _pair_weight(S_i_m, S_i_w, S_i_p, store_m, store_w, idx_i[k], idx_j[k], BETA, s_scale, l_scale,
+                          complex_only)
+
+
+# Adds to out[i] the normalized weighted S_i_m of the neighbours of i (the CSR indptr and indices of the adjacency).
+def _neighbour_means_kernel(S_i_m, store_m, indptr, indices, WEIGHT_SCALAR, complex_only, out):
+  for i in _prange(indptr.shape[0] - 1):
+    first, last = indptr[i], indptr[i + 1]
+    weights = np.empty(last - first)
+    sum_w = 0.0
+    for k in range(first, last):
+      j = indices[k]
+      if complex_only:
+        dis = _max_hlt(S_i_m[i], store_m[i], S_i_m[j], store_m[j])
+      else:
+        dis = _squared_distance(S_i_m[i], S_i_m[j])
+      weights[k - first] = np.exp(- dis / WEIGHT_SCALAR)
+      sum_w += weights[k - first]
+    for k in range(first, last):
+      w = weights[k - first] / sum_w
+      for feat in range(S_i_m.shape[1]):
+        out[i, feat] += w * S_i_m[indices[k], feat]
+
+
+# Returns the features and the inverse stores as contiguous float64 arrays (the stores are replaced by S_i_m when the
+# distances are Euclidean, since the kernels need arrays).
+def _kernel_arrays(S_i_m, S_i_w, S_i_p, store_m, store_w, complex_only):
+  arrays = [np.ascontiguousarray(feats, dtype=float) for feats in (S_i_m, S_i_w, S_i_p)]
+  if complex_only:
+    arrays += [np.ascontiguousarray(store, dtype=float) for store in (store_m, store_w)]
+  else:
+    arrays += [arrays[0], arrays[0]]
+  return arrays
+
+
+# The numba version of affinity.affinity_block (store_m and store_w are required when complex_only is True). With
+# upper, only the pairs of the upper triangle of W are calculated (see _affinity_block_kernel). out is an optional
+# len(rows)*len(cols) array (e.g., a view of W) that the weights are written to.
+def affinity_block(S_i_m, S_i_w, S_i_p, rows, cols, BETA, SIGMA_S, SIGMA_L, complex_only, store_m=None, store_w=None,
+                   upper=False, out=None):
+  all_sp = np.arange(S_i_m.shape[0])
+  rows, cols = all_sp[rows], all_sp[cols]
+  if out is None:
+    out = np.empty((rows.size, cols.size))
+  _affinity_block_kernel(*_kernel_arrays(S_i_m, S_i_w, S_i_p, store_m, store_w, complex_only), rows, cols, BETA,
+                         2 * np.power(SIGMA_S, 2), 2 * np.power(SIGMA_L, 2), complex_only, upper, out)
+  return out
+
+
+# The numba version of affinity.affinity_pairs.
+def affinity_pairs(S_i_m, S_i_w, S_i_p, idx_i, idx_j, BETA, SIGMA_S, SIGMA_L, complex_only, store_m=None,
+                   store_w=None):
+  idx_i, idx_j = np.broadcast_arrays(np.atleast_1d(idx_i), np.atleast_1d(idx_j))
+  out = np.empty(idx_i.shape[0])
+  _affinity_pairs_kernel(*_kernel_arrays(S_i_m, S_i_w, S_i_p, store_m, store_w, complex_only),
+                         np.ascontiguousarray(idx_i), np.ascontiguousarray(idx_j), BETA, 2 * np.power(SIGMA_S, 2),
+                         2 * np.power(SIGMA_L, 2), complex_only, out)
+  return out
+
+
+# The numba version of affinity.weighted_neighbour_means (adjacency is a CSR matrix).
+def weighted_neighbour_means(S_i_m, adjacency, WEIGHT_SCALAR, complex_only, store_m=None):
+  S_i_m = np.ascontiguousarray(S_i_m, dtype=float)
+  store_m = S_i_m if store_m is None else np.ascontiguousarray(store_m, dtype=float)
+  out = np.zeros(S_i_m.shape)
+  _neighbour_means_kernel(S_i_m, store_m, adjacency.indptr, adjacency.indices, float(WEIGHT_SCALAR), complex_only, out)
+  return out
@@ -0,0 +1,110 @@
+# Low-rank (Nystrom) approximation of the full spatial correlation W for scenes with many superpixels: the affinities
+# (those of affinity_block, HLT and spatial) are only calculated between all the superpixels and m anchor superpixels,
+# C = W[:, anchors], and W is approximated by C * A^-1 * C^T with A = W[anchors, anchors], without its diagonal. This
+# takes O(N * m) memory and time instead of O(N^2), and F is obtained from the factorization with the Woodbury identity
+# in O(N * m^2) instead of solving an N*N system (Williams and Seeger, 2001, "Using the Nystrom Method to Speed Up
+# Kernel Machines").
+
+import numpy as np
+from scipy.cluster.vq import kmeans2
+from scipy.spatial import cKDTree
+
+from lgc_classifier.hlt import inverse_store
+from lgc_classifier.affinity import affinity_block
+from lgc_classifier.solver import degree_vector, sp_classes
+
+
+# Returns the sorted labels of about num_anchors anchor superpixels, either sampled uniformly ('random') or ('kmeans')
+# the superpixels closest to the centres of num_anchors k-means clusters of the standardized S_i_m and S_i_p (fewer
+# if several centres share their closest superpixel). random_state is the seed of the sampling or of the k-means.
+def select_anchors(S_i_m, S_i_p, num_anchors, sampling='kmeans', random_state=None):
+  num_sup_pixels = S_i_m.shape[0]
+  num_anchors = min(num_anchors, num_sup_pixels)
+  if sampling == 'random':
+    return np.sort(np.random.default_rng(random_state).choice(num_sup_pixels, num_anchors, replace=False))
+  if sampling != 'kmeans':
+    raise ValueError("Unknown anchor sampling '%s' (use 'kmeans' or 'random')" % sampling)
+
+  points = np.hstack([np.asarray(S_i_m, dtype=float), np.asarray(S_i_p, dtype=float)])
+  scale = np.std(points, axis=0)
+  points = (points - np.mean(points, axis=0)) / np.where(scale > 0, scale, 1)
+  centres = kmeans2(points, num_anchors, minit='++', seed=random_state)[0]
+  return np.unique(cKDTree(points).query(centres)[1])
+
+
+# The approximation W ~ factor * factor^T - diag(diagonal) of the W of full_affinity. factor (N*k, k <= m) is
+# C * V * diag(eig_vals)^-1/2, where eig_vals and V are the eigenvalues and eigenvectors of A that are above tol times
+# the largest one, and diagonal removes the diagonal of factor * factor^T, since W has none. It offers what the LGC
+# solver needs from W (shape, sum(axis=1) and W @ P), so lgc_solve ('cg', 'propagation') and lgc_miu_sweep (with
+# num_eigs) can use it as well as nystrom_lgc_solve.
+class NystromAffinity:
+  def __init__(self, S_i_m, S_i_w, S_i_p, BETA, SIGMA_S, SIGMA_L, complex_only, num_anchors, sampling='kmeans',
+               random_state=None, block_rows=4096, tol=1e-10, store_m=None, store_w=None):
+    num_sup_pixels = S_i_m.shape[0]
+    if complex_only:
+      if store_m is None:
+        store_m = inverse_store(S_i_m)
+      if store_w is None:
+        store_w = inverse_store(S_i_w)
+    self.shape = (num_sup_pixels, num_sup_pixels)
+    self.anchors = select_anchors(S_i_m, S_i_p, num_anchors, sampling, random_state)
+
+    C = np.empty((num_sup_pixels, self.anchors.size))
+    for first_row in range(0, num_sup_pixels, block_rows):
+      rows = slice(first_row, min(first_row + block_rows, num_sup_pixels))
+      C[rows] = affinity_block(S_i_m, S_i_w, S_i_p, rows, self.anchors, BETA, SIGMA_S, SIGMA_L, complex_only, store_m,
+                               store_w)
+
+    eig_vals, eig_vecs = np.linalg.eigh(C[self.anchors])
+    keep = eig_vals > tol * np.max(eig_vals)
+    self.factor = C @ (eig_vecs[:, keep] / np.sqrt(eig_vals[keep]))
+    self.diagonal = np.sum(self.factor ** 2, axis=1)
+
+  def sum(self, axis=1):
+    if axis != 1:
+      raise ValueError('W is symmetric; only the row sums (axis=1) are provided')
+    return self.factor @ np.sum(self.factor, axis=0) - self.diagonal
+
+  def __matmul__(self, P):
+    P = np.asarray(P)
+    diagonal = self.diagonal.reshape((-1,) + (1,) * (P.ndim - 1))
+    return self.factor @ (self.factor.T @ P) - diagonal * P
+
+  # Forms the approximate N*N W in memory (only for small scenes).
+  def toarray(self):
+    W = self.factor @ self.factor.T
+    W[np.diag_indices_from(W)] = 0
+    return W
+
+
+# Calculates F = beta_f * (I - alfa_f * S)^-1 * Y (as lgc_solve) for the approximation W (a NystromAffinity) directly
+# from its factorization: with V = D^-1/2 * factor and M = I + alfa_f * D^-1 * diag(diagonal), I - alfa_f * S equals
+# M - alfa_f * V * V^T, whose inverse is M^-1 + alfa_f * M^-1 * V * (I - alfa_f * V^T * M^-1 * V)^-1 * V^T * M^-1
+# (Woodbury), so only a k*k system is solved. d is the optional diagonal of D. Returns F and the dict of lgc_solve.
+def nystrom_lgc_solve(W, Y, MIU, d=None):
+  beta_f = MIU / (MIU + 1)
+  alfa_f = 1 - beta_f
+
+  if d is None:
+    d = degree_vector(W)
+  B = beta_f * np.asarray(Y, dtype=float)
+  V = W.factor / np.sqrt(d)[:, None]
+  inv_M = 1 / (1 + alfa_f * W.diagonal / d)
+
+  inv_M_B = inv_M[:, None] * B
+  inner = np.identity(V.shape[1]) - alfa_f * (V.T @ (inv_M[:, None] * V))
+  F = inv_M_B + alfa_f * (inv_M[:, None] * (V @ np.linalg.solve(inner, V.T @ inv_M_B)))
+
+  inv_sqrt_d = (1 / np.sqrt(d))[:, None]
+  b_norm = np.linalg.norm(B, axis=0)
+  b_norm[b_norm == 0] = 1
+  residual = np.max(np.linalg.norm(B - (F - alfa_f * inv_sqrt_d * (W @ (inv_sqrt_d * F))), axis=0) / b_norm)
+  return F, {'method': 'nystrom', 'iterations': 0, 'residual': residual}
+
+
+# Compares the approximate soft labels F with those of the exact solve, F_exact. Returns the relative (Frobenius)
+# difference ||F - F_exact|| / ||F_exact|| and the fraction of superpixels predicted the same class (by sp_classes).
+def compare_to_exact(F, F_exact):
+  relative_difference = np.linalg.norm(F - F_exact) / max(np.linalg.norm(F_exact), np.finfo(float).tiny)
+  agreement = np.mean(sp_classes(F) == sp_classes(F_exact))
+  return relative_difference, agreement
@@ -0,0 +1,104 @@
+# Out-of-core storage of the dense affinity matrix W for the full spatial correlation mode: W is written tile by tile
+# into a memory-mapped file and the LGC solver streams over its rows, so the memory used is bounded by a budget instead
+# of by num_sup_pixels^2.
+
+import numpy as np
+
+from lgc_classifier.hlt import inverse_store
+from lgc_classifier.affinity import affinity_block
+
+
+# Returns the tile size t for which the mapped rows and columns of a tile (2 * t * n float64) and the temporaries of
+# affinity_block (about 8 * t * t float64) fit in memory_budget bytes.
+def _tile_size(n, memory_budget):
+  t = (-16 * n + np.sqrt(256. * n * n + 256. * memory_budget)) / 128  # root of 64 t^2 + 16 n t = memory_budget
+  return int(max(1, min(n, np.floor(t))))
+
+
+# Returns the number of pairs of superpixels (r < c) in the tile rows*cols of the upper triangle.
+def _tile_pairs(rows, cols):
+  if rows.start == cols.start:
+    return (rows.stop - rows.start) * (rows.stop - rows.start - 1) // 2
+  return (rows.stop - rows.start) * (cols.stop - cols.start)
+
+
+# The dense, symmetric W stored row-major as float64 in the file path. It offers what the LGC solver needs from W
+# (shape, sum(axis=1) and W @ P) and reads block_rows rows at a time; each block is mapped only while it is used.
+class MemmapAffinity:
+  def __init__(self, path, num_sup_pixels, memory_budget=2 ** 30):
+    self.path = path
+    self.shape = (num_sup_pixels, num_sup_pixels)
+    self.dtype = np.dtype(np.float64)
+    self.block_rows = int(max(1, min(num_sup_pixels, memory_budget // (2 * 8 * num_sup_pixels))))
+
+  # Maps the rows [first_row, last_row) of W (read-only).
+  def rows(self, first_row, last_row):
+    return np.memmap(self.path, dtype=self.dtype, mode='r', offset=first_row * self.shape[1] * 8,
+                     shape=(last_row - first_row, self.shape[1]))
+
+  # Yields (first_row, last_row, block) for consecutive blocks of rows of W.
+  def row_blocks(self):
+    for first_row in range(0, self.shape[0], self.block_rows):
+      last_row = min(first_row + self.block_rows, self.shape[0])
+      block = self.rows(first_row, last_row)
+      yield first_row, last_row, block
+      del block
+
+  def sum(self, axis=1):
+    if axis != 1:
+      raise ValueError('W is symmetric; only the row sums (axis=1) are provided')
+    sums = np.zeros(self.shape[0])
+    for first_row, last_row, block in self.row_blocks():
+      sums[first_row:last_row] = np.sum(block, axis=1)
+    return sums
+
+  def __matmul__(self, P):
+    P = np.asarray(P)
+    product = np.zeros((self.shape[0],) + P.shape[1:])
+    for first_row, last_row, block in self.row_blocks():
+      product[first_row:last_row] = block @ P
+    return product
+
+  # Loads the whole W in memory.
+  def toarray(self):
+    return np.array(self.rows(0, self.shape[0]))
+
+
+# Builds the same W as full_affinity in the file path and returns it as a MemmapAffinity. The upper triangle is
+# calculated in square tiles whose size follows from memory_budget (bytes); every tile is written together with its
+# transpose, and the file is mapped again for every row of tiles so that written pages do not accumulate in memory.
+# progress is an optional callback progress(done, total) with the number of pairs calculated.
+def memmap_affinity(S_i_m, S_i_w, S_i_p, BETA, SIGMA_S, SIGMA_L, complex_only, path, memory_budget=2 ** 30,
+                    store_m=None, store_w=None, progress=None):
+  num_sup_pixels = S_i_m.shape[0]
+  if complex_only:
+    if store_m is None:
+      store_m = inverse_store(S_i_m)
+    if store_w is None:
+      store_w = inverse_store(S_i_w)
+
+  tile = _tile_size(num_sup_pixels, memory_budget)
+  with open(path, 'wb') as f:
+    f.truncate(num_sup_pixels * num_sup_pixels * 8)
+
+  total_pairs, done_pairs = num_sup_pixels * (num_sup_pixels - 1) // 2, 0
+  if progress is not None:
+    progress(0, total_pairs)
+  for first_row in range(0, num_sup_pixels, tile):
+    rows = slice(first_row, min(first_row + tile, num_sup_pixels))
+    W = np.memmap(path, dtype=np.float64, mode='r+', shape=(num_sup_pixels, num_sup_pixels))
+    for first_col in range(first_row, num_sup_pixels, tile):
+      cols = slice(first_col, min(first_col + tile, num_sup_pixels))
+      block = affinity_block(S_i_m, S_i_w, S_i_p, rows, cols, BETA, SIGMA_S, SIGMA_L, complex_only, store_m, store_w)
+      if first_col == first_row:
+        np.fill_diagonal(block, 0)
+      W[rows, cols] = block
+      if first_col != first_row:
+        W[cols, rows] = block.T
+      if progress is not None:
+        done_pairs += _tile_pairs(rows, cols)
+        progress(done_pairs, total_pairs)
+    W.flush()
+    del W
+
+  return MemmapAffinity(path, num_sup_pixels, memory_budget)
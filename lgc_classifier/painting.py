@@ -0,0 +1,30 @@
+# Painting of per-superpixel values (predicted classes, train labels, ...) into an image of the size of the
+# oversegmentation: the values are put in a lookup table indexed by the superpixel label and the image is obtained with
+# one gather over the labels, instead of one np.where(labels == num_sp) scan of the whole image per superpixel.
+
+import numpy as np
+
+
+# Returns the image (HxW) in which the pixels of superpixel i (labels 0 to num_sup_pixels - 1) have the value
+# values[i]. The other pixels (land or masked areas) get fill or, with fill None, keep their label. dtype is that of
+# the image (by default that of values, or of labels with fill None). With out (e.g., a np.memmap of the shape of
+# labels), the image is written there instead, block_rows rows at a time, and out is returned.
+def paint_superpixels(labels, values, num_sup_pixels, fill=None, dtype=None, out=None, block_rows=512):
+  values = np.asarray(values)[:num_sup_pixels]
+  if dtype is None:
+    dtype = labels.dtype if fill is None else values.dtype
+  table = np.empty(num_sup_pixels + 1, dtype=dtype)  # the last entry is the one of the land (and masked) areas
+  table[:num_sup_pixels] = values
+  table[num_sup_pixels] = 0 if fill is None else fill
+  if out is None:
+    out = np.empty(labels.shape, dtype=dtype)
+
+  for first_row in range(0, labels.shape[0], block_rows):
+    label_block = labels[first_row:first_row + block_rows]
+    painted = table[np.minimum(label_block, num_sup_pixels)]
+    if fill is None:
+      painted = np.where(label_block < num_sup_pixels, painted, label_block)
+    out[first_row:first_row + label_block.shape[0]] = painted
+  if isinstance(out, np.memmap):
+    out.flush()
+  return out
@@ -0,0 +1,155 @@
+# Parallel construction of the full spatial correlation W: the upper-triangle tiles of W are calculated by a pool of
+# worker processes. S_i_m, S_i_w, S_i_p (and the inverse stores) are placed in shared memory once, and every worker
+# writes its tiles (and their transposes) directly into a shared output buffer or into the memory-mapped file of an
+# out-of-core W. Every element is calculated exactly as in full_affinity, so the result is the same bit for bit.
+#
+# Where the 'fork' start method exists (Linux, macOS) it is used, so the classifier scripts are not re-run by the
+# workers, and the output buffer is an anonymous shared mapping that the workers inherit and that is returned as W
+# itself (it is freed with W), so W is held in memory only once. Elsewhere (Windows) the calling script must be
+# protected by if __name__ == '__main__', and W is copied out of a shared memory block.
+
+import mmap
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from lgc_classifier.hlt import inverse_store
+from lgc_classifier.affinity import affinity_block
+from lgc_classifier.outofcore import MemmapAffinity, _tile_size, _tile_pairs
+
+
+_shared = {}  # The arrays and parameters shared with a worker process (set by _init_worker)
+
+
+# Copies array into a new shared memory block. Returns the block and its descriptor (name, shape, dtype).
+def _share(array):
+  array = np.ascontiguousarray(array)
+  shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+  np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+  return shm, (shm.name, array.shape, array.dtype.str)
+
+
+# Attaches to the shared memory block of descriptor. The creating process owns the block and unlinks it; the workers
+# use the resource tracker of that process, for which registering the block again is harmless. Returns the block and
+# the array view on it.
+def _attach(descriptor):
+  name, shape, dtype = descriptor
+  try:
+    shm = shared_memory.SharedMemory(name=name, track=False)
+  except TypeError:  # Python < 3.13 has no track argument
+    shm = shared_memory.SharedMemory(name=name)
+  return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _init_worker(descriptors, output, params):
+  for key, descriptor in descriptors.items():
+    _shared['shm_' + key], _shared[key] = _attach(descriptor)
+  if output[0] == 'shm':
+    _shared['shm_W'], _shared['W'] = _attach(output[1])
+  elif output[0] == 'inherited':
+    _shared['W'] = output[1]
+  _shared['output'] = output
+  _shared['params'] = params
+
+
+# Calculates the tile of W with the rows [first_row, first_row + tile) and columns [first_col, first_col + tile) and
+# writes it, and its transpose, into the output.
+def _affinity_tile(first_row, first_col, tile):
+  BETA, SIGMA_S, SIGMA_L, complex_only = _shared['params']
+  num_sup_pixels = _shared['S_i_m'].shape[0]
+  rows = slice(first_row, min(first_row + tile, num_sup_pixels))
+  cols = slice(first_col, min(first_col + tile, num_sup_pixels))
+
+  block = affinity_block(_shared['S_i_m'], _shared['S_i_w'], _shared['S_i_p'], rows, cols, BETA, SIGMA_S, SIGMA_L,
+                         complex_only, _shared.get('store_m'), _shared.get('store_w'))
+  if first_col == first_row:
+    np.fill_diagonal(block, 0)
+
+  if _shared['output'][0] != 'file':
+    W = _shared['W']
+  else:
+    W = np.memmap(_shared['output'][1], dtype=np.float64, mode='r+', shape=(num_sup_pixels, num_sup_pixels))
+  W[rows, cols] = block
+  if first_col != first_row:
+    W[cols, rows] = block.T
+  if _shared['output'][0] == 'file':
+    W.flush()
+    del W
+
+
+# Builds the same W as full_affinity (path None) or memmap_affinity (path given) with num_workers processes. tile is
+# the size of the square tiles handed to the workers; with path, it follows from memory_budget per worker by default.
+# Returns W as an array, or as a MemmapAffinity with path. progress is an optional callback progress(done, total) with
+# the number of pairs calculated.
+def parallel_affinity(S_i_m, S_i_w, S_i_p, BETA, SIGMA_S, SIGMA_L, complex_only, num_workers, tile=None, path=None,
+                      memory_budget=2 ** 30, store_m=None, store_w=None, progress=None):
+  num_sup_pixels = S_i_m.shape[0]
+  if complex_only:
+    if store_m is None:
+      store_m = inverse_store(S_i_m)
+    if store_w is None:
+      store_w = inverse_store(S_i_w)
+  if tile is None:
+    tile = 256 if path is None else _tile_size(num_sup_pixels, memory_budget)
+
+  inputs = {'S_i_m': np.asarray(S_i_m, dtype=float), 'S_i_w': np.asarray(S_i_w, dtype=float), 'S_i_p': S_i_p}
+  if complex_only:
+    inputs['store_m'] = store_m
+    inputs['store_w'] = store_w
+
+  blocks = []
+  try:
+    descriptors = {}
+    for key, array in inputs.items():
+      shm, descriptors[key] = _share(array)
+      blocks.append(shm)
+
+    if 'fork' in multiprocessing.get_all_start_methods():
+      context = multiprocessing.get_context('fork')
+    else:
+      context = multiprocessing.get_context()
+
+    if path is not None:
+      with open(path, 'wb') as f:
+        f.truncate(num_sup_pixels * num_sup_pixels * 8)
+      output = ('file', path)
+    elif context.get_start_method() == 'fork':
+      # initargs are not pickled for forked workers, so they get the array on the mapping itself
+      W = np.frombuffer(mmap.mmap(-1, max(num_sup_pixels * num_sup_pixels * 8, 1)), dtype=np.float64,
+                        count=num_sup_pixels * num_sup_pixels).reshape(num_sup_pixels, num_sup_pixels)
+      output = ('inherited', W)
+    else:
+      shm_W = shared_memory.SharedMemory(create=True, size=max(num_sup_pixels * num_sup_pixels * 8, 1))
+      blocks.append(shm_W)
+      output = ('shm', (shm_W.name, (num_sup_pixels, num_sup_pixels), '<f8'))
+    tiles = [(first_row, first_col) for first_row in range(0, num_sup_pixels, tile)
+             for first_col in range(first_row, num_sup_pixels, tile)]
+    with ProcessPoolExecutor(max_workers=num_workers, mp_context=context, initializer=_init_worker,
+                             initargs=(descriptors, output, (BETA, SIGMA_S, SIGMA_L, complex_only))) as pool:
+      total_pairs, done_pairs = num_sup_pixels * (num_sup_pixels - 1) // 2, 0
+      if progress is not None:
+        progress(0, total_pairs)
+      futures = [(first_row, first_col, pool.submit(_affinity_tile, first_row, first_col, tile))
+                 for first_row, first_col in tiles]
+      for first_row, first_col, future in futures:
+        future.result()  # re-raises the exceptions of the workers
+        if progress is not None:
+          done_pairs += _tile_pairs(slice(first_row, min(first_row + tile, num_sup_pixels)),
+                                    slice(first_col, min(first_col + tile, num_sup_pixels)))
+          progress(done_pairs, total_pairs)
+
+    if output[0] == 'inherited':
+      return W
+    if output[0] == 'shm':
+      W_shared = np.ndarray((num_sup_pixels, num_sup_pixels), dtype=np.float64, buffer=shm_W.buf)
+      W = W_shared.copy()
+      del W_shared
+      return W
+    return MemmapAffinity(path, num_sup_pixels, memory_budget)
+
+  finally:
+    for shm in blocks:
+      shm.close()
+      shm.unlink()
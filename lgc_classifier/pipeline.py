@@ -0,0 +1,300 @@
+# The stages of the classification scripts as functions, so that a scene can be classified, or a stage reused, from
+# Python without running a script (which asks for its folders and runs everything when it is imported):
+#
+#   labels = load_segmentation(input_directory)                     # load inputs
+#   feats = load_features(input_directory + 'SV.tif', stokes=True)
+#   num_sup_pixels, there_is_land, adjacency = build_graph(labels)  # build the graph
+#   S_i_m, S_i_p, store_m = compute_statistics(labels, num_sup_pixels, feats, True)
+#   S_i_w = weighted_neighbour_means(S_i_m, adjacency, WEIGHT_SCALAR, True, store_m=store_m)
+#   W = build_affinity(S_i_m, S_i_w, S_i_p, BETA, SIGMA_S, SIGMA_L, True, store_m=store_m)
+#   Y = initial_labels(labels, load_samples(labels_directory + 'labels.csv'), num_sup_pixels)
+#   F = solve_lgc(W, Y, MIU)[0]                                      # solve
+#   predicted_labels = predict_labels(labels, F, num_sup_pixels)    # predict
+#   evaluation = evaluate(predicted_labels, load_samples(input_directory + 'labels_test.csv'))
+#   save_images([('Predicted', predicted_labels, 'plasma')], output_directory)   # render
+#
+# Only NumPy and SciPy are imported with this module: the plotting (matplotlib), the region adjacency graph display
+# (skimage) and the TIFF reader are imported by the stages that use them, and the evaluation does not need scikit-learn.
+
+import numpy as np
+import scipy.io
+
+from lgc_classifier.superpixels import LAND_LABEL, count_superpixels, superpixel_statistics
+from lgc_classifier.adjacency import region_adjacency
+from lgc_classifier.affinity import full_affinity, knn_affinity
+from lgc_classifier.outofcore import memmap_affinity
+from lgc_classifier.parallel import parallel_affinity
+from lgc_classifier.lowrank import NystromAffinity, nystrom_lgc_solve
+from lgc_classifier.hlt import inverse_store
+from lgc_classifier.solver import lgc_solve, sp_classes
+from lgc_classifier.painting import paint_superpixels
+from lgc_classifier.evaluation import test_sample_labels, confusion_matrix, cohen_kappa, accuracy
+from lgc_classifier.preprocessing import stokes_to_coherence, normalize_features, replace_nan, preprocess_features
+
+
+# The column of Y of the labels exported from MAGIC (15: OW, 1: NI, 3: YI, 6: FYI, 12: MYI) for 4 and 3 classes
+SEA_ICE_CLASSES = {4: {15: 0, 1: 0, 3: 1, 6: 2, 12: 3},
+                   3: {3: 0, 6: 1, 12: 2}}
+
+# The colours of the classes (the first one is that of the unlabelled pixels) of the train and test images
+CLASS_COLORS = [(1, 1, 1), (12 / 255, 7 / 255, 134 / 255), (155 / 255, 23 / 255, 158 / 255),
+                (236 / 255, 120 / 255, 83 / 255), (239 / 255, 248 / 255, 33 / 255)]
+
+
+# Returns the oversegmentation (HxW) in irgs_to_slic.mat of input_directory (see the scripts for how it is obtained);
+# the land areas are labelled LAND_LABEL.
+def load_segmentation(input_directory):
+  return scipy.io.loadmat(input_directory + 'irgs_to_slic.mat')['irgs_to_slic']
+
+
+# Returns the preprocessed features of the TIFF file path: with stokes, the CP Stokes vector (SV.tif) converted to the
+# coherence matrix elements; with intensities, only the diagonal elements of a CP or QP coherence matrix file (C.tif).
+# replace_nans, normalize and dtype are those of preprocess_features. With stream, the file is only opened and is read
+# block by block when it is used (e.g., by superpixel_statistics); the ranges of the normalization then take one pass.
+def load_features(path, stokes=False, intensities=False, replace_nans=False, normalize=False, dtype=None,
+                  stream=False):
+  from lgc_classifier.tiffstream import TiffFeatures, MappedFeatures, channel_ranges
+
+  channels = None
+  if intensities:
+    channels = [0, 2, 5] if TiffFeatures(path).shape[2] == 9 else [0, 2]
+
+  if stream:
+    def first_pass(feat_block):  # as the first pass of preprocess_features, so the ranges do not see the NaN values
+      if stokes:
+        feat_block = stokes_to_coherence(feat_block)  # c11, c12_real, c22, c12_imag
+      elif intensities:
+        feat_block = feat_block.astype(float)
+      return replace_nan(feat_block) if replace_nans else feat_block
+
+    feats = TiffFeatures(path, channels=channels)
+    if stokes or intensities or replace_nans:
+      feats = MappedFeatures(feats, first_pass, 4 if stokes else None)
+    if normalize:
+      min_f, max_f = channel_ranges(feats)
+      if replace_nans:
+        feats = MappedFeatures(feats, lambda feat_block: replace_nan(normalize_features(feat_block, min_f, max_f)))
+      else:
+        feats = MappedFeatures(feats, lambda feat_block: normalize_features(feat_block, min_f, max_f))
+    return feats
+
+  import tifffile as tiff
+  feats = tiff.imread(path)
+  if intensities:
+    feats = feats[:, :, channels].astype(float)
+  # block by block and in place (unless dtype differs from the data type of the features)
+  return preprocess_features(feats, stokes=stokes, replace_nans=replace_nans, normalize=normalize, dtype=dtype)
+
+
+# Returns the rows (label, column number, row number) of a csv file of samples (labels.csv, labels_test.csv).
+def load_samples(path):
+  return np.genfromtxt(path, dtype='int', delimiter=',')
+
+
+# Returns the number of superpixels of the oversegmentation labels, whether there are land areas and the sparse
+# adjacency of the superpixels (8-connectivity, as in a RAG; land areas are not neighbours).
+def build_graph(labels):
+  num_sup_pixels, there_is_land = count_superpixels(labels)
+  return num_sup_pixels, there_is_land, region_adjacency(labels, num_sup_pixels)
+
+
+# Returns S_i_m (the mean features of the superpixels), S_i_p (their centroids, as integers) and, with complex_only,
+# the inverse store of S_i_m (None otherwise), in which singular coherence matrices are reported.
+def compute_statistics(labels, num_sup_pixels, feats, complex_only):
+  sp_counts, sp_centroids, S_i_m = superpixel_statistics(labels, num_sup_pixels, feats)  # one pass over the image
+  S_i_p = sp_centroids.astype(int)  # mean of rows and mean of cols
+  store_m = inverse_store(S_i_m) if complex_only else None
+  return S_i_m, S_i_p, store_m
+
+
+# Returns W: with K_NN, the sparse W of the K_NN spatially nearest superpixels; otherwise that of a full spatial
+# correlation effect, as the Nystrom approximation with low_rank_anchors anchors, from the distances of a parameter
+# sweep (a SuperpixelDistances) if given, out of core in memmap_file (with memory_budget bytes in memory), or built by
+# num_workers processes. progress is the callback of the W loops (lgc_classifier/instrumentation.Progress).
+def build_affinity(S_i_m, S_i_w, S_i_p, BETA, SIGMA_S, SIGMA_L, complex_only, K_NN=None, low_rank_anchors=None,
+                   low_rank_sampling='kmeans', distances=None, memmap_file=None, memory_budget=2 ** 31, num_workers=1,
+                   store_m=None, store_w=None, progress=None):
+  if complex_only:
+    if store_m is None:
+      store_m = inverse_store(S_i_m)
+    if store_w is None:
+      store_w = inverse_store(S_i_w)
+
+  if low_rank_anchors is not None and K_NN is None:  # W is only kept as its low-rank factorization
+    return NystromAffinity(S_i_m, S_i_w, S_i_p, BETA, SIGMA_S, SIGMA_L, complex_only, low_rank_anchors,
+                           low_rank_sampling, store_m=store_m, store_w=store_w)
+  if distances is not None and memmap_file is None:
+    return distances.affinity(BETA, SIGMA_S, SIGMA_L)
+  if K_NN is not None:
+    return knn_affinity(S_i_m, S_i_w, S_i_p, K_NN, BETA, SIGMA_S, SIGMA_L, complex_only, store_m=store_m,
+                        store_w=store_w)
+  if num_workers > 1:  # the tiles of W are shared among num_workers processes; the result is the same
+    return parallel_affinity(S_i_m, S_i_w, S_i_p, BETA, SIGMA_S, SIGMA_L, complex_only, num_workers, path=memmap_file,
+                             memory_budget=memory_budget, store_m=store_m, store_w=store_w, progress=progress)
+  if memmap_file is None:
+    return full_affinity(S_i_m, S_i_w, S_i_p, BETA, SIGMA_S, SIGMA_L, complex_only, store_m=store_m, store_w=store_w,
+                         progress=progress)
+  return memmap_affinity(S_i_m, S_i_w, S_i_p, BETA, SIGMA_S, SIGMA_L, complex_only, memmap_file,
+                         memory_budget=memory_budget, store_m=store_m, store_w=store_w, progress=progress)
+
+
+# Returns the initial label matrix Y (num_sup_pixels*num_classes) of the train samples csv_file: the superpixel that
+# contains a labelled pixel gets its class. The labels are from 1 to num_classes (by default the largest one), or with
+# sea_ice_classification those exported from MAGIC (see SEA_ICE_CLASSES; -1 is an unlabelled pixel). With exclusive,
+# a superpixel only keeps the class of its last sample; otherwise it keeps all of them.
+def initial_labels(labels, csv_file, num_sup_pixels, num_classes=None, sea_ice_classification=False, exclusive=True):
+  if num_classes is None:
+    num_classes = np.max(csv_file[:, 0])
+  if sea_ice_classification and num_classes not in SEA_ICE_CLASSES:
+    raise ValueError('The sea ice classification has %s classes (NUM_CLASSES), not %s'
+                     % (' or '.join(str(num) for num in sorted(SEA_ICE_CLASSES)), num_classes))
+  Y = np.zeros((num_sup_pixels, num_classes))
+
+  for num_labelled in range(0, csv_file.shape[0]):
+    sp = labels[csv_file[num_labelled, 2] - 1, csv_file[num_labelled, 1] - 1]  # the superpixel of the labelled pixel
+    if sp >= num_sup_pixels:  # land (mask) areas
+      continue
+    if sea_ice_classification:
+      column = SEA_ICE_CLASSES[num_classes].get(csv_file[num_labelled, 0])
+    else:
+      column = csv_file[num_labelled, 0] - 1
+    if column is None:  # unlabelled, or not one of the classes
+      continue
+    if exclusive:
+      Y[sp, :] = 0
+    Y[sp, column] = 1
+  return Y
+
+
+# Returns the train image: the pixels of each labelled superpixel get its class in Y (the last one if there are
+# several), the others 0.
+def train_label_image(labels, Y, num_sup_pixels):
+  num_classes = Y.shape[1]
+  train_sp_classes = np.where(np.any(Y == 1, axis=1), num_classes - np.argmax(Y[:, ::-1] == 1, axis=1), 0)
+  return paint_superpixels(labels, train_sp_classes, num_sup_pixels, fill=0, dtype=float)
+
+
+# Returns the class (from 1) of every train sample of csv_file: its label or, with sea_ice_classification, that of the
+# 4 sea-ice classes of its MAGIC label (0 for the unlabelled pixels, -1, and the other labels).
+def sample_classes(csv_file, sea_ice_classification=False):
+  if not sea_ice_classification:
+    return csv_file[:, 0]
+  return np.array([SEA_ICE_CLASSES[4].get(label, -1) + 1 for label in csv_file[:, 0]], dtype=int)
+
+
+# Returns the class of every superpixel (num_sup_pixels) in the train samples csv_file (see sample_classes): that of the
+# last sample in it, 0 if there is none. The samples in land areas are skipped.
+def superpixel_labels(labels, csv_file, num_sup_pixels, sea_ice_classification=False):
+  sp_labels = np.zeros(num_sup_pixels)
+  for sample_class, col, row in zip(sample_classes(csv_file, sea_ice_classification), csv_file[:, 1], csv_file[:, 2]):
+    sp = labels[row - 1, col - 1]  # the superpixel of the labelled pixel
+    if sample_class == 0 or sp >= num_sup_pixels:
+      continue
+    sp_labels[sp] = sample_class
+  return sp_labels
+
+
+# Returns the image (of the given shape) of the classes of the train samples csv_file (see sample_classes), 0 for the
+# pixels that are not samples.
+def pixel_labels(shape, csv_file, sea_ice_classification=False):
+  feat_labels = np.zeros(shape)
+  for sample_class, col, row in zip(sample_classes(csv_file, sea_ice_classification), csv_file[:, 1], csv_file[:, 2]):
+    if sample_class != 0:
+      feat_labels[row - 1, col - 1] = sample_class
+  return feat_labels
+
+
+# Calculates the soft labels F = beta_f * (I - alfa_f * S)^-1 * Y with lgc_solve (method, tol, max_iter) or, for a
+# NystromAffinity W, from its factorization. d is the optional degree vector. Returns F and the dict of the solver.
+def solve_lgc(W, Y, MIU, d=None, method='cg', tol=1e-10, max_iter=1000):
+  if isinstance(W, NystromAffinity):  # solved through the factorization of W (Woodbury identity)
+    return nystrom_lgc_solve(W, Y, MIU, d=d)
+  return lgc_solve(W, Y, MIU, method=method, tol=tol, max_iter=max_iter, d=d)
+
+
+# Returns the predicted image: the pixels of every superpixel get the class (from 1) of the largest soft label in F
+# (see sp_classes); the land areas keep their label.
+def predict_labels(labels, F, num_sup_pixels):
+  return paint_superpixels(labels, sp_classes(F), num_sup_pixels)
+
+
+# Assesses predicted_labels (HxW) against the test samples csv_file_test (see test_sample_labels). Returns a dict with
+# the 'true_labels' and 'pred_labels' of the samples, the 'test_image' (None without test_image), the 'confusion' matrix,
+# 'kappa' and 'accuracy'.
+def evaluate(predicted_labels, csv_file_test, Cluste_based_testing=True, test_image=True):
+  true_labels_test, pred_labels_test, true_label_test_image = test_sample_labels(predicted_labels, csv_file_test,
+                                                                                  Cluste_based_testing, test_image)
+  return {'true_labels': true_labels_test, 'pred_labels': pred_labels_test, 'test_image': true_label_test_image,
+          'confusion': confusion_matrix(true_labels_test, pred_labels_test),
+          'kappa': cohen_kappa(true_labels_test, pred_labels_test),
+          'accuracy': accuracy(true_labels_test, pred_labels_test)}
+
+
+# Returns the user accuracy of every class (the fraction of its test samples predicted as it) from the confusion matrix.
+def user_accuracies(confusion):
+  return np.diag(confusion) / np.sum(confusion, axis=1)
+
+
+# Writes the confusion matrix, the user accuracies (with user_accuracy), kappa and accuracy of evaluation, the elapsed
+# time (s) and the results of a MIU sweep ((MIU, kappa, accuracy) tuples) to the text file path (accuracy.txt).
+def write_accuracy(path, evaluation, elapsed, user_accuracy=False, sweep_results=()):
+  minutes, seconds = divmod(elapsed, 60)
+  with open(path, 'w') as f:
+    f.write("Confusion Matrix\n")
+    if user_accuracy:
+      for n_c, u_a in enumerate(user_accuracies(evaluation['confusion'])):
+        f.write("\nUser Accuracy: class %.4f %.4f\n" % (n_c + 1, u_a))
+    f.write(np.array2string(evaluation['confusion'], separator=', '))
+    f.write("\nKappa: %.2f\n" % evaluation['kappa'])
+    f.write("\nAccuracy: %.4f\n" % evaluation['accuracy'])
+    f.write("Time elapsed is %.2f  minutes and %.2f seconds." % (minutes, seconds))
+    for MIU_s, kappa_s, accuracy_s in sweep_results:
+      f.write("\nMIU %g: Kappa %.2f, Accuracy %.4f" % (MIU_s, kappa_s, accuracy_s))
+
+
+# Returns a copy of image (e.g., the predicted or the segmentation image) in which the land areas of labels have the
+# value land_value, so that they do not stretch the colour scale.
+def land_as(image, labels, land_value):
+  image = np.array(image)
+  image[labels == LAND_LABEL] = land_value
+  return image
+
+
+# Returns the colormap of matplotlib for cmap: 'classes' is the one of CLASS_COLORS, other values are used as they are.
+def _colormap(cmap):
+  if cmap != 'classes':
+    return cmap
+  import matplotlib.colors
+  return matplotlib.colors.ListedColormap(CLASS_COLORS, name='colors', N=None)
+
+
+# Shows the images, a list of (title, image, cmap) with cmap a colormap of matplotlib or 'classes', side by side in a
+# window.
+def show_images(images):
+  import matplotlib.pyplot as plt
+  fig = plt.figure()
+  for num_image, (title, image, cmap) in enumerate(images):
+    ax = fig.add_subplot(1, len(images), num_image + 1)
+    ax.set_title(title)
+    ax.imshow(image, cmap=_colormap(cmap))
+  plt.show()
+
+
+# Saves the images, a list of (title, image, cmap) as in show_images, as the PNG files output_directory + title.png.
+def save_images(images, output_directory):
+  import matplotlib.image
+  for title, image, cmap in images:
+    matplotlib.image.imsave(output_directory + title + '.png', image, cmap=_colormap(cmap))
+
+
+# Shows skimage's region adjacency graph of the oversegmentation labels (only for display).
+def show_rag(labels):
+  from skimage import io, filters, color
+  from skimage.future import graph
+  import matplotlib.pyplot as plt
+  img = labels
+  edge_map = filters.sobel(color.rgb2gray(img))
+  rag = graph.rag_boundary(labels, edge_map)
+  lc = graph.show_rag(labels, rag, img)
+  plt.colorbar(lc)
+  io.show()
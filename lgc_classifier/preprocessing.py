@@ -0,0 +1,78 @@
+# Preprocessing of the features: conversion of the CP Stokes vector to the coherence matrix elements, replacement of
+# NaN values and min-max normalization. preprocess_features does all of them on a feature array block_rows rows at a
+# time and in place where the data type allows, so that no temporary of the size of the feature cube is made. The
+# block functions are also applied while a feature file is read block by block (lgc_classifier/tiffstream.py).
+
+import numpy as np
+
+
+# Converts a block of CP Stokes vectors (SV.tif: g0, g1, g2, g3) to the elements of the coherence matrix: c11, c12_real,
+# c22, c12_imag. They are written to out (e.g., Stokes_vec itself for an in-place conversion) or, by default, to a new
+# float64 array.
+def stokes_to_coherence(Stokes_vec, out=None):
+  if out is None:
+    out = np.empty((Stokes_vec.shape[0], Stokes_vec.shape[1], 4))
+  g0 = Stokes_vec[:, :, 0].copy()
+  g1 = Stokes_vec[:, :, 1].copy()
+  out[:, :, 1] = 0.5 * Stokes_vec[:, :, 2]
+  out[:, :, 3] = -0.5 * Stokes_vec[:, :, 3]
+  out[:, :, 0] = 0.5 * (g0 + g1)
+  out[:, :, 2] = 0.5 * (g0 - g1)
+  return out
+
+
+# Rescales every channel of feats to [0, 1] with the channel minima min_f and maxima max_f (see channel_ranges in
+# lgc_classifier/tiffstream.py). A constant channel gives NaN, as in the scripts.
+def normalize_features(feats, min_f, max_f):
+  with np.errstate(invalid='ignore', divide='ignore'):
+    return (feats - min_f) / (max_f - min_f)
+
+
+# Replaces the NaN values of feats by zero.
+def replace_nan(feats):
+  return np.where(np.isnan(feats), 0, feats)
+
+
+# Preprocesses the feature array feats (HxWxn_feats) block_rows rows at a time:
+# stokes: feats holds the CP Stokes vector, which is converted to the coherence matrix elements,
+# replace_nans: the NaN values are replaced by zero (before and, with normalize, after the normalization),
+# normalize: every channel is rescaled to [0, 1] with its minimum and maximum (found in the first pass).
+# dtype is the data type of the result (by default that of feats, or float64 for the coherence elements or integer
+# features); when it is that of feats, feats is overwritten and returned, otherwise a single array of the result is
+# allocated. float32 halves the memory of float64 features.
+def preprocess_features(feats, stokes=False, replace_nans=False, normalize=False, dtype=None, block_rows=512):
+  if dtype is None:
+    dtype = np.float64 if stokes or not np.issubdtype(feats.dtype, np.floating) else feats.dtype
+  num_feats = 4 if stokes else feats.shape[2]
+  if feats.dtype == dtype and feats.shape[2] == num_feats and feats.flags.writeable:
+    out = feats
+  else:
+    out = np.empty((feats.shape[0], feats.shape[1], num_feats), dtype=dtype)
+
+  min_f = max_f = None
+  for first_row in range(0, feats.shape[0], block_rows):
+    rows = slice(first_row, first_row + block_rows)
+    out_block = out[rows]
+    if stokes:
+      stokes_to_coherence(feats[rows], out=out_block)
+    elif out is not feats:
+      out_block[...] = feats[rows]
+    if replace_nans:
+      out_block[np.isnan(out_block)] = 0
+    if normalize:  # the ranges, as np.min and np.max of every channel
+      if min_f is None:
+        min_f, max_f = np.min(out_block, axis=(0, 1)), np.max(out_block, axis=(0, 1))
+      else:
+        min_f = np.minimum(min_f, np.min(out_block, axis=(0, 1)))
+        max_f = np.maximum(max_f, np.max(out_block, axis=(0, 1)))
+
+  if normalize:
+    range_f = max_f - min_f
+    with np.errstate(invalid='ignore', divide='ignore'):
+      for first_row in range(0, feats.shape[0], block_rows):
+        out_block = out[first_row:first_row + block_rows]
+        out_block -= min_f
+        out_block /= range_f
+        if replace_nans:  # constant channels
+          out_block[np.isnan(out_block)] = 0
+  return out
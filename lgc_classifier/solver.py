@@ -0,0 +1,176 @@
+# Calculation of the soft labels F of the LGC classifier (Zhou et al., 2004, "Learning with Local and Global
+# Consistency"): F = beta_f * (I - alfa_f * S)^-1 * Y, where S = D^-1/2 * W * D^-1/2 is the normalized affinity matrix,
+# D the diagonal matrix of the row sums of W, beta_f = MIU / (MIU + 1) and alfa_f = 1 - beta_f.
+# D is only kept as the vector of its diagonal, and W can be a dense array, a scipy sparse matrix or an out-of-core
+# matrix (lgc_classifier/outofcore.py) that only provides W.sum(axis=1) and W @ P.
+
+import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
+
+
+# Returns the diagonal of D, i.e., the sums of the rows of W (a dense array or a scipy sparse matrix), as a vector.
+def degree_vector(W):
+  return np.asarray(W.sum(axis=1)).ravel()
+
+
+# Calculates S = D^-1/2 * W * D^-1/2 without forming D. S is sparse (CSR) if W is sparse and dense otherwise.
+def normalized_affinity(W, d=None):
+  if d is None:
+    d = degree_vector(W)
+  inv_sqrt_d = 1 / np.sqrt(d)
+  if sp.issparse(W):
+    inv_sqrt_D = sp.diags(inv_sqrt_d)
+    return (inv_sqrt_D @ W @ inv_sqrt_D).tocsr()
+  return (W * inv_sqrt_d[:, None]) * inv_sqrt_d[None, :]
+
+
+# Returns the predicted classes (1 to NUM_CLASSES) of the superpixels from the soft labels F: that of the largest soft
+# label, as the last column of np.argsort in the scripts, so the ties go the same way everywhere (e.g., an all-zero row
+# of a component without labelled superpixels gets the class NUM_CLASSES).
+def sp_classes(F):
+  F_sorted = np.argsort(F, axis=1)
+  return F_sorted[:, F.shape[1] - 1] + 1
+
+
+# Whether W is an in-memory (dense or sparse) matrix rather than an out-of-core one.
+def _in_memory(W):
+  return sp.issparse(W) or isinstance(W, np.ndarray)
+
+
+# Returns the function P -> S * P for the columns of P, evaluated as D^-1/2 * (W * (D^-1/2 * P)) so that S is not formed.
+def _s_product(W, d):
+  inv_sqrt_d = (1 / np.sqrt(d))[:, None]
+
+  def s_product(P):
+    return inv_sqrt_d * (W @ (inv_sqrt_d * P))
+  return s_product
+
+
+# Solves (I - alfa_f * S) * F = B for all the columns of B with the conjugate gradient method (the matrix is symmetric
+# positive definite since the eigenvalues of S are in [-1, 1]). The columns are iterated together, each with its own
+# step sizes, until the relative residual of every column is below tol or max_iter iterations are done.
+def _conjugate_gradient(s_product, alfa_f, B, tol, max_iter):
+  b_norm = np.linalg.norm(B, axis=0)
+  b_norm[b_norm == 0] = 1
+
+  F = np.zeros_like(B)
+  R = B.copy()
+  P = R.copy()
+  rr = np.sum(R * R, axis=0)
+  iterations = 0
+  while iterations < max_iter and np.max(np.sqrt(rr) / b_norm) > tol:
+    AP = P - alfa_f * s_product(P)
+    pap = np.sum(P * AP, axis=0)
+    step = np.divide(rr, pap, out=np.zeros_like(rr), where=pap != 0)
+    F += step * P
+    R -= step * AP
+    rr_new = np.sum(R * R, axis=0)
+    P = R + np.divide(rr_new, rr, out=np.zeros_like(rr), where=rr != 0) * P
+    rr = rr_new
+    iterations += 1
+  return F, iterations
+
+
+# Iterates the label propagation F(t+1) = alfa_f * S * F(t) + B, which converges to (I - alfa_f * S)^-1 * B at the rate
+# alfa_f, until the relative change of F is below tol or max_iter iterations are done.
+def _propagation(s_product, alfa_f, B, tol, max_iter):
+  F = B.copy()
+  iterations = 0
+  while iterations < max_iter:
+    F_new = alfa_f * s_product(F) + B
+    change = np.linalg.norm(F_new - F) / max(np.linalg.norm(F_new), np.finfo(float).tiny)
+    F = F_new
+    iterations += 1
+    if change <= tol:
+      break
+  return F, iterations
+
+
+# Calculates F for the affinity matrix W (dense or sparse) and the initial label matrix Y (num_sup_pixels*NUM_CLASSES)
+# with one of the methods:
+# 'cg': conjugate gradient on the symmetric system (I - alfa_f * S) * F = beta_f * Y (the default),
+# 'propagation': the iterative label propagation of Zhou et al.,
+# 'direct': an LU factorization of (I - alfa_f * S) (sparse LU if W is sparse).
+# No inverse matrix is formed. d is the optional diagonal of D. Returns F and a dict with the method, the number of
+# iterations and the relative residual max_k ||beta_f * Y_k - (I - alfa_f * S) * F_k|| / ||beta_f * Y_k||.
+def lgc_solve(W, Y, MIU, method='cg', tol=1e-10, max_iter=1000, d=None):
+  beta_f = MIU / (MIU + 1)
+  alfa_f = 1 - beta_f
+
+  if d is None:
+    d = degree_vector(W)
+  s_product = _s_product(W, d)
+  B = beta_f * np.asarray(Y, dtype=float)
+
+  if method == 'cg':
+    F, iterations = _conjugate_gradient(s_product, alfa_f, B, tol, max_iter)
+  elif method == 'propagation':
+    F, iterations = _propagation(s_product, alfa_f, B, tol, max_iter)
+  elif method == 'direct':
+    if not _in_memory(W):
+      raise ValueError("The 'direct' LGC solver needs W in memory; use 'cg' or 'propagation' for an out-of-core W")
+    s_f = normalized_affinity(W, d)  # matrix S in LGC
+    if sp.issparse(W):
+      F = spla.splu((sp.identity(W.shape[0], format='csc') - alfa_f * s_f).tocsc()).solve(B)
+    else:
+      s_f *= -alfa_f
+      s_f[np.diag_indices_from(s_f)] += 1
+      F = np.linalg.solve(s_f, B)
+    del s_f
+    iterations = 0
+  else:
+    raise ValueError("Unknown LGC solver '%s' (use 'cg', 'propagation' or 'direct')" % method)
+
+  b_norm = np.linalg.norm(B, axis=0)
+  b_norm[b_norm == 0] = 1
+  residual = np.max(np.linalg.norm(B - (F - alfa_f * s_product(F)), axis=0) / b_norm)
+  return F, {'method': method, 'iterations': iterations, 'residual': residual}
+
+
+# Calculates the eigendecomposition of the symmetric matrix S = D^-1/2 * W * D^-1/2 once, so that F can be obtained for
+# any MIU without solving a new system (see lgc_miu_sweep). With num_eigs, only the num_eigs largest eigenvalues and
+# their eigenvectors are calculated (scipy eigsh, through products with S only), which is what matters for small MIU
+# (alfa_f close to 1). Returns the eigenvalues and the num_sup_pixels*num_eigs matrix of eigenvectors.
+def lgc_eigen_factorization(W, d=None, num_eigs=None):
+  if d is None:
+    d = degree_vector(W)
+  if num_eigs is None:
+    if not _in_memory(W):
+      raise ValueError('The full eigendecomposition needs W in memory; set num_eigs for an out-of-core W')
+    s_f = normalized_affinity(W, d)
+    if sp.issparse(s_f):
+      s_f = s_f.toarray()
+    return np.linalg.eigh(s_f)
+
+  s_product = _s_product(W, d)
+  s_operator = spla.LinearOperator(W.shape, matvec=lambda p: s_product(p.reshape(-1, 1)).ravel(), dtype=float)
+  return spla.eigsh(s_operator, k=num_eigs, which='LA')
+
+
+# Calculates F for every value in MIU_values from one eigendecomposition S = V * diag(eig_vals) * V^T:
+# F = beta_f * V * diag(1 / (1 - alfa_f * eig_vals)) * V^T * Y, i.e., O(num_sup_pixels * num_eigs * NUM_CLASSES) per MIU.
+# With a truncated factorization the part of Y outside the span of V is treated as if its eigenvalues were zero
+# (it is only scaled by beta_f). factorization is the optional output of lgc_eigen_factorization. Returns the list of
+# F matrices, or with return_labels the list of predicted classes of the superpixels (see sp_classes).
+def lgc_miu_sweep(W, Y, MIU_values, d=None, num_eigs=None, factorization=None, return_labels=False):
+  if factorization is None:
+    factorization = lgc_eigen_factorization(W, d, num_eigs)
+  eig_vals, eig_vecs = factorization
+
+  Y = np.asarray(Y, dtype=float)
+  proj_Y = eig_vecs.T @ Y
+  rest_Y = None
+  if eig_vecs.shape[1] < eig_vecs.shape[0]:  # truncated factorization
+    rest_Y = Y - eig_vecs @ proj_Y
+
+  results = []
+  for MIU in MIU_values:
+    beta_f = MIU / (MIU + 1)
+    alfa_f = 1 - beta_f
+    F = eig_vecs @ (proj_Y / (1 - alfa_f * eig_vals)[:, None])
+    if rest_Y is not None:
+      F += rest_Y
+    F *= beta_f
+    results.append(sp_classes(F) if return_labels else F)
+  return results
@@ -0,0 +1,89 @@
+# Per-superpixel statistics (pixel counts, centroids and mean features) computed in a single pass over the
+# oversegmentation instead of one np.where(labels == num_sp) scan per superpixel.
+
+import numpy as np
+
+
+LAND_LABEL = 10000000  # The label of the land (masked) areas in the oversegmentation image
+
+
+# Counts the superpixels in labels (HxW), i.e., the distinct labels other than LAND_LABEL, and tells whether there are
+# land areas. This replaces len(rag) (minus one for the land node) without building a region adjacency graph.
+def count_superpixels(labels, block_rows=512):
+  present = np.zeros(0, dtype=bool)
+  there_is_land = False
+  for first_row in range(0, labels.shape[0], block_rows):
+    label_block = labels[first_row:first_row + block_rows, :]
+    land = label_block == LAND_LABEL
+    there_is_land = there_is_land or bool(np.any(land))
+    sp = label_block[~land].astype(np.intp)
+    if sp.size == 0:
+      continue
+    if sp.max() >= present.shape[0]:
+      present = np.concatenate((present, np.zeros(sp.max() + 1 - present.shape[0], dtype=bool)))
+    present[sp] = True
+  return int(np.count_nonzero(present)), there_is_land
+
+
+# Adds the contribution of one block of rows of the segmentation (and of the features, if given) to the running sums.
+# label_block is a rows*W integer array, feat_block a rows*W*n_feats array and first_row the image row of its first row.
+def _accumulate_block(sums, label_block, first_row, feat_block=None):
+  num_sup_pixels = sums['counts'].shape[0]
+  valid = (label_block >= 0) & (label_block < num_sup_pixels)  # land/mask labels are not accumulated
+  sp = label_block[valid].astype(np.intp)
+
+  sums['counts'] += np.bincount(sp, minlength=num_sup_pixels)
+
+  rows, cols = np.nonzero(valid)
+  sums['rows'] += np.bincount(sp, weights=rows + first_row, minlength=num_sup_pixels)
+  sums['cols'] += np.bincount(sp, weights=cols, minlength=num_sup_pixels)
+
+  if feat_block is not None:
+    feat_block = feat_block[valid]
+    for feat in range(0, feat_block.shape[1]):
+      sums['feats'][:, feat] += np.bincount(sp, weights=feat_block[:, feat], minlength=num_sup_pixels)
+
+
+# Creates the zeroed running sums for num_sup_pixels superpixels and num_feats feature channels.
+def _empty_sums(num_sup_pixels, num_feats=0):
+  return {'counts': np.zeros(num_sup_pixels, dtype=np.int64),
+          'rows': np.zeros(num_sup_pixels),
+          'cols': np.zeros(num_sup_pixels),
+          'feats': np.zeros((num_sup_pixels, num_feats))}
+
+
+# Turns the running sums into counts, centroids (num_sup_pixels*2, mean row and mean column) and feature means.
+# Superpixels with no pixels get NaN centroids and means, the same as np.mean over an empty selection.
+def _finalize(sums):
+  counts = sums['counts']
+  with np.errstate(invalid='ignore', divide='ignore'):
+    centroids = np.stack((sums['rows'], sums['cols']), axis=1) / counts[:, None]
+    means = sums['feats'] / counts[:, None]
+  return counts, centroids, means
+
+
+# Calculates, for the superpixels labelled 0 to num_sup_pixels - 1 in labels (HxW), the number of pixels, the centroid
+# and the mean of every channel of feats (HxWxn_feats, optional). Labels outside that range (e.g., LAND_LABEL) are
+# ignored. The image is processed block_rows rows at a time so that the temporaries stay small. feats can also be a
+# feature file read block by block (lgc_classifier/tiffstream.py), so that the feature cube is never in memory.
+# Returns counts (num_sup_pixels), centroids (num_sup_pixels*2, float; S_i_p is centroids.astype(int)) and means
+# (num_sup_pixels*n_feats; S_i_m or sp_feats), which is None when no features are given.
+def superpixel_statistics(labels, num_sup_pixels, feats=None, block_rows=512):
+  num_feats = 0 if feats is None else feats.shape[2]
+  sums = _empty_sums(num_sup_pixels, num_feats)
+
+  if feats is None:
+    blocks = ((first_row, None) for first_row in range(0, labels.shape[0], block_rows))
+  elif hasattr(feats, 'row_blocks'):
+    blocks = feats.row_blocks(block_rows)
+  else:
+    blocks = ((first_row, feats[first_row:first_row + block_rows, :, :])
+              for first_row in range(0, labels.shape[0], block_rows))
+  for first_row, feat_block in blocks:
+    last_row = first_row + (block_rows if feat_block is None else feat_block.shape[0])
+    _accumulate_block(sums, labels[first_row:last_row, :], first_row, feat_block)
+
+  counts, centroids, means = _finalize(sums)
+  if feats is None:
+    means = None
+  return counts, centroids, means
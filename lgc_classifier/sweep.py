@@ -0,0 +1,116 @@
+# Sweep of the graph and LGC parameters (BETA, SIGMA_S, SIGMA_L, MIU) of a scene. W only depends on BETA, SIGMA_S and
+# SIGMA_L through exponentials of three distance matrices: the distances between the S_i_m, between the S_i_w (maximum
+# HLT or squared Euclidean) and between the centroids S_i_p (squared Euclidean). They are calculated once, and the W of
+# every combination is rebuilt from them with array operations instead of evaluating the distances again.
+
+import itertools
+
+import numpy as np
+import scipy.sparse as sp
+
+from lgc_classifier.hlt import inverse_store, max_hlt_distance_block, euclidean_distance_block, max_hlt_pairs, \
+  euclidean_distance_pairs
+from lgc_classifier.affinity import spatial_nearest_neighbours
+from lgc_classifier.solver import lgc_solve, lgc_miu_sweep, sp_classes
+
+
+SWEEP_PARAMETERS = ('BETA', 'SIGMA_S', 'SIGMA_L', 'MIU')
+
+
+# The distances between the superpixels of S_i_m, S_i_w and S_i_p (d(S_i_m), d(S_i_w) and d(S_i_p)) on which W depends.
+# With K_NN None they are kept for all the pairs of superpixels (the full spatial correlation effect, as
+# num_sup_pixels*num_sup_pixels arrays of which only the upper triangle is set) and otherwise for the pairs of every
+# superpixel with its K_NN spatially nearest superpixels, as in knn_affinity. affinity() returns the same W as
+# full_affinity or knn_affinity would for the same parameters, bit for bit.
+class SuperpixelDistances:
+  def __init__(self, S_i_m, S_i_w, S_i_p, complex_only, K_NN=None, block_rows=256, store_m=None, store_w=None):
+    num_sup_pixels = S_i_m.shape[0]
+    if complex_only:
+      if store_m is None:
+        store_m = inverse_store(S_i_m)
+      if store_w is None:
+        store_w = inverse_store(S_i_w)
+    self.shape = (num_sup_pixels, num_sup_pixels)
+    self.K_NN = K_NN
+    self.block_rows = block_rows
+
+    if K_NN is not None:
+      self.idx_r = np.repeat(np.arange(num_sup_pixels), K_NN)
+      self.idx_c = spatial_nearest_neighbours(S_i_p, K_NN).ravel()
+      if complex_only:
+        self.dis_w = max_hlt_pairs(S_i_w, store_w, self.idx_r, self.idx_c)
+        self.dis_m = max_hlt_pairs(S_i_m, store_m, self.idx_r, self.idx_c)
+      else:
+        self.dis_w = euclidean_distance_pairs(S_i_w, self.idx_r, self.idx_c)
+        self.dis_m = euclidean_distance_pairs(S_i_m, self.idx_r, self.idx_c)
+      self.dis_p = euclidean_distance_pairs(S_i_p, self.idx_r, self.idx_c)
+      return
+
+    self.dis_w = np.zeros(self.shape)
+    self.dis_m = np.zeros(self.shape)
+    self.dis_p = np.zeros(self.shape)
+    for rows, cols in self._upper_blocks():
+      if complex_only:
+        self.dis_w[rows, cols] = max_hlt_distance_block(S_i_w[rows], S_i_w[cols], store_w[rows], store_w[cols])
+        self.dis_m[rows, cols] = max_hlt_distance_block(S_i_m[rows], S_i_m[cols], store_m[rows], store_m[cols])
+      else:
+        self.dis_w[rows, cols] = euclidean_distance_block(S_i_w[rows], S_i_w[cols])
+        self.dis_m[rows, cols] = euclidean_distance_block(S_i_m[rows], S_i_m[cols])
+      self.dis_p[rows, cols] = euclidean_distance_block(S_i_p[rows], S_i_p[cols])
+
+  # Yields (rows, cols) slices of block_rows rows of the upper triangle (diagonal included), as in full_affinity.
+  def _upper_blocks(self):
+    num_sup_pixels = self.shape[0]
+    for first_row in range(0, num_sup_pixels, self.block_rows):
+      yield slice(first_row, min(first_row + self.block_rows, num_sup_pixels)), slice(first_row, num_sup_pixels)
+
+  # Returns W for BETA, SIGMA_S and SIGMA_L: a dense array with the full spatial correlation effect and a sparse (CSR)
+  # matrix with K_NN.
+  def affinity(self, BETA, SIGMA_S, SIGMA_L):
+    if self.K_NN is not None:
+      weights = _weights(self.dis_m, self.dis_w, self.dis_p, BETA, SIGMA_S, SIGMA_L)
+      W = sp.csr_matrix((weights, (self.idx_r, self.idx_c)), shape=self.shape)
+      return W.maximum(W.transpose()).tocsr()
+
+    W = np.zeros(self.shape)
+    for rows, cols in self._upper_blocks():  # block by block, so the temporaries stay small
+      block = _weights(self.dis_m[rows, cols], self.dis_w[rows, cols], self.dis_p[rows, cols], BETA, SIGMA_S, SIGMA_L)
+      W[rows, cols] = np.triu(block, k=1)
+    W += np.transpose(W)
+    return W
+
+
+# The weights s * l of affinity_block (lgc_classifier/affinity.py) from the distances, in the same order of operations.
+def _weights(dis_m, dis_w, dis_p, BETA, SIGMA_S, SIGMA_L):
+  s = np.exp(((BETA - 1) * dis_w) - (BETA * dis_m) / (2 * np.power(SIGMA_S, 2)))
+  s *= np.exp(-dis_p / (2 * np.power(SIGMA_L, 2)))
+  return s
+
+
+# Returns the lists of BETA, SIGMA_S, SIGMA_L and MIU values of the dict sweep (e.g., {'BETA': [.5, .9],
+# 'MIU': [.1, 1]}); the parameters missing from sweep take the single value given here.
+def parameter_grid(sweep, BETA, SIGMA_S, SIGMA_L, MIU):
+  unknown = sorted(set(sweep) - set(SWEEP_PARAMETERS))
+  if unknown:
+    raise ValueError('Unknown sweep parameter(s) %s (use %s)' % (', '.join(unknown), ', '.join(SWEEP_PARAMETERS)))
+  defaults = {'BETA': BETA, 'SIGMA_S': SIGMA_S, 'SIGMA_L': SIGMA_L, 'MIU': MIU}
+  return [np.atleast_1d(sweep.get(name, defaults[name])).tolist() for name in SWEEP_PARAMETERS]
+
+
+# Yields (BETA, SIGMA_S, SIGMA_L, MIU, sp_labels) for every combination of the values, where sp_labels are the predicted
+# classes (1 to NUM_CLASSES, see sp_classes) of the superpixels for the initial label matrix Y. W is rebuilt from
+# distances (a SuperpixelDistances) once per (BETA, SIGMA_S, SIGMA_L). With several MIU values, F is obtained for all
+# of them from one eigendecomposition of S (lgc_miu_sweep, with num_eigs); with one, it is solved with lgc_solve
+# (method, tol, max_iter).
+def lgc_parameter_sweep(distances, Y, BETA_values, SIGMA_S_values, SIGMA_L_values, MIU_values, method='cg', tol=1e-10,
+                        max_iter=1000, num_eigs=None):
+  for BETA, SIGMA_S, SIGMA_L in itertools.product(BETA_values, SIGMA_S_values, SIGMA_L_values):
+    W = distances.affinity(BETA, SIGMA_S, SIGMA_L)
+    if len(MIU_values) > 1:
+      sp_labels = lgc_miu_sweep(W, Y, MIU_values, num_eigs=num_eigs, return_labels=True)
+    else:
+      F = lgc_solve(W, Y, MIU_values[0], method=method, tol=tol, max_iter=max_iter)[0]
+      sp_labels = [sp_classes(F)]
+    del W
+    for MIU, sp_labels_miu in zip(MIU_values, sp_labels):
+      yield BETA, SIGMA_S, SIGMA_L, MIU, sp_labels_miu
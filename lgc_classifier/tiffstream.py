@@ -0,0 +1,142 @@
+# Block-by-block reading of the feature files (C.tif, SV.tif, feats.tif) for scenes larger than the memory: the rows
+# of the HxWxn_feats cube are read a block at a time, from a memory map when the file is stored uncompressed and
+# contiguously, and otherwise by decoding only the strips or tiles (or pages) of the block. Only the channels that are
+# used are kept (and, for files stored plane by plane, read). The rows, columns and channels are those of tiff.imread
+# (the channels last). superpixel_statistics accepts these objects in place of the feature array, so the whole cube is
+# never in memory.
+
+import numpy as np
+import tifffile as tiff
+
+
+# The HxWxn_feats feature cube of the first image of the TIFF file path, restricted to channels (all by default).
+# It offers shape, row_blocks() and toarray(); the blocks have the data type of the file.
+class TiffFeatures:
+  def __init__(self, path, channels=None):
+    self.path = path
+    with tiff.TiffFile(path) as tif:
+      series = tif.series[0]
+      page = tif.pages[0]
+      shape = series.shape + (1,) if len(series.shape) == 2 else series.shape
+      if len(shape) != 3:
+        raise ValueError('%s is not an HxW or HxWxC image (its first series is %s, %s)' % (path, series.axes,
+                                                                                           series.shape))
+      # The cube has the layout of tiff.imread (e.g., tifffile.imwrite writes a HxWxC array with more than 4 channels as
+      # H pages of WxC, axes QYX), except that the samples of a page stored plane by plane (planar configuration
+      # separate, axes SYX) are the channels.
+      self._channel_first = series.axes == 'SYX'
+      self._page_rows = len(series.pages) > 1  # every page is a row of the cube
+      if self._channel_first:
+        num_channels, height, width = shape
+      else:
+        height, width, num_channels = shape
+      self.dtype = series.dtype
+      self._memmappable = series.dataoffset is not None
+      if self._page_rows:
+        self._band_rows = 1
+      else:
+        self._band_rows = page.tilelength if page.is_tiled else min(page.rowsperstrip, height)
+
+    self.channels = list(range(num_channels)) if channels is None else list(channels)
+    self.shape = (height, width, len(self.channels))
+
+  # Returns the memory map of the whole file as a HxWxC (all channels) view; nothing is read until it is indexed.
+  def _memmap(self):
+    data = tiff.memmap(self.path, mode='r')
+    if data.ndim == 2:
+      return data[:, :, None]
+    return np.moveaxis(data, 0, 2) if self._channel_first else data
+
+  # Decodes the strips or tiles (or the pages) of the rows [first_row, last_row), which start at a strip or tile
+  # boundary, and returns them as a (last_row - first_row)*W*len(channels) array.
+  def _decode_rows(self, tif, first_row, last_row):
+    height, width = self.shape[:2]
+    block = np.empty((last_row - first_row, width, self.shape[2]), dtype=self.dtype)
+    if self._page_rows:
+      for row in range(first_row, last_row):
+        block[row - first_row] = tif.series[0].pages[row].asarray().reshape(width, -1)[:, self.channels]
+      return block
+
+    if self._channel_first:  # only the planes of the channels are read
+      planes = [(out_channel, tif.pages[0], channel) for out_channel, channel in enumerate(self.channels)]
+    else:
+      planes = [(None, tif.pages[0], 0)]
+
+    for out_channel, page, sample in planes:
+      bands = -(-height // self._band_rows)
+      across = -(-width // page.tilewidth) if page.is_tiled else 1
+      decode_args = {'_fullsize': page.is_tiled}
+      if page.jpegtables is not None:
+        decode_args['jpegtables'] = page.jpegtables
+        decode_args['jpegheader'] = page.jpegheader
+      indices = [(sample * bands + band) * across + col
+                 for band in range(first_row // self._band_rows, -(-last_row // self._band_rows)) for col in range(across)]
+      segments = tif.filehandle.read_segments([page.dataoffsets[i] for i in indices],
+                                              [page.databytecounts[i] for i in indices], indices=indices, flat=True)
+      for data, index in segments:
+        segment, (_, _, row, col, _), _ = page.decode(data, index, **decode_args)
+        segment = segment[0, :min(height, last_row) - row, :width - col]  # tiles are padded at the image border
+        rows = slice(row - first_row, row - first_row + segment.shape[0])
+        cols = slice(col, col + segment.shape[1])
+        if out_channel is None:
+          block[rows, cols, :] = segment[:, :, self.channels]
+        else:
+          block[rows, cols, out_channel] = segment[:, :, 0]
+    return block
+
+  # Yields (first_row, block) for consecutive blocks of about block_rows rows (whole strips or tiles when the file is
+  # decoded) of the HxWxlen(channels) cube.
+  def row_blocks(self, block_rows=512):
+    height = self.shape[0]
+    if self._memmappable:
+      data = self._memmap()
+      for first_row in range(0, height, block_rows):
+        yield first_row, np.array(data[first_row:first_row + block_rows, :, self.channels])
+      del data
+      return
+
+    block_rows = max(1, block_rows // self._band_rows) * self._band_rows
+    with tiff.TiffFile(self.path) as tif:
+      for first_row in range(0, height, block_rows):
+        yield first_row, self._decode_rows(tif, first_row, min(first_row + block_rows, height))
+
+  # Reads the whole (channel-restricted) cube in memory.
+  def toarray(self):
+    return _concatenate_blocks(self)
+
+
+# The features of feats (a TiffFeatures or MappedFeatures) with func applied to every block of rows; func maps a
+# rows*W*n_feats block to a rows*W*num_feats one (e.g., the Stokes vector to the coherence matrix elements).
+class MappedFeatures:
+  def __init__(self, feats, func, num_feats=None):
+    self.feats = feats
+    self.func = func
+    self.shape = feats.shape[:2] + (feats.shape[2] if num_feats is None else num_feats,)
+
+  def row_blocks(self, block_rows=512):
+    for first_row, block in self.feats.row_blocks(block_rows):
+      yield first_row, self.func(block)
+
+  def toarray(self):
+    return _concatenate_blocks(self)
+
+
+def _concatenate_blocks(feats):
+  return np.concatenate([block for _, block in feats.row_blocks()], axis=0)
+
+
+# Returns the minimum and the maximum of every channel of feats (an array or an object with row_blocks), as np.min and
+# np.max would (NaN if the channel has a NaN, the data type of feats), in one pass over its blocks.
+def channel_ranges(feats, block_rows=512):
+  if isinstance(feats, np.ndarray):
+    blocks = ((first_row, feats[first_row:first_row + block_rows]) for first_row in range(0, feats.shape[0], block_rows))
+  else:
+    blocks = feats.row_blocks(block_rows)
+  min_f = max_f = None
+  for _, block in blocks:
+    if min_f is None:
+      min_f, max_f = np.min(block, axis=(0, 1)), np.max(block, axis=(0, 1))
+    else:
+      min_f = np.minimum(min_f, np.min(block, axis=(0, 1)))
+      max_f = np.maximum(max_f, np.max(block, axis=(0, 1)))
+  return min_f, max_f
@@ -0,0 +1,266 @@
+# Hyperparameter search of the RF and SVM classifiers ("Hyperparameter tuning method 2" of
+# RandomForrest_SupportVectorMachine.py): every candidate is trained with the even half of the training data and scored
+# with the kappa coefficient on the odd half. The candidates are evaluated by a pool of worker processes, which read
+# tr_data and tr_labels from shared memory (see lgc_classifier/parallel.py) instead of receiving a copy per candidate.
+# For the RF, forest_growth_search is a faster alternative that grows the forests instead of refitting them; for the
+# SVM, kernel_svm_search calculates the RBF kernel matrices once per gamma instead of once per (C, gamma).
+# scikit-learn's forests are only imported by the RF functions and its SVC by the SVM ones; the kappa coefficient is
+# that of lgc_classifier/evaluation.py.
+
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from lgc_classifier.parallel import _share, _attach
+from lgc_classifier.evaluation import cohen_kappa
+
+
+_shared = {}  # The training data (or distances) shared with a worker process (set by _init_worker)
+
+
+def _init_worker(descriptors):
+  for key, descriptor in descriptors.items():
+    _shared['shm_' + key], _shared[key] = _attach(descriptor)
+
+
+# Trains estimator_class(**params) with the even half of tr_data and predicts the odd half. Returns the kappa
+# coefficient on the odd half and the fit and predict times (s).
+def _holdout_kappa(estimator_class, params, tr_data, tr_labels):
+  model = estimator_class(**params)
+  start = time.perf_counter()
+  model.fit(tr_data[::2, :], tr_labels[::2])  # training with half of train data
+  fit_time = time.perf_counter() - start
+  start = time.perf_counter()
+  pred_labels_rest = model.predict(tr_data[1::2, :])  # predicting the labels of the rest of train data
+  predict_time = time.perf_counter() - start
+  return cohen_kappa(tr_labels[1::2], pred_labels_rest), fit_time, predict_time
+
+
+def _shared_holdout_kappa(estimator_class, params):
+  return _holdout_kappa(estimator_class, params, _shared['tr_data'], _shared['tr_labels'])
+
+
+# Evaluates estimator_class (e.g., RandomForestClassifier or SVC) with every dict of parameters in candidates, with
+# num_workers processes (1: in this process). The selected candidate is the one with the highest kappa, ties going to
+# the later candidate in candidates, as in the nested loops of the script, whatever order the workers finish in.
+# Returns the parameters of the selected candidate and the results table: one dict per candidate with its parameters,
+# 'kappa', 'fit_time' and 'predict_time', in the order of candidates.
+def holdout_search(estimator_class, candidates, tr_data, tr_labels, num_workers=1):
+  candidates = [dict(params) for params in candidates]
+  if num_workers <= 1:
+    scores = [_holdout_kappa(estimator_class, params, tr_data, tr_labels) for params in candidates]
+  else:
+    blocks = []
+    try:
+      descriptors = {}
+      for key, array in (('tr_data', tr_data), ('tr_labels', tr_labels)):
+        shm, descriptors[key] = _share(array)
+        blocks.append(shm)
+
+      if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+      else:
+        context = multiprocessing.get_context()
+      with ProcessPoolExecutor(max_workers=num_workers, mp_context=context, initializer=_init_worker,
+                               initargs=(descriptors,)) as pool:
+        futures = [pool.submit(_shared_holdout_kappa, estimator_class, params) for params in candidates]
+        scores = [future.result() for future in futures]  # re-raises the exceptions of the workers
+    finally:
+      for shm in blocks:
+        shm.close()
+        shm.unlink()
+
+  results = [dict(params, kappa=kappa, fit_time=fit_time, predict_time=predict_time)
+             for params, (kappa, fit_time, predict_time) in zip(candidates, scores)]
+  return _select(results, list(candidates[0]) if candidates else []), results
+
+
+# Returns the parameters (param_names) of the result with the highest kappa, ties going to the later result.
+def _select(results, param_names):
+  highest_kappa = -1
+  best_params = None
+  for result in results:
+    if result['kappa'] >= highest_kappa:
+      highest_kappa = result['kappa']
+      best_params = {name: result[name] for name in param_names}
+  return best_params
+
+
+# Returns the kappa coefficient of the out-of-bag predictions of forest (fitted with oob_score) on tr_labels. The
+# samples that are in the bootstrap sample of every tree have no out-of-bag prediction and are left out.
+def _oob_kappa(forest, tr_labels):
+  has_oob = ~np.any(np.isnan(forest.oob_decision_function_), axis=1)
+  pred_labels = forest.classes_[np.argmax(forest.oob_decision_function_[has_oob], axis=1)]
+  return cohen_kappa(tr_labels[has_oob], pred_labels)
+
+
+# Searches n_estimators and max_depth of the RF without refitting a forest per pair: the forest of every max_depth
+# candidate is grown tree by tree (warm_start) and scored each time it reaches a value of n_estimators, since a forest
+# of 2000 trees contains those of every smaller size. With halving, the max_depth candidates are pruned by successive
+# halving: at n_estimators of about n_min, eta * n_min, eta^2 * n_min, ..., only the 1/eta best-scoring forests (by
+# their kappa at that size) keep growing, until one is left. The score is the kappa coefficient on the odd half of the
+# training data with the forest grown on the even half, as in holdout_search, or with oob the kappa of the out-of-bag
+# predictions of a forest grown on all of it. The trees are built with num_workers processes (n_jobs of the forest).
+# Returns the selected parameters (as holdout_search, ties going to the later pair in the order n_estimators, then
+# max_depth) and the results table of the evaluated pairs, with the time (s) spent growing and scoring every forest.
+def forest_growth_search(tr_data, tr_labels, n_estimators, max_depth, halving=True, eta=2, oob=False,
+                         random_state=None, num_workers=1):
+  from sklearn.ensemble import RandomForestClassifier
+  n_estimators = sorted(n_estimators)
+  if oob:
+    fit_data, fit_labels = tr_data, tr_labels
+  else:
+    fit_data, fit_labels = tr_data[::2, :], tr_labels[::2]  # training with half of train data
+
+  # the n_estimators after which the weaker max_depth candidates are pruned
+  rungs = set()
+  if halving:
+    for rung in range(0, int(np.ceil(np.log(max(len(max_depth), 1)) / np.log(eta)))):
+      rung_est = n_estimators[0] * eta ** rung
+      rungs.add(next((num_est for num_est in n_estimators if num_est >= rung_est), n_estimators[-1]))
+
+  forests = {depth_index: RandomForestClassifier(n_estimators=n_estimators[0], max_depth=max_d, warm_start=True,
+                                                 oob_score=oob, random_state=random_state, n_jobs=num_workers)
+             for depth_index, max_d in enumerate(max_depth)}
+  proba_sums = {depth_index: 0 for depth_index in forests}  # the summed class probabilities of the trees (holdout)
+  kappas = {}
+  results = {}
+  for num_est in n_estimators:
+    for depth_index, forest in forests.items():
+      start = time.perf_counter()
+      num_trees = len(getattr(forest, 'estimators_', []))
+      forest.set_params(n_estimators=num_est)
+      forest.fit(fit_data, fit_labels)  # only the new trees are built
+      fit_time = time.perf_counter() - start
+      start = time.perf_counter()
+      if oob:
+        kappas[depth_index] = _oob_kappa(forest, fit_labels)
+      else:  # only the new trees predict; the forest predicts the class of the highest mean probability
+        for tree in forest.estimators_[num_trees:]:
+          proba_sums[depth_index] = proba_sums[depth_index] + tree.predict_proba(tr_data[1::2, :])
+        pred_labels_rest = forest.classes_[np.argmax(proba_sums[depth_index], axis=1)]
+        kappas[depth_index] = cohen_kappa(tr_labels[1::2], pred_labels_rest)
+      predict_time = time.perf_counter() - start
+      results[num_est, depth_index] = {'n_estimators': num_est, 'max_depth': max_depth[depth_index],
+                                       'kappa': kappas[depth_index], 'fit_time': fit_time, 'predict_time': predict_time}
+
+    if num_est in rungs and len(forests) > 1:
+      ranked = sorted(forests, key=lambda depth_index: -np.nan_to_num(kappas[depth_index], nan=-np.inf))
+      forests = {depth_index: forests[depth_index] for depth_index in sorted(ranked[:int(np.ceil(len(forests) / eta))])}
+
+  results = [results[key] for key in sorted(results)]  # in the order of the grid: n_estimators, then max_depth
+  return _select(results, ['n_estimators', 'max_depth']), results
+
+
+# Returns the RBF kernel matrix exp(-gamma * sq_dists) of the squared Euclidean distances sq_dists, which is what
+# sklearn's rbf_kernel calculates.
+def _rbf_gram(sq_dists, gamma):
+  K = sq_dists * -gamma
+  np.exp(K, out=K)
+  return K
+
+
+# Trains SVC(kernel='precomputed') with the kernel matrix of gamma for every value of C_values and scores it on the
+# validation samples. Returns the list of (kappa, fit_time, predict_time) in the order of C_values.
+def _gamma_scores(gamma, C_values, sq_dists_train, sq_dists_val, labels_train, labels_val):
+  from sklearn.svm import SVC
+  start = time.perf_counter()
+  K_train = _rbf_gram(sq_dists_train, gamma)
+  K_val = _rbf_gram(sq_dists_val, gamma)
+  kernel_time = (time.perf_counter() - start) / len(C_values)  # shared by the fits of all the C values
+
+  scores = []
+  for para_c in C_values:
+    start = time.perf_counter()
+    model = SVC(kernel='precomputed', C=para_c).fit(K_train, labels_train)
+    fit_time = time.perf_counter() - start + kernel_time
+    start = time.perf_counter()
+    pred_labels_rest = model.predict(K_val)
+    scores.append((cohen_kappa(labels_val, pred_labels_rest), fit_time, time.perf_counter() - start))
+  return scores
+
+
+def _shared_gamma_scores(gamma, C_values):
+  return _gamma_scores(gamma, C_values, _shared['sq_dists_train'], _shared['sq_dists_val'], _shared['labels_train'],
+                       _shared['labels_val'])
+
+
+# Searches C and gamma of the RBF SVM as holdout_search does for SVC(C=C, gamma=gamma) with the candidates in the order
+# C, then gamma, but with precomputed kernels: the squared distances between the samples of the even half of tr_data
+# and from the odd half to the even half are calculated once, the kernel matrices once per gamma, and every C is fitted
+# on them. The gamma values are shared among num_workers processes (1: in this process), the distances being in
+# shared memory. Returns the selected parameters and the results table, as holdout_search.
+def kernel_svm_search(tr_data, tr_labels, C_values, gamma_values, num_workers=1):
+  from sklearn.metrics.pairwise import euclidean_distances
+  inputs = {'sq_dists_train': euclidean_distances(tr_data[::2, :], squared=True),
+            'sq_dists_val': euclidean_distances(tr_data[1::2, :], tr_data[::2, :], squared=True),
+            'labels_train': np.asarray(tr_labels[::2]), 'labels_val': np.asarray(tr_labels[1::2])}
+  if num_workers <= 1:
+    gamma_scores = [_gamma_scores(gamma, C_values, **inputs) for gamma in gamma_values]
+  else:
+    blocks = []
+    try:
+      descriptors = {}
+      for key, array in inputs.items():
+        shm, descriptors[key] = _share(array)
+        blocks.append(shm)
+
+      if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+      else:
+        context = multiprocessing.get_context()
+      with ProcessPoolExecutor(max_workers=num_workers, mp_context=context, initializer=_init_worker,
+                               initargs=(descriptors,)) as pool:
+        futures = [pool.submit(_shared_gamma_scores, gamma, list(C_values)) for gamma in gamma_values]
+        gamma_scores = [future.result() for future in futures]  # re-raises the exceptions of the workers
+    finally:
+      for shm in blocks:
+        shm.close()
+        shm.unlink()
+
+  results = []
+  for c_index, para_c in enumerate(C_values):
+    for gamma_index, para_gamma in enumerate(gamma_values):
+      kappa, fit_time, predict_time = gamma_scores[gamma_index][c_index]
+      results.append({'C': para_c, 'gamma': para_gamma, 'kappa': kappa, 'fit_time': fit_time,
+                      'predict_time': predict_time})
+  return _select(results, ['C', 'gamma']), results
+
+
+# The RBF SVM (as SVC(C=C, gamma=gamma)) trained and applied with the same precomputed kernels as kernel_svm_search.
+# predict only evaluates the kernel between the samples and the support vectors, a block of samples at a time, so it
+# can be applied to all the pixels of an image. SVC needs the kernel rows of a block as wide as the train data (e.g.,
+# every labelled pixel), so a block has as many samples as fit in memory_budget bytes, at most max_block_rows.
+class PrecomputedRBFSVC:
+  def __init__(self, C=1.0, gamma=1.0, memory_budget=2 ** 28, max_block_rows=2 ** 18):
+    self.C = C
+    self.gamma = gamma
+    self.memory_budget = memory_budget
+    self.max_block_rows = max_block_rows
+
+  def fit(self, tr_data, tr_labels):
+    from sklearn.metrics.pairwise import euclidean_distances
+    from sklearn.svm import SVC
+    self.svc_ = SVC(kernel='precomputed', C=self.C).fit(
+      _rbf_gram(euclidean_distances(tr_data, squared=True), self.gamma), tr_labels)
+    self.num_train_ = tr_data.shape[0]
+    self.support_vectors_ = np.array(tr_data[self.svc_.support_, :])
+    self.classes_ = self.svc_.classes_
+    # the kernel rows and the distances to the support vectors (and their temporary) of a sample, in float64
+    row_bytes = 8 * (self.num_train_ + 2 * self.support_vectors_.shape[0])
+    self.block_rows_ = int(max(1, min(self.max_block_rows, self.memory_budget // row_bytes)))
+    return self
+
+  def predict(self, feats):
+    from sklearn.metrics.pairwise import euclidean_distances
+    pred_labels = np.empty(feats.shape[0], dtype=self.classes_.dtype)
+    for first_row in range(0, feats.shape[0], self.block_rows_):
+      feat_block = feats[first_row:first_row + self.block_rows_, :]
+      # SVC only reads the kernel columns of the support vectors; the others stay zero
+      K = np.zeros((feat_block.shape[0], self.num_train_))
+      K[:, self.svc_.support_] = _rbf_gram(euclidean_distances(feat_block, self.support_vectors_, squared=True),
+                                           self.gamma)
+      pred_labels[first_row:first_row + feat_block.shape[0]] = self.svc_.predict(K)
+    return pred_labels
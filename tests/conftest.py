@@ -0,0 +1,27 @@
+# Random superpixel statistics shared by the tests of the W kernels: S_i_m and S_i_w are rows of the elements of
+# Hermitian positive definite coherence matrices (in the layout of lgc_classifier/hlt.py) and S_i_p random centroids.
+
+import numpy as np
+import pytest
+
+
+# Returns num random Hermitian positive definite dim x dim coherence matrices as rows of their elements (CP: 4, QP: 9).
+def coherence_elements(num, dim, rng):
+  A = rng.normal(size=(num, dim, 2 * dim)) + 1j * rng.normal(size=(num, dim, 2 * dim))
+  C = A @ np.conj(np.transpose(A, (0, 2, 1))) / (2 * dim) + 0.1 * np.identity(dim)
+  if dim == 2:
+    return np.column_stack([C[:, 0, 0].real, C[:, 0, 1].real, C[:, 1, 1].real, C[:, 0, 1].imag])
+  return np.column_stack([C[:, 0, 0].real, C[:, 0, 1].real, C[:, 1, 1].real, C[:, 0, 2].real, C[:, 1, 2].real,
+                          C[:, 2, 2].real, C[:, 0, 1].imag, C[:, 0, 2].imag, C[:, 1, 2].imag])
+
+
+# (S_i_m, S_i_w, S_i_p, complex_only) of 60 superpixels: CP and QP with the maximum HLT distance, and CP features with
+# the squared Euclidean distance.
+@pytest.fixture(params=['cp', 'qp', 'euclidean'])
+def statistics(request):
+  rng = np.random.default_rng(['cp', 'qp', 'euclidean'].index(request.param))
+  dim = 3 if request.param == 'qp' else 2
+  S_i_m = coherence_elements(60, dim, rng)
+  S_i_w = coherence_elements(60, dim, rng)
+  S_i_p = rng.random((60, 2)) * 100
+  return S_i_m, S_i_w, S_i_p, request.param != 'euclidean'
@@ -0,0 +1,107 @@
+# region_adjacency must keep every pair of superpixels that touch (per-pixel loop), and the neighbour lists of the
+# original scripts' skimage rag_boundary must be among them, the only pairs it misses being those that touch where three
+# or more superpixels meet.
+
+import numpy as np
+import pytest
+import scipy.ndimage as ndi
+from scipy.spatial import cKDTree
+
+from lgc_classifier.adjacency import region_adjacency, neighbours
+from lgc_classifier.superpixels import LAND_LABEL
+
+_OFFSETS = {4: [(0, 1), (1, 0)], 8: [(0, 1), (1, 0), (1, 1), (1, -1)]}
+
+
+# A Voronoi oversegmentation of num_seeds random seeds (labels 0 to num_seeds - 1) with land on the right.
+def _segmentation(num_seeds=40, height=45, width=50, seed=0):
+  rng = np.random.default_rng(seed)
+  seeds = rng.random((num_seeds, 2)) * [height, width]
+  rows, cols = np.mgrid[:height, :width]
+  labels = cKDTree(seeds).query(np.column_stack([rows.ravel(), cols.ravel()]))[1].reshape(height, width)
+  labels[cols > 0.85 * width + 2 * np.sin(rows / 4)] = LAND_LABEL
+  sea = labels != LAND_LABEL
+  labels[sea] = np.unique(labels[sea], return_inverse=True)[1]
+  return labels, int(np.max(labels[sea])) + 1
+
+
+# The shared boundary lengths {(i, j): number of neighbouring pixel pairs} of the superpixels, one pixel at a time.
+def _touching_pairs(labels, num_sup_pixels, connectivity):
+  pairs = {}
+  height, width = labels.shape
+  for r in range(height):
+    for c in range(width):
+      for d_row, d_col in _OFFSETS[connectivity]:
+        if 0 <= r + d_row < height and 0 <= c + d_col < width:
+          i, j = labels[r, c], labels[r + d_row, c + d_col]
+          if i != j and i < num_sup_pixels and j < num_sup_pixels:
+            pairs[(i, j)] = pairs.get((i, j), 0) + 1
+            pairs[(j, i)] = pairs.get((j, i), 0) + 1
+  return pairs
+
+
+# The neighbour sets of skimage's rag_boundary(labels, edge_map) without the edge weights: every pixel is connected to
+# the smallest and the largest label of its 3x3 window (grey erosion and dilation), as in skimage.
+def _rag_boundary_neighbours(labels, num_sup_pixels):
+  footprint = ndi.generate_binary_structure(2, 2)
+  eroded = ndi.grey_erosion(labels, footprint=footprint)
+  dilated = ndi.grey_dilation(labels, footprint=footprint)
+  boundaries0, boundaries1 = eroded != labels, dilated != labels
+  labels_small = np.concatenate((eroded[boundaries0], labels[boundaries1]))
+  labels_large = np.concatenate((labels[boundaries0], dilated[boundaries1]))
+  rag = {num_sp: set() for num_sp in range(num_sup_pixels)}
+  for i, j in zip(labels_small, labels_large):
+    if j < num_sup_pixels:  # as the scripts, which left the land out of the neighbours
+      rag[i].add(j)
+      rag[j].add(i)
+  return rag
+
+
+@pytest.mark.parametrize('connectivity', [4, 8])
+@pytest.mark.parametrize('block_rows', [512, 7])
+def test_region_adjacency_equals_pixel_loop(connectivity, block_rows):
+  labels, num_sup_pixels = _segmentation()
+  pairs = _touching_pairs(labels, num_sup_pixels, connectivity)
+  lengths = region_adjacency(labels, num_sup_pixels, connectivity, boundary_lengths=True, block_rows=block_rows)
+  assert {(i, j): v for i, j, v in zip(*lengths.nonzero(), lengths.data)} == pairs
+  adjacency = region_adjacency(labels, num_sup_pixels, connectivity, block_rows=block_rows)
+  assert np.all(adjacency.data == 1)
+  for num_sp in range(num_sup_pixels):
+    assert list(neighbours(adjacency, num_sp)) == sorted(j for i, j in pairs if i == num_sp)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_rag_boundary_neighbours_are_kept(seed):
+  labels, num_sup_pixels = _segmentation(seed=seed)
+  adjacency = region_adjacency(labels, num_sup_pixels)
+  rag = _rag_boundary_neighbours(labels, num_sup_pixels)
+
+  # where no more than two superpixels meet, the smallest and the largest labels are the two of them
+  footprint = np.ones((3, 3), dtype=bool)
+  junction = ndi.generic_filter(labels, lambda window: np.unique(window).size, footprint=footprint,
+                                mode='nearest') > 2
+  for num_sp in range(num_sup_pixels):
+    missed = set(neighbours(adjacency, num_sp)) - rag[num_sp]
+    assert rag[num_sp] <= set(neighbours(adjacency, num_sp))
+    for other in missed:  # the pairs rag_boundary misses only touch at junctions
+      near_other = ndi.binary_dilation(labels == other, structure=footprint)
+      assert np.all(junction[(labels == num_sp) & near_other])
+
+
+def test_rag_boundary_misses_the_diagonal_of_a_junction_of_four():
+  labels = np.array([[0, 0, 1, 1],
+                     [0, 0, 1, 1],
+                     [2, 2, 3, 3],
+                     [2, 2, 3, 3]])
+  assert _rag_boundary_neighbours(labels, 4)[1] == {0, 3}
+  assert list(neighbours(region_adjacency(labels, 4), 1)) == [0, 2, 3]
+  assert list(neighbours(region_adjacency(labels, 4, connectivity=4), 1)) == [0, 3]
+
+
+def test_same_neighbours_as_skimage_rag_boundary():
+  graph = pytest.importorskip('skimage.graph')
+  labels, num_sup_pixels = _segmentation()
+  rag = graph.rag_boundary(labels, np.ones(labels.shape))
+  expected = _rag_boundary_neighbours(labels, num_sup_pixels)
+  for num_sp in range(num_sup_pixels):
+    assert {j for j in rag.adj[num_sp] if j < num_sup_pixels} == expected[num_sp]
@@ -0,0 +1,139 @@
+# The vectorized HLT distances and the matrices W must equal the per-pair loops of the original scripts
+# (max_HLT_distance_metric, euclidean_norm_distance_metric and the loops that filled W one pair at a time).
+
+import numpy as np
+import scipy.sparse as sp
+
+from lgc_classifier.affinity import full_affinity, knn_affinity, weighted_neighbour_means
+from lgc_classifier.hlt import inverse_store, max_hlt_distance_block, euclidean_distance_block
+from lgc_classifier.parallel import parallel_affinity
+from lgc_classifier.sweep import SuperpixelDistances
+
+BETA, SIGMA_S, SIGMA_L, WEIGHT_SCALAR, K_NN = .9, 10, 100, 10, 6
+
+
+# The coherence matrix of the CP (4 elements) or QP (9 elements) coherence elements m, as in the original scripts.
+def _coherence_matrix(m):
+  if len(m) == 4:
+    return np.array([[m[0], m[1]], [m[1], m[2]]]) + 1j * np.array([[0, m[3]], [-m[3], 0]])
+  return (np.array([[m[0], m[1], m[3]], [m[1], m[2], m[4]], [m[3], m[4], m[5]]])
+          + 1j * np.array([[0, m[6], m[7]], [-m[6], 0, m[8]], [-m[7], -m[8], 0]]))
+
+
+def _max_hlt_distance(m_sp_i, m_sp_j):
+  coh1, coh2 = _coherence_matrix(m_sp_i), _coherence_matrix(m_sp_j)
+  hlt1 = np.real(np.trace(np.linalg.inv(coh1) @ coh2))
+  hlt2 = np.real(np.trace(np.linalg.inv(coh2) @ coh1))
+  return max(hlt1, hlt2)
+
+
+def _euclidean_distance(m_sp_i, m_sp_j):
+  return np.sum(np.power(m_sp_i - m_sp_j, 2))
+
+
+def _weight(S_i_m, S_i_w, S_i_p, r, c, complex_only):
+  distance = _max_hlt_distance if complex_only else _euclidean_distance
+  s = np.exp(((BETA - 1) * distance(S_i_w[r], S_i_w[c])) - (BETA * distance(S_i_m[r], S_i_m[c])) /
+             (2 * np.power(SIGMA_S, 2)))
+  l = np.exp(-_euclidean_distance(S_i_p[r], S_i_p[c]) / (2 * np.power(SIGMA_L, 2)))
+  return s * l
+
+
+# The full spatial correlation effect: every pair num_sp_c > num_sp_r, then mirrored.
+def _baseline_full_W(S_i_m, S_i_w, S_i_p, complex_only):
+  num_sup_pixels = S_i_m.shape[0]
+  W = np.zeros((num_sup_pixels, num_sup_pixels))
+  for r in range(num_sup_pixels):
+    for c in range(r + 1, num_sup_pixels):
+      W[r, c] = _weight(S_i_m, S_i_w, S_i_p, r, c, complex_only)
+  return W + W.T
+
+
+def test_distance_blocks(statistics):
+  S_i_m, S_i_w, _, complex_only = statistics
+  elems_i, elems_j = S_i_m[:20], S_i_w
+  if not complex_only:
+    expected = np.array([[_euclidean_distance(m_i, m_j) for m_j in elems_j] for m_i in elems_i])
+    np.testing.assert_allclose(euclidean_distance_block(elems_i, elems_j), expected, rtol=1e-12)
+    return
+  expected = np.array([[_max_hlt_distance(m_i, m_j) for m_j in elems_j] for m_i in elems_i])
+  np.testing.assert_allclose(max_hlt_distance_block(elems_i, elems_j), expected, rtol=3e-14)
+  np.testing.assert_allclose(max_hlt_distance_block(elems_i, elems_j, inverse_store(elems_i), inverse_store(elems_j)),
+                             expected, rtol=3e-14)
+
+
+def test_full_affinity(statistics):
+  S_i_m, S_i_w, S_i_p, complex_only = statistics
+  W = full_affinity(S_i_m, S_i_w, S_i_p, BETA, SIGMA_S, SIGMA_L, complex_only, block_rows=7)
+  np.testing.assert_allclose(W, _baseline_full_W(S_i_m, S_i_w, S_i_p, complex_only), rtol=1e-12)
+  assert np.count_nonzero(W) == W.size - W.shape[0]  # no weight underflows, the diagonal is zero
+
+
+# Every superpixel connected to its K_NN spatially nearest superpixels (W is not symmetric).
+def _baseline_knn_W(S_i_m, S_i_w, S_i_p, complex_only):
+  num_sup_pixels = S_i_m.shape[0]
+  dist = np.zeros((num_sup_pixels, num_sup_pixels))
+  for r in range(num_sup_pixels):
+    for c in range(r + 1, num_sup_pixels):
+      dist[r, c] = _euclidean_distance(S_i_p[r], S_i_p[c])
+  dist += dist.T
+  argsorted = np.argsort(dist, axis=1)
+  W = np.zeros((num_sup_pixels, num_sup_pixels))
+  for r in range(num_sup_pixels):
+    for sort in range(1, K_NN + 1):
+      W[r, argsorted[r, sort]] = _weight(S_i_m, S_i_w, S_i_p, r, argsorted[r, sort], complex_only)
+  return W
+
+
+def test_knn_affinity(statistics):
+  S_i_m, S_i_w, S_i_p, complex_only = statistics
+  W_knn = _baseline_knn_W(S_i_m, S_i_w, S_i_p, complex_only)
+  W = knn_affinity(S_i_m, S_i_w, S_i_p, K_NN, BETA, SIGMA_S, SIGMA_L, complex_only)
+  assert sp.issparse(W)
+  # knn_affinity also keeps the pair (c, r) of every pair (r, c) of the original loop
+  np.testing.assert_allclose(W.toarray(), np.where(W_knn != 0, W_knn, W_knn.T), rtol=1e-12)
+
+
+def test_parallel_affinity_equals_full_affinity(statistics):
+  S_i_m, S_i_w, S_i_p, complex_only = statistics
+  W = full_affinity(S_i_m, S_i_w, S_i_p, BETA, SIGMA_S, SIGMA_L, complex_only)
+  for tile in (16, 256):
+    np.testing.assert_array_equal(parallel_affinity(S_i_m, S_i_w, S_i_p, BETA, SIGMA_S, SIGMA_L, complex_only,
+                                                    num_workers=2, tile=tile), W)
+
+
+# S_i_w of the original scripts from the sorted neighbour lists of every superpixel.
+def _baseline_S_i_w(S_i_m, adjacency, complex_only):
+  distance = _max_hlt_distance if complex_only else _euclidean_distance
+  S_i_w = np.zeros(S_i_m.shape)
+  for i in range(S_i_m.shape[0]):
+    neighbours = sorted(adjacency[i].indices)
+    w_i_zj = np.array([np.exp(-distance(S_i_m[i], S_i_m[j]) / WEIGHT_SCALAR) for j in neighbours])
+    for w, j in zip(w_i_zj / np.sum(w_i_zj), neighbours):
+      S_i_w[i] += w * S_i_m[j]
+  return S_i_w
+
+
+def test_weighted_neighbour_means(statistics):
+  S_i_m, _, _, complex_only = statistics
+  num_sup_pixels = S_i_m.shape[0]
+  rng = np.random.default_rng(4)
+  pairs = rng.integers(0, num_sup_pixels - 1, (2, 3 * num_sup_pixels))  # the last superpixel has no neighbours
+  pairs = pairs[:, pairs[0] != pairs[1]]
+  adjacency = sp.csr_matrix((np.ones(pairs.shape[1]), (pairs[0], pairs[1])), shape=(num_sup_pixels, num_sup_pixels))
+  adjacency = (adjacency + adjacency.T).tocsr()
+  adjacency.data[:] = 1
+
+  S_i_w = weighted_neighbour_means(S_i_m, adjacency, WEIGHT_SCALAR, complex_only)
+  np.testing.assert_allclose(S_i_w[:-1], _baseline_S_i_w(S_i_m[:-1], adjacency[:-1, :-1], complex_only), rtol=1e-12)
+  np.testing.assert_array_equal(S_i_w[-1], 0)
+
+
+def test_superpixel_distances_affinity(statistics):
+  S_i_m, S_i_w, S_i_p, complex_only = statistics
+  distances = SuperpixelDistances(S_i_m, S_i_w, S_i_p, complex_only, block_rows=7)
+  np.testing.assert_array_equal(distances.affinity(BETA, SIGMA_S, SIGMA_L),
+                                full_affinity(S_i_m, S_i_w, S_i_p, BETA, SIGMA_S, SIGMA_L, complex_only))
+  distances = SuperpixelDistances(S_i_m, S_i_w, S_i_p, complex_only, K_NN=K_NN)
+  np.testing.assert_array_equal(distances.affinity(BETA, SIGMA_S, SIGMA_L).toarray(),
+                                knn_affinity(S_i_m, S_i_w, S_i_p, K_NN, BETA, SIGMA_S, SIGMA_L, complex_only).toarray())
@@ -0,0 +1,90 @@
+# The batch runner must pass every scene its folders and parameters (those of the scene replacing those of the batch),
+# and report a scene whose script fails without stopping the other scenes.
+
+import json
+import os
+import textwrap
+
+import pytest
+
+from lgc_classifier import batch
+from lgc_classifier.config import SCENE_CONFIG_VARIABLE, override_parameters, scene_config
+
+# A classification script that writes the parameters it ends up with, and fails for a scene without input files.
+FAKE_SCRIPT = '''
+import json
+import os
+from lgc_classifier.config import scene_config, override_parameters
+
+MIU = 0.1
+SHOW_RAG = True
+SHOW_PLOTS = True
+SAVE_PLOTS = True
+scene = scene_config()
+override_parameters(globals(), scene['parameters'])
+with open('irgs_to_slic.mat') as f:  # the working directory is the folder of the input files
+  pass
+with open(os.path.join(scene['output_dir'], 'parameters.json'), 'w') as f:
+  json.dump({'MIU': MIU, 'SHOW_PLOTS': SHOW_PLOTS, 'SAVE_PLOTS': SAVE_PLOTS}, f)
+'''
+
+
+def test_override_parameters():
+  namespace = {'MIU': .1, 'K_NN': 0}
+  override_parameters(namespace, {'MIU': 1})
+  assert namespace == {'MIU': 1, 'K_NN': 0}
+  with pytest.raises(ValueError, match='KNN, MUI'):
+    override_parameters(namespace, {'MUI': 1, 'KNN': 10, 'K_NN': 10})
+  assert namespace == {'MIU': 1, 'K_NN': 0}  # nothing is set if a name is unknown
+
+
+def test_scene_config(tmp_path, monkeypatch):
+  monkeypatch.delenv(SCENE_CONFIG_VARIABLE, raising=False)
+  assert scene_config() is None
+  (tmp_path / 'scene_config.json').write_text(json.dumps({'name': 'scene_1', 'parameters': {'MIU': 1}}))
+  monkeypatch.setenv(SCENE_CONFIG_VARIABLE, str(tmp_path / 'scene_config.json'))
+  assert scene_config() == {'name': 'scene_1', 'parameters': {'MIU': 1}}
+
+
+def test_scene_configs(tmp_path, monkeypatch):
+  monkeypatch.chdir(tmp_path)
+  config = {'parameters': {'MIU': .1, 'K_NN': 10}, 'output_dir': 'results', 'plot': True,
+            'scenes': ['data/scene_1', {'name': 'second', 'input_dir': 'data/s2', 'labels_dir': 'data/s2/train',
+                                        'parameters': {'MIU': 1}}]}
+  scenes = batch._scene_configs(config, str(tmp_path / 'batch'), ['scene_3'])
+  assert [scene['name'] for scene in scenes] == ['scene_1', 'second', 'scene_3']
+  assert scenes[0]['input_dir'] == os.path.join(str(tmp_path), 'batch', 'data', 'scene_1', '')
+  assert scenes[0]['labels_dir'] == scenes[0]['input_dir']
+  assert scenes[1]['labels_dir'] == os.path.join(str(tmp_path), 'batch', 'data', 's2', 'train', '')
+  assert scenes[2]['input_dir'] == os.path.join(str(tmp_path), 'scene_3', '')  # relative to the current directory
+  assert scenes[1]['output_dir'] == os.path.join(str(tmp_path), 'batch', 'results', 'second', '')
+  assert scenes[0]['parameters'] == {'MIU': .1, 'K_NN': 10, 'SHOW_RAG': False, 'SHOW_PLOTS': False, 'SAVE_PLOTS': True}
+  assert scenes[1]['parameters']['MIU'] == 1
+
+  with pytest.raises(ValueError, match='scene_1'):
+    batch._scene_configs({'scenes': ['data/scene_1', 'other/scene_1']}, str(tmp_path))
+  with pytest.raises(ValueError, match='Unknown classifier'):
+    batch.run_batch({'classifier': 'lgc', 'scenes': ['data/scene_1']}, str(tmp_path))
+
+
+def test_failing_scene_does_not_stop_the_batch(tmp_path, monkeypatch, capsys):
+  script = tmp_path / 'fake_classifier.py'
+  script.write_text(textwrap.dedent(FAKE_SCRIPT))
+  monkeypatch.setitem(batch.CLASSIFIER_SCRIPTS, 'lgc_cp', str(script))
+  monkeypatch.setenv('PYTHONPATH', batch._REPOSITORY)
+  for name in ('scene_1', 'scene_2', 'scene_3'):
+    os.makedirs(str(tmp_path / name))
+    if name != 'scene_2':  # scene_2 has no input files, so its script fails
+      (tmp_path / name / 'irgs_to_slic.mat').write_text('')
+  config = {'classifier': 'lgc_cp', 'parameters': {'MIU': .5}, 'output_dir': 'results', 'max_workers': 2,
+            'scenes': ['scene_1', 'scene_2', {'input_dir': 'scene_3', 'parameters': {'MIU': 2}}]}
+  (tmp_path / 'config.json').write_text(json.dumps(config))
+
+  assert batch.main([str(tmp_path / 'config.json')]) == 1
+  assert capsys.readouterr().out.splitlines()[-1] == '2 of 3 scenes classified; failed: scene_2'
+  with open(str(tmp_path / 'results' / 'scene_1' / 'parameters.json')) as f:
+    assert json.load(f) == {'MIU': .5, 'SHOW_PLOTS': False, 'SAVE_PLOTS': False}
+  with open(str(tmp_path / 'results' / 'scene_3' / 'parameters.json')) as f:
+    assert json.load(f)['MIU'] == 2
+  assert not (tmp_path / 'results' / 'scene_2' / 'parameters.json').exists()
+  assert 'irgs_to_slic.mat' in (tmp_path / 'results' / 'scene_2' / 'scene_2.log').read_text()
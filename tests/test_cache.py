@@ -0,0 +1,76 @@
+# The cache of the superpixel statistics: the entries must load as they were saved, the key must change with the
+# contents of the input files and with the parameters, and the least recently used entries must be removed first.
+
+import os
+
+import numpy as np
+import scipy.sparse as sp
+
+from lgc_classifier.cache import cache_key, load_statistics, save_statistics, evict
+
+
+def _statistics(seed=0):
+  rng = np.random.default_rng(seed)
+  adjacency = sp.random(30, 30, density=.2, random_state=rng, format='csr')
+  return {'num_sup_pixels': 30, 'there_is_land': True, 'adjacency': adjacency + adjacency.T,
+          'S_i_m': rng.random((30, 4)), 'S_i_p': rng.integers(0, 100, (30, 2)), 'S_i_w': rng.random((30, 4))}
+
+
+def test_round_trip(tmp_path):
+  statistics = _statistics()
+  save_statistics(str(tmp_path), 'key', statistics)
+  loaded = load_statistics(str(tmp_path), 'key')
+  assert set(loaded) == set(statistics)
+  assert loaded['num_sup_pixels'] == 30 and isinstance(loaded['num_sup_pixels'], int)
+  assert loaded['there_is_land'] is True
+  assert sp.isspmatrix_csr(loaded['adjacency'])
+  np.testing.assert_array_equal(loaded['adjacency'].toarray(), statistics['adjacency'].toarray())
+  for name in ('S_i_m', 'S_i_p', 'S_i_w'):
+    assert loaded[name].dtype == statistics[name].dtype
+    np.testing.assert_array_equal(loaded[name], statistics[name])
+
+
+def test_miss_and_damaged_entry(tmp_path):
+  assert load_statistics(str(tmp_path), 'key') is None
+  (tmp_path / 'key.npz').write_bytes(b'not a zip file')
+  assert load_statistics(str(tmp_path), 'key') is None
+  assert not (tmp_path / 'key.npz').exists()
+
+
+def test_key_follows_contents_and_parameters(tmp_path):
+  segmentation, features = tmp_path / 'irgs_to_slic.mat', tmp_path / 'SV.tif'
+  segmentation.write_bytes(b'segmentation')
+  features.write_bytes(b'features')
+  paths = [str(segmentation), str(features)]
+  parameters = {'complex_cp_only': True, 'WEIGHT_SCALAR': 10, 'FEATURE_DTYPE': None, 'STREAM_FEATURES': False}
+
+  key = cache_key(paths, parameters)
+  assert cache_key(paths, dict(reversed(list(parameters.items())))) == key  # the order of the parameters is irrelevant
+  assert cache_key(paths, dict(parameters, STREAM_FEATURES=True)) != key
+  assert cache_key(paths, dict(parameters, WEIGHT_SCALAR=1)) != key
+  os.utime(str(features), (0, 0))  # the time stamps are irrelevant
+  assert cache_key(paths, parameters) == key
+  features.write_bytes(b'other features')
+  assert cache_key(paths, parameters) != key
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+  cache_dir = str(tmp_path)
+  for num, key in enumerate(['a', 'b', 'c']):
+    save_statistics(cache_dir, key, _statistics(num))
+    os.utime(os.path.join(cache_dir, key + '.npz'), (1000 + num, 1000 + num))
+  sizes = {key: os.path.getsize(os.path.join(cache_dir, key + '.npz')) for key in 'abc'}
+
+  assert load_statistics(cache_dir, 'a') is not None  # a hit: 'a' is now the most recently used entry
+  evict(cache_dir, sizes['a'] + sizes['c'])
+  assert sorted(name for name in os.listdir(cache_dir) if name.endswith('.npz')) == ['a.npz', 'c.npz']
+
+  save_statistics(str(tmp_path / 'other'), 'd', _statistics(3))
+  sizes['d'] = os.path.getsize(str(tmp_path / 'other' / 'd.npz'))
+  # one entry has to go for 'd' to fit, and 'c' is the least recently used one
+  save_statistics(cache_dir, 'd', _statistics(3), max_bytes=sizes['a'] + sizes['c'] + sizes['d'] - 1)
+  assert load_statistics(cache_dir, 'c') is None
+  assert load_statistics(cache_dir, 'a') is not None and load_statistics(cache_dir, 'd') is not None
+
+  evict(cache_dir, 0)
+  assert os.listdir(cache_dir) == ['other']
@@ -0,0 +1,91 @@
+# The vectorized accuracy assessment must give the labels and the test image of the per-sample loop of the original
+# scripts (border samples and samples at the same place included), and the confusion matrix, kappa and accuracy of
+# scikit-learn.
+
+import numpy as np
+import pytest
+from sklearn.metrics import accuracy_score, cohen_kappa_score, confusion_matrix as sklearn_confusion_matrix
+
+from lgc_classifier import evaluation  # not its test_sample_labels, which pytest would collect
+from lgc_classifier.evaluation import confusion_matrix, cohen_kappa, accuracy
+
+
+# The loop of the original scripts; the mode of a square is the smallest of its most frequent labels (scipy.stats.mode).
+def _baseline_test_sample_labels(predicted_labels, csv_file_test, Cluste_based_testing):
+  true_labels_test = np.zeros(csv_file_test.shape[0])
+  pred_labels_test = np.zeros_like(true_labels_test)
+  true_label_test_image = np.zeros_like(predicted_labels)
+  for num_labled_test in range(0, csv_file_test.shape[0]):
+    row_test = csv_file_test[num_labled_test, 2] - 1
+    col_test = csv_file_test[num_labled_test, 1] - 1
+    true_labels_test[num_labled_test] = csv_file_test[num_labled_test, 0]
+    if (Cluste_based_testing and row_test > 0 and row_test < predicted_labels.shape[0] - 1 and col_test > 0 and
+        col_test < predicted_labels.shape[1] - 1):
+      square = predicted_labels[row_test - 1:row_test + 2, col_test - 1:col_test + 2]
+      values, counts = np.unique(square, return_counts=True)
+      pred_labels_test[num_labled_test] = values[np.argmax(counts)]
+      true_label_test_image[row_test - 1:row_test + 2, col_test - 1:col_test + 2] = csv_file_test[num_labled_test, 0]
+    else:
+      pred_labels_test[num_labled_test] = predicted_labels[row_test, col_test]
+      true_label_test_image[row_test, col_test] = csv_file_test[num_labled_test, 0]
+  return true_labels_test, pred_labels_test, true_label_test_image
+
+
+# A predicted image of 4 classes in small patches (so that the squares hold several labels, with ties) and test samples
+# (label, column, row; from 1) that include all the borders and corners, a row 0 (the last row, as in the loop's
+# negative indexing), overlapping squares and samples at the same pixel with different labels.
+def _image_and_samples(seed=0):
+  rng = np.random.default_rng(seed)
+  predicted_labels = np.kron(rng.integers(1, 5, (12, 10)), np.ones((2, 2))).astype(float)
+  height, width = predicted_labels.shape
+  rows = rng.integers(1, height + 1, 150)
+  cols = rng.integers(1, width + 1, 150)
+  border = np.array([[1, 1], [1, width], [height, 1], [height, width], [5, 1], [1, 7], [height, 9], [11, width],
+                     [0, 4], [2, 2], [2, 3], [8, 8], [8, 8], [8, 8]])
+  rows, cols = np.concatenate((rows, border[:, 0])), np.concatenate((cols, border[:, 1]))
+  csv_file_test = np.column_stack([rng.integers(1, 5, rows.size), cols, rows])
+  return predicted_labels, csv_file_test
+
+
+@pytest.mark.parametrize('Cluste_based_testing', [True, False])
+@pytest.mark.parametrize('seed', range(3))
+def test_same_as_per_sample_loop(Cluste_based_testing, seed):
+  predicted_labels, csv_file_test = _image_and_samples(seed)
+  results = evaluation.test_sample_labels(predicted_labels, csv_file_test, Cluste_based_testing)
+  expected = _baseline_test_sample_labels(predicted_labels, csv_file_test, Cluste_based_testing)
+  for result, expected_result in zip(results, expected):
+    np.testing.assert_array_equal(result, expected_result)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_scores_same_as_sklearn(seed):
+  predicted_labels, csv_file_test = _image_and_samples(seed)
+  true_labels_test, pred_labels_test, _ = evaluation.test_sample_labels(predicted_labels, csv_file_test, True)
+  np.testing.assert_array_equal(confusion_matrix(true_labels_test, pred_labels_test),
+                                sklearn_confusion_matrix(true_labels_test, pred_labels_test))
+  assert cohen_kappa(true_labels_test, pred_labels_test) == pytest.approx(
+    cohen_kappa_score(true_labels_test, pred_labels_test), abs=1e-14)
+  assert accuracy(true_labels_test, pred_labels_test) == accuracy_score(true_labels_test, pred_labels_test)
+
+
+# A class that is never predicted, and one that is predicted but never true, are rows and columns of the matrix.
+def test_classes_of_either_labels():
+  true_labels_test = np.array([1, 1, 2, 2, 3, 3])
+  pred_labels_test = np.array([1, 2, 2, 2, 4, 1])
+  np.testing.assert_array_equal(confusion_matrix(true_labels_test, pred_labels_test),
+                                sklearn_confusion_matrix(true_labels_test, pred_labels_test))
+  assert cohen_kappa(true_labels_test, pred_labels_test) == pytest.approx(
+    cohen_kappa_score(true_labels_test, pred_labels_test), abs=1e-14)
+
+
+# Without test_image, a memory-mapped predicted image is only read at the test samples.
+def test_without_test_image(tmp_path):
+  predicted_labels, csv_file_test = _image_and_samples()
+  mapped = np.memmap(str(tmp_path / 'predicted.dat'), dtype=np.float64, mode='w+', shape=predicted_labels.shape)
+  mapped[...] = predicted_labels
+  true_labels_test, pred_labels_test, true_label_test_image = evaluation.test_sample_labels(mapped, csv_file_test, True,
+                                                                                           test_image=False)
+  assert true_label_test_image is None
+  expected = evaluation.test_sample_labels(predicted_labels, csv_file_test, True)
+  np.testing.assert_array_equal(true_labels_test, expected[0])
+  np.testing.assert_array_equal(pred_labels_test, expected[1])
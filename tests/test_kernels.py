@@ -0,0 +1,72 @@
+# The numba kernels must give the S_i_w and W of the NumPy kernels (up to the rounding of exp), and selecting the numba
+# backend without numba must fail with a clear error and leave the NumPy backend in place.
+
+import importlib.util
+
+import numpy as np
+import pytest
+import scipy.sparse as sp
+
+from lgc_classifier import kernels
+from lgc_classifier.affinity import affinity_block, full_affinity, knn_affinity, weighted_neighbour_means
+from lgc_classifier.parallel import parallel_affinity
+
+BETA, SIGMA_S, SIGMA_L, WEIGHT_SCALAR, K_NN = .9, 10, 100, 10, 6
+
+
+@pytest.fixture
+def numpy_backend_after():
+  yield
+  kernels.set_backend('numpy')
+
+
+# S_i_w and the full, k-NN and block W of statistics with the current backend.
+def _kernel_results(S_i_m, S_i_w, S_i_p, complex_only):
+  rng = np.random.default_rng(5)
+  num_sup_pixels = S_i_m.shape[0]
+  adjacency = sp.random(num_sup_pixels, num_sup_pixels, density=.1, random_state=rng, format='csr')
+  adjacency = (adjacency + adjacency.T).tocsr()
+  adjacency.setdiag(0)
+  adjacency.eliminate_zeros()
+  adjacency.data[:] = 1
+  return [weighted_neighbour_means(S_i_m, adjacency, WEIGHT_SCALAR, complex_only),
+          full_affinity(S_i_m, S_i_w, S_i_p, BETA, SIGMA_S, SIGMA_L, complex_only, block_rows=7),
+          knn_affinity(S_i_m, S_i_w, S_i_p, K_NN, BETA, SIGMA_S, SIGMA_L, complex_only).toarray(),
+          affinity_block(S_i_m, S_i_w, S_i_p, slice(3, 40), np.array([5, 1, 50]), BETA, SIGMA_S, SIGMA_L,
+                         complex_only)]
+
+
+def test_numba_kernels_equal_numpy_kernels(statistics, numpy_backend_after):
+  pytest.importorskip('numba')
+  kernels.set_backend('numpy')
+  expected = _kernel_results(*statistics)
+  kernels.set_backend('numba')
+  assert kernels.use_jit()
+  for result, numpy_result in zip(_kernel_results(*statistics), expected):
+    np.testing.assert_allclose(result, numpy_result, rtol=1e-13, atol=0)
+
+
+# The forked workers of parallel_affinity run the numba kernels too (and must exit, which they may not on TBB threads).
+def test_numba_kernels_in_forked_workers(statistics, numpy_backend_after):
+  pytest.importorskip('numba')
+  kernels.set_backend('numba')
+  S_i_m, S_i_w, S_i_p, complex_only = statistics
+  W = full_affinity(S_i_m, S_i_w, S_i_p, BETA, SIGMA_S, SIGMA_L, complex_only)
+  np.testing.assert_array_equal(parallel_affinity(S_i_m, S_i_w, S_i_p, BETA, SIGMA_S, SIGMA_L, complex_only,
+                                                  num_workers=2, tile=16), W)
+
+
+def test_numba_backend_without_numba(monkeypatch, numpy_backend_after):
+  find_spec = importlib.util.find_spec
+  monkeypatch.setattr(importlib.util, 'find_spec', lambda name, *args: None if name == 'numba' else
+                      find_spec(name, *args))
+  with pytest.raises(ImportError, match='numba'):
+    kernels.set_backend('numba')
+  assert kernels.get_backend() == 'numpy'
+  kernels.set_backend('auto')
+  assert kernels.get_backend() == 'numpy'
+
+
+def test_unknown_backend():
+  with pytest.raises(ValueError):
+    kernels.set_backend('cuda')
@@ -0,0 +1,62 @@
+# The Nystrom approximation of W must give the F of the exact solve (lgc_solve with the W of full_affinity) when every
+# superpixel is an anchor, and close soft labels and mostly the same classes with half of them.
+
+import numpy as np
+import pytest
+
+from lgc_classifier.affinity import full_affinity
+from lgc_classifier.lowrank import NystromAffinity, compare_to_exact, nystrom_lgc_solve, select_anchors
+from lgc_classifier.solver import lgc_solve, sp_classes
+
+# SIGMA_S = 1 keeps W positive definite, so that no eigenvalue of A is dropped with all the anchors.
+BETA, SIGMA_S, SIGMA_L, MIU = .9, 1, 100, .1
+
+
+def _labels(num_sup_pixels, num_classes=3, seed=7):
+  Y = np.zeros((num_sup_pixels, num_classes))
+  labelled = np.random.default_rng(seed).choice(num_sup_pixels, 3 * num_classes, replace=False)
+  Y[labelled, np.arange(labelled.size) % num_classes] = 1
+  return Y
+
+
+@pytest.fixture
+def exact(statistics):
+  W = full_affinity(*statistics[:3], BETA, SIGMA_S, SIGMA_L, statistics[3])
+  Y = _labels(W.shape[0])
+  return W, Y, lgc_solve(W, Y, MIU, method='direct')[0]
+
+
+def test_all_anchors_give_the_exact_solve(statistics, exact):
+  W, Y, F_exact = exact
+  W_nystrom = NystromAffinity(*statistics[:3], BETA, SIGMA_S, SIGMA_L, statistics[3], W.shape[0], sampling='random',
+                              random_state=0)
+  np.testing.assert_allclose(W_nystrom.toarray(), W, rtol=1e-8, atol=1e-12)
+  F, info = nystrom_lgc_solve(W_nystrom, Y, MIU)
+  assert info['residual'] < 1e-12
+  relative_difference, agreement = compare_to_exact(F, F_exact)
+  assert relative_difference < 1e-8
+  assert agreement == 1
+
+
+# Half of the superpixels as anchors: the Woodbury solve equals the exact solve with the approximate W, and the soft
+# labels and classes stay close to those with the exact W.
+def test_half_of_the_anchors(statistics, exact):
+  W, Y, F_exact = exact
+  W_nystrom = NystromAffinity(*statistics[:3], BETA, SIGMA_S, SIGMA_L, statistics[3], W.shape[0] // 2, random_state=0)
+  F = nystrom_lgc_solve(W_nystrom, Y, MIU)[0]
+  np.testing.assert_allclose(F, lgc_solve(W_nystrom.toarray(), Y, MIU, method='direct')[0], rtol=1e-8, atol=1e-12)
+  np.testing.assert_allclose(F, lgc_solve(W_nystrom, Y, MIU, method='cg', tol=1e-12)[0], rtol=1e-6,
+                             atol=1e-10)
+  relative_difference, agreement = compare_to_exact(F, F_exact)
+  assert relative_difference < .1
+  assert agreement >= .85
+  assert compare_to_exact(F, F_exact)[1] == np.mean(sp_classes(F) == sp_classes(F_exact))
+
+
+def test_select_anchors(statistics):
+  S_i_m, _, S_i_p, _ = statistics
+  anchors = select_anchors(S_i_m, S_i_p, 20, random_state=0)
+  assert anchors.size <= 20 and np.all(np.diff(anchors) > 0)
+  np.testing.assert_array_equal(select_anchors(S_i_m, S_i_p, 100, sampling='random'), np.arange(60))
+  with pytest.raises(ValueError):
+    select_anchors(S_i_m, S_i_p, 20, sampling='grid')
@@ -0,0 +1,42 @@
+# The out-of-core W of memmap_affinity must be the W of full_affinity bit for bit, and provide the same row sums and
+# products as the dense W to the LGC solver.
+
+import numpy as np
+import pytest
+
+from lgc_classifier.affinity import full_affinity
+from lgc_classifier.outofcore import MemmapAffinity, memmap_affinity
+from lgc_classifier.solver import degree_vector, lgc_solve
+
+BETA, SIGMA_S, SIGMA_L = .9, 10, 100
+
+
+# memory_budget 10**4 bytes gives tiles of 6 superpixels and blocks of 10 rows, 10**9 a single tile and block.
+@pytest.mark.parametrize('memory_budget', [10 ** 4, 10 ** 9])
+def test_memmap_affinity_equals_full_affinity(tmp_path, statistics, memory_budget):
+  S_i_m, S_i_w, S_i_p, complex_only = statistics
+  W = full_affinity(S_i_m, S_i_w, S_i_p, BETA, SIGMA_S, SIGMA_L, complex_only)
+  W_mapped = memmap_affinity(S_i_m, S_i_w, S_i_p, BETA, SIGMA_S, SIGMA_L, complex_only, str(tmp_path / 'W.dat'),
+                             memory_budget=memory_budget)
+  assert isinstance(W_mapped, MemmapAffinity)
+  assert W_mapped.shape == W.shape
+  np.testing.assert_array_equal(W_mapped.toarray(), W)
+
+  P = np.random.default_rng(0).random((W.shape[0], 3))
+  np.testing.assert_allclose(W_mapped @ P, W @ P, rtol=1e-13)
+  np.testing.assert_allclose(W_mapped @ P[:, 0], W @ P[:, 0], rtol=1e-13)
+  np.testing.assert_allclose(degree_vector(W_mapped), degree_vector(W), rtol=1e-13)
+
+
+def test_lgc_solve_with_memmap_affinity(tmp_path, statistics):
+  S_i_m, S_i_w, S_i_p, complex_only = statistics
+  W = full_affinity(S_i_m, S_i_w, S_i_p, BETA, SIGMA_S, SIGMA_L, complex_only)
+  W_mapped = memmap_affinity(S_i_m, S_i_w, S_i_p, BETA, SIGMA_S, SIGMA_L, complex_only, str(tmp_path / 'W.dat'),
+                             memory_budget=10 ** 4)
+  Y = np.zeros((W.shape[0], 3))
+  Y[[0, 10, 20, 30, 40, 50], [0, 1, 2, 0, 1, 2]] = 1
+  for method in ('cg', 'propagation'):
+    F = lgc_solve(W_mapped, Y, .1, method=method)[0]
+    np.testing.assert_allclose(F, lgc_solve(W, Y, .1, method=method)[0], rtol=1e-10, atol=1e-14)
+  with pytest.raises(ValueError):
+    lgc_solve(W_mapped, Y, .1, method='direct')
@@ -0,0 +1,60 @@
+# Painting through the lookup table must give the images of the per-superpixel np.where loops of the original scripts,
+# for the land areas too, also when the image is written into a memory-mapped array in row blocks.
+
+import numpy as np
+import pytest
+
+from lgc_classifier.painting import paint_superpixels
+
+LAND_LABEL = 10000000  # the label of the land areas in the oversegmentation
+NUM_CLASSES = 4
+
+
+# Superpixels 0 to 29 in blocks of a 23x17 image, a land area, and the values of the superpixels (one extra value, as in
+# a prediction of the scripts' arrays that have a row for the land).
+@pytest.fixture
+def scene():
+  rng = np.random.default_rng(0)
+  labels = np.kron(rng.permutation(30).reshape(6, 5), np.ones((4, 4), dtype=int))[:23, :17]
+  labels[15:, 12:] = LAND_LABEL
+  return labels, rng.integers(1, NUM_CLASSES + 1, 31)
+
+
+def test_predicted_image_equals_per_superpixel_loop(scene):
+  labels, sp_classes = scene
+  expected = np.empty_like(labels)
+  expected[:] = labels
+  for num_sp in range(0, 30):
+    expected[np.where(labels == num_sp)] = sp_classes[num_sp]
+
+  predicted_labels = paint_superpixels(labels, sp_classes, 30)  # land keeps its label
+  assert predicted_labels.dtype == labels.dtype
+  np.testing.assert_array_equal(predicted_labels, expected)
+  np.testing.assert_array_equal(paint_superpixels(labels, sp_classes, 30, block_rows=5), expected)
+
+
+def test_train_image_equals_per_superpixel_loop(scene):
+  labels, sp_classes = scene
+  Y = np.zeros((30, NUM_CLASSES))
+  labelled = np.arange(0, 30, 3)
+  Y[labelled, sp_classes[labelled] - 1] = 1
+  expected = np.zeros(labels.shape)
+  for num_sp in range(0, 30):
+    if any(i == 1 for i in Y[num_sp, :]):
+      for cl in range(1, NUM_CLASSES + 1):
+        if (Y[num_sp, cl - 1] == 1):
+          expected[np.where(labels == num_sp)] = cl
+
+  train_sp_classes = np.where(np.any(Y == 1, axis=1), NUM_CLASSES - np.argmax(Y[:, ::-1] == 1, axis=1), 0)
+  y_for_plot = paint_superpixels(labels, train_sp_classes, 30, fill=0, dtype=float)
+  assert y_for_plot.dtype == np.float64
+  np.testing.assert_array_equal(y_for_plot, expected)
+
+
+def test_memmap_out(tmp_path, scene):
+  labels, sp_classes = scene
+  out = np.memmap(str(tmp_path / 'predicted.dat'), dtype=np.uint8, mode='w+', shape=labels.shape)
+  assert paint_superpixels(labels, sp_classes, 30, fill=NUM_CLASSES + 1, out=out, block_rows=4) is out
+  expected = np.where(labels < 30, sp_classes[np.minimum(labels, 29)], NUM_CLASSES + 1)
+  np.testing.assert_array_equal(np.fromfile(str(tmp_path / 'predicted.dat'), dtype=np.uint8).reshape(labels.shape),
+                                expected)
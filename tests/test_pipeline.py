@@ -0,0 +1,58 @@
+# The streamed features of load_features must equal the ones preprocessed in memory, and initial_labels must map the
+# MAGIC labels of a sea ice classification to the classes of Y.
+
+import numpy as np
+import pytest
+import tifffile as tiff
+
+from lgc_classifier.pipeline import initial_labels, load_features
+from lgc_classifier.superpixels import LAND_LABEL
+
+
+# (file content, load_features arguments): a C.tif of 9 coherence elements, a SV.tif and a feats.tif
+CASES = {
+  'intensities': ('coherence', {'intensities': True, 'replace_nans': True}),
+  'intensities_normalized': ('coherence', {'intensities': True, 'replace_nans': True, 'normalize': True}),
+  'stokes': ('stokes', {'stokes': True}),
+  'stokes_normalized': ('stokes', {'stokes': True, 'normalize': True}),
+  'feats_normalized': ('feats', {'replace_nans': True, 'normalize': True}),
+}
+
+
+def _write(tmp_path, content):
+  rng = np.random.default_rng(1)
+  if content == 'coherence':
+    cube = rng.random((40, 30, 9))
+  elif content == 'stokes':
+    cube = rng.random((40, 30, 4)).astype(np.float32)
+  else:
+    cube = rng.random((40, 30, 5))
+  if content != 'stokes':  # a single NaN pixel in a channel that is used
+    cube[3, 4, 0] = np.nan
+  path = str(tmp_path / (content + '.tif'))
+  tiff.imwrite(path, cube, photometric='minisblack', planarconfig='contig')
+  return path
+
+
+@pytest.mark.parametrize('case', sorted(CASES))
+def test_streamed_features_equal_in_memory(tmp_path, case):
+  content, args = CASES[case]
+  path = _write(tmp_path, content)
+  in_memory = load_features(path, **args)
+  streamed = load_features(path, stream=True, **args)
+  assert streamed.shape == in_memory.shape
+  np.testing.assert_array_equal(streamed.toarray(), in_memory)
+  if args.get('normalize'):
+    assert np.all(np.max(in_memory, axis=(0, 1)) == 1)
+
+
+def test_initial_labels_of_sea_ice_classification():
+  labels = np.array([[0, 0, 1, 1], [2, 2, 3, LAND_LABEL]])
+  # (label, column, row) from 1: NI and YI in superpixel 0, an unlabelled pixel, FYI, MYI and OW on land
+  csv_file = np.array([[1, 1, 1], [3, 2, 1], [-1, 3, 1], [6, 1, 2], [12, 3, 2], [15, 4, 2]])
+  Y = initial_labels(labels, csv_file, 4, 4, sea_ice_classification=True, exclusive=False)
+  np.testing.assert_array_equal(Y, [[1, 1, 0, 0], [0, 0, 0, 0], [0, 0, 1, 0], [0, 0, 0, 1]])
+  Y = initial_labels(labels, csv_file, 4, 3, sea_ice_classification=True)  # OW/NI is not a class
+  np.testing.assert_array_equal(Y, [[1, 0, 0], [0, 0, 0], [0, 1, 0], [0, 0, 1]])
+  with pytest.raises(ValueError, match='3 or 4 classes'):
+    initial_labels(labels, csv_file, 4, 5, sea_ice_classification=True)
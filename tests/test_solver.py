@@ -0,0 +1,81 @@
+# The LGC solvers must give F = beta_f * (I - alfa_f * S)^-1 * Y of the original scripts (dense inverse), and the
+# predicted classes of the superpixels must be the same wherever they are obtained from F (the script's result, the
+# MIU sweep, the parameter sweep), ties included.
+
+import numpy as np
+import pytest
+import scipy.sparse as sp
+
+from lgc_classifier.solver import normalized_affinity, lgc_solve, sp_classes, lgc_miu_sweep
+
+
+# A Gaussian affinity W of num_sup_pixels random centroids and a Y with three labelled superpixels per class.
+def _graph(num_sup_pixels=80, num_classes=3, seed=3):
+  rng = np.random.default_rng(seed)
+  centroids = rng.random((num_sup_pixels, 2)) * 50
+  W = np.exp(-np.sum((centroids[:, None] - centroids[None]) ** 2, axis=2) / 200)
+  W[np.diag_indices_from(W)] = 0
+  Y = np.zeros((num_sup_pixels, num_classes))
+  Y[rng.choice(num_sup_pixels, 3 * num_classes, replace=False), np.arange(3 * num_classes) % num_classes] = 1
+  return W, Y
+
+
+# F of the original scripts: beta_f * inv(I - alfa_f * S) @ Y
+def _dense_F(W, Y, MIU):
+  beta_f = MIU / (MIU + 1)
+  alfa_f = 1 - beta_f
+  return beta_f * np.linalg.inv(np.identity(W.shape[0]) - alfa_f * normalized_affinity(W)) @ Y
+
+
+@pytest.mark.parametrize('method, max_error', [('cg', 1e-10), ('propagation', 1e-8), ('direct', 1e-14)])
+@pytest.mark.parametrize('sparse', [False, True])
+@pytest.mark.parametrize('MIU', [.1, 1])
+def test_lgc_solve_equals_dense_inverse(method, max_error, sparse, MIU):
+  W, Y = _graph()
+  F_dense = _dense_F(W, Y, MIU)
+  F, info = lgc_solve(sp.csr_matrix(W) if sparse else W, Y, MIU, method=method, tol=1e-10, max_iter=1000)
+  assert info['method'] == method
+  assert info['iterations'] < 1000
+  assert np.linalg.norm(F - F_dense) / np.linalg.norm(F_dense) < max_error
+  np.testing.assert_array_equal(sp_classes(F), sp_classes(F_dense))
+
+
+# With too few iterations for SOLVER_TOL, the iterative solvers stop at SOLVER_MAX_ITER and report the residual reached.
+@pytest.mark.parametrize('method', ['cg', 'propagation'])
+def test_lgc_solve_stops_at_max_iter(method):
+  W, Y = _graph()
+  F, info = lgc_solve(W, Y, .01, method=method, tol=1e-10, max_iter=3)
+  assert info['iterations'] == 3
+  assert info['residual'] > 1e-10
+  assert np.all(np.isfinite(F))
+
+  F_loose, info_loose = lgc_solve(W, Y, .01, method=method, tol=.5, max_iter=1000)
+  assert info_loose['iterations'] < 1000
+  assert info_loose['residual'] > 1e-10
+
+
+def test_lgc_solve_unknown_method():
+  W, Y = _graph()
+  with pytest.raises(ValueError):
+    lgc_solve(W, Y, .1, method='inverse')
+
+
+def test_sp_classes_ties_go_to_the_last_class():
+  F = np.array([[0.1, 0.7, 0.2],
+                [0.0, 0.0, 0.0],  # e.g., a component without labelled superpixels
+                [0.5, 0.5, 0.1],
+                [0.3, 0.2, 0.3]])
+  np.testing.assert_array_equal(sp_classes(F), [2, 3, 2, 3])
+  np.testing.assert_array_equal(sp_classes(F), np.argsort(F, axis=1)[:, -1] + 1)
+
+
+def test_miu_sweep_labels_are_sp_classes():
+  rng = np.random.default_rng(0)
+  W = rng.random((30, 30))
+  W = W + W.T
+  W[np.diag_indices_from(W)] = 0
+  Y = np.zeros((30, 3))
+  Y[[0, 5, 9], [0, 1, 2]] = 1
+  MIU_values = [0.01, 0.1, 1]
+  for F, sp_labels in zip(lgc_miu_sweep(W, Y, MIU_values), lgc_miu_sweep(W, Y, MIU_values, return_labels=True)):
+    np.testing.assert_array_equal(sp_labels, sp_classes(F))
@@ -0,0 +1,73 @@
+# TiffFeatures must read the same HxWxC cube as tiff.imread (the channels last), whatever the layout of the file.
+
+import numpy as np
+import pytest
+import tifffile as tiff
+
+from lgc_classifier.tiffstream import TiffFeatures, MappedFeatures, channel_ranges
+
+
+_RNG = np.random.default_rng(0)
+_CUBE_9 = _RNG.random((37, 23, 9))
+_CUBE_4 = _RNG.random((37, 23, 4)).astype(np.float32)
+
+# name: (array written, imwrite arguments); tifffile writes a HxWxC array with more than 4 channels (or 2) as H pages
+# of WxC (axes QYX) by default
+LAYOUTS = {
+  'pages': (_CUBE_9, {}),
+  'pages_compressed': (_CUBE_9, {'compression': 'zlib'}),
+  'pages_2_channels': (_CUBE_9[:, :, :2], {}),
+  'contig': (_CUBE_4, {'photometric': 'rgb'}),
+  'contig_9_channels': (_CUBE_9, {'photometric': 'minisblack', 'planarconfig': 'contig'}),
+  'contig_compressed': (_CUBE_4, {'photometric': 'rgb', 'compression': 'zlib', 'rowsperstrip': 5}),
+  'tiled': (_CUBE_4, {'photometric': 'rgb', 'tile': (16, 16)}),
+  'tiled_9_channels': (_CUBE_9, {'tile': (16, 16), 'photometric': 'minisblack', 'planarconfig': 'contig'}),
+  'tiled_compressed': (_CUBE_9, {'tile': (16, 16), 'photometric': 'minisblack', 'planarconfig': 'contig',
+                                 'compression': 'zlib'}),
+  'separate': (np.moveaxis(_CUBE_9, 2, 0).copy(), {'photometric': 'minisblack', 'planarconfig': 'separate'}),
+  'separate_compressed': (np.moveaxis(_CUBE_9, 2, 0).copy(), {'photometric': 'minisblack', 'planarconfig': 'separate',
+                                                               'compression': 'zlib', 'rowsperstrip': 8}),
+  'single_channel': (_CUBE_9[:, :, 0], {}),
+}
+
+
+# Returns the path of the file of layout and the cube tiff.imread reads from it (channels last).
+def _write(tmp_path, layout):
+  array, imwrite_args = LAYOUTS[layout]
+  path = str(tmp_path / (layout + '.tif'))
+  tiff.imwrite(path, array, **imwrite_args)
+  cube = tiff.imread(path)
+  if cube.ndim == 2:
+    return path, cube[:, :, None]
+  return path, np.moveaxis(cube, 0, 2) if layout.startswith('separate') else cube
+
+
+@pytest.mark.parametrize('layout', sorted(LAYOUTS))
+def test_same_cube_as_imread(tmp_path, layout):
+  path, cube = _write(tmp_path, layout)
+  feats = TiffFeatures(path)
+  assert feats.shape == cube.shape
+  assert feats.dtype == cube.dtype
+  np.testing.assert_array_equal(feats.toarray(), cube)
+
+
+@pytest.mark.parametrize('layout', sorted(LAYOUTS))
+def test_row_blocks_and_channels(tmp_path, layout):
+  path, cube = _write(tmp_path, layout)
+  channels = [cube.shape[2] - 1, 0]
+  feats = TiffFeatures(path, channels=channels)
+  assert feats.shape == cube.shape[:2] + (2,)
+  next_row = 0
+  for first_row, block in feats.row_blocks(block_rows=7):
+    assert first_row == next_row
+    np.testing.assert_array_equal(block, cube[first_row:first_row + block.shape[0]][:, :, channels])
+    next_row += block.shape[0]
+  assert next_row == cube.shape[0]
+
+
+def test_channel_ranges_of_mapped_features(tmp_path):
+  path, cube = _write(tmp_path, 'pages_compressed')
+  feats = MappedFeatures(TiffFeatures(path), lambda feat_block: 2 * feat_block)
+  min_f, max_f = channel_ranges(feats, block_rows=5)
+  np.testing.assert_array_equal(min_f, np.min(2 * cube, axis=(0, 1)))
+  np.testing.assert_array_equal(max_f, np.max(2 * cube, axis=(0, 1)))
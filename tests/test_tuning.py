@@ -0,0 +1,93 @@
+# The hyperparameter searches must select the parameters of "Hyperparameter tuning method 2" of the original script:
+# the grid of candidates scored by the kappa coefficient on the odd half of the training data, the highest kappa
+# winning and the ties going to the later candidate, whether the candidates are scored in this process or in a pool.
+# PrecomputedRBFSVC must predict as SVC(C=C, gamma=gamma), whatever the size of its blocks of samples.
+
+import numpy as np
+import pytest
+from sklearn.datasets import make_classification
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.svm import SVC
+from sklearn.tree import DecisionTreeClassifier
+
+from lgc_classifier.tuning import (PrecomputedRBFSVC, _select, forest_growth_search, holdout_search,
+                                   kernel_svm_search)
+
+N_ESTIMATORS, MAX_DEPTH = [10, 20, 40, 80], [1, 2, 4, 8, None]
+C_VALUES, GAMMA_VALUES = [.1, 1, 10], [.01, .1, 1]
+
+
+# Noisy training data of 3 classes (labels from 1), on which the kappas of the candidates differ.
+@pytest.fixture(scope='module')
+def training_data():
+  tr_data, tr_labels = make_classification(400, 8, n_informative=5, n_classes=3, flip_y=.1, random_state=0)
+  return tr_data, tr_labels + 1
+
+
+# The nested loops of the script: the last of the candidates with the highest kappa.
+def _baseline_select(results, param_names):
+  highest_kappa = -1
+  for result in results:
+    if result['kappa'] >= highest_kappa:
+      highest_kappa = result['kappa']
+      best_params = {name: result[name] for name in param_names}
+  return best_params
+
+
+def test_select_ties_go_to_the_later_candidate():
+  results = [{'C': c, 'kappa': kappa} for c, kappa in enumerate([.5, .7, .2, .7, .6])]
+  assert _select(results, ['C']) == {'C': 3} == _baseline_select(results, ['C'])
+  assert _select([{'C': 1, 'kappa': -1}], ['C']) == {'C': 1}  # kappa can reach -1
+  assert _select([], ['C']) is None
+
+
+def test_pooled_search_equals_serial_search(training_data):
+  candidates = [{'max_depth': max_d, 'min_samples_leaf': leaf, 'random_state': 0} for max_d in MAX_DEPTH
+                for leaf in (1, 5)]
+  best_params, results = holdout_search(DecisionTreeClassifier, candidates, *training_data)
+  assert best_params == _baseline_select(results, ['max_depth', 'min_samples_leaf', 'random_state'])
+  pooled_best_params, pooled_results = holdout_search(DecisionTreeClassifier, candidates, *training_data,
+                                                      num_workers=2)
+  assert pooled_best_params == best_params
+  assert [result['kappa'] for result in pooled_results] == [result['kappa'] for result in results]
+
+
+# Grown forests are the forests of every size fitted from scratch with the same random_state, so the kappas of the
+# grid are those of holdout_search, and the pruning by successive halving keeps the best pair.
+@pytest.mark.parametrize('halving', [False, True])
+def test_forest_growth_search_selects_the_grid_parameters(training_data, halving):
+  candidates = [{'n_estimators': num_est, 'max_depth': max_d, 'random_state': 0} for num_est in N_ESTIMATORS
+                for max_d in MAX_DEPTH]
+  grid_best_params, grid_results = holdout_search(RandomForestClassifier, candidates, *training_data)
+  kappas = {(result['n_estimators'], result['max_depth']): result['kappa'] for result in grid_results}
+
+  best_params, results = forest_growth_search(*training_data, N_ESTIMATORS, MAX_DEPTH, halving=halving, random_state=0)
+  assert best_params == {name: grid_best_params[name] for name in ('n_estimators', 'max_depth')}
+  for result in results:
+    assert result['kappa'] == pytest.approx(kappas[result['n_estimators'], result['max_depth']], abs=1e-12)
+  assert len(results) == len(kappas) if not halving else len(results) < len(kappas)
+
+
+def test_kernel_svm_search_equals_svc_grid(training_data):
+  candidates = [{'C': para_c, 'gamma': para_gamma} for para_c in C_VALUES for para_gamma in GAMMA_VALUES]
+  grid_best_params, grid_results = holdout_search(SVC, candidates, *training_data)
+  for num_workers in (1, 2):
+    best_params, results = kernel_svm_search(*training_data, C_VALUES, GAMMA_VALUES, num_workers=num_workers)
+    assert best_params == grid_best_params
+    assert [result['kappa'] for result in results] == [result['kappa'] for result in grid_results]
+
+
+@pytest.mark.parametrize('memory_budget, max_block_rows', [(2 ** 28, 2 ** 18), (2 ** 28, 700), (10 ** 6, 2 ** 18),
+                                                           (1, 2 ** 18)])
+def test_precomputed_rbf_svc_predicts_as_svc(memory_budget, max_block_rows):
+  rng = np.random.default_rng(0)
+  tr_data = rng.random((1500, 3))
+  tr_labels = (tr_data[:, 0] * 3).astype(int) + 1
+  feats = rng.random((4000, 3))
+
+  model = PrecomputedRBFSVC(C=8, gamma=4, memory_budget=memory_budget, max_block_rows=max_block_rows)
+  model.fit(tr_data, tr_labels)
+  # the kernel rows of a block fit in the budget (a block has at least one sample)
+  assert 1 <= model.block_rows_ <= max_block_rows
+  assert model.block_rows_ == 1 or model.block_rows_ * 8 * tr_data.shape[0] <= memory_budget
+  np.testing.assert_array_equal(model.predict(feats), SVC(C=8, gamma=4).fit(tr_data, tr_labels).predict(feats))